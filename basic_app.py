@@ -1,18 +1,28 @@
 import os  
 import asyncio  
+import base64
+import hashlib
+import importlib
 import logging  
-import threading  
+import math
+import mmap
 from datetime import datetime, timezone  
-from io import StringIO  
 import sys
-import aiohttp  
-import uvicorn  
-from fastapi import FastAPI, Request  
+import json
+import random
+import shutil
+import time
+import sqlite3
+import struct
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque
+from functools import lru_cache
 from dotenv import load_dotenv  
-from prompt_toolkit import PromptSession  
-from prompt_toolkit.patch_stdout import patch_stdout  
-from prompt_toolkit.completion import Completer, Completion  
   
+# aiohttp, uvicorn, FastAPI and prompt_toolkit are imported where they are used, see lazy_attribute
 import typer  
 from rich.console import Console  
 from rich.theme import Theme  
@@ -23,33 +33,127 @@ app = typer.Typer()
 # Load environment variables from .env  
 load_dotenv()  
   
-# FastAPI application instance  
-fastapi_app = FastAPI()  
-  
 # Retrieve environment variable values  
 CLIENT_ID = os.getenv("CLIENT_ID", "default_client")  
 LLM_NOTIFICATION_ENDPOINT = os.getenv("LLM_NOTIFICATION_ENDPOINT", "http://localhost:8000/api/receive_message")  
+
+# Connection pool settings for the long-lived HTTP session
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "20"))
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30"))
+HTTP_DNS_CACHE_TTL = int(os.getenv("HTTP_DNS_CACHE_TTL", "300"))
+
+# Bounded waits and retries when talking to the bot
+TIMEOUT = float(os.getenv("TIMEOUT", "60"))  # Seconds to wait for the 'done' reaction of a turn (0 = no limit)
+SEND_TIMEOUT = float(os.getenv("SEND_TIMEOUT", "10"))  # Seconds allowed for one send attempt
+SEND_RETRIES = int(os.getenv("SEND_RETRIES", "3"))  # Extra attempts after a connection error or 5xx response
+RETRY_BACKOFF = float(os.getenv("RETRY_BACKOFF", "0.5"))  # Base delay of the exponential backoff, in seconds
+RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "8"))
+
+# JSON library for payloads and events: "auto" (orjson, then msgspec, then json), "orjson", "msgspec" or "json"
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto")
+
+# Transport used to exchange messages with the bot ("http" or "websocket")
+TRANSPORT = os.getenv("TRANSPORT", "http")
+LLM_WEBSOCKET_ENDPOINT = os.getenv("LLM_WEBSOCKET_ENDPOINT", "ws://localhost:8001/ws")
+
+# Address of the local server receiving the bot's callbacks
+CALLBACK_HOST = os.getenv("CALLBACK_HOST", "0.0.0.0")
+CALLBACK_PORT = int(os.getenv("CALLBACK_PORT", "8000"))
+CALLBACK_URL = os.getenv("CALLBACK_URL") or None  # Sent as callback_url with each message when set
+  
+# Memory bounds for long sessions
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", "10000"))  # Messages kept in memory per conversation (0 = all)
+HISTORY_SPILL_DIR = os.getenv("HISTORY_SPILL_DIR") or None  # Directory of the on-disk history (default: temp dir)
+LOG_BUFFER_LINES = int(os.getenv("LOG_BUFFER_LINES", "1000"))
+
+# Redraws per second of the live region showing streamed messages, and of the console output
+STREAM_FRAME_RATE = float(os.getenv("STREAM_FRAME_RATE", "20"))
+CONSOLE_QUEUE_SIZE = int(os.getenv("CONSOLE_QUEUE_SIZE", "1000"))  # Console lines waiting for the next frame
+
+# System prompt library: prompts/<name>.txt files, indexed once and cached
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", "prompts")
+PROMPT_MMAP_THRESHOLD = int(os.getenv("PROMPT_MMAP_THRESHOLD", str(1024 * 1024)))  # Bytes from which a prompt is memory-mapped
+PROMPT_WATCH_INTERVAL = float(os.getenv("PROMPT_WATCH_INTERVAL", "2"))  # Seconds between checks of the prompts directory
+
+# Attachments are read in blocks of this many bytes; a multiple of 3 so each block encodes to base64 on its own
+ATTACHMENT_CHUNK_SIZE = 3 * 65536
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp")  # Sent in "images", other files in "files_content"
+
+# Turn latency statistics: turns kept for the rolling percentiles, and the optional /metrics endpoint
+STATS_WINDOW = int(os.getenv("STATS_WINDOW", "1000"))
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False").lower() in ("1", "true", "yes")
+
+# Profiling (/profile and run --profile)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", "0.005"))  # Seconds between two stack samples
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", "100"))  # Event loop callbacks reported from this duration
+
+# Logging handler keeping only the most recent records
+class RingBufferHandler(logging.Handler):
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+
+    def emit(self, record):
+        try:
+            self.records.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def getvalue(self) -> str:
+        return "\n".join(self.records)
   
 # Logging configuration  
 logger = logging.getLogger("app_logger")  
 logger.setLevel(logging.INFO)  
-log_capture_string = StringIO()  
-stream_handler = logging.StreamHandler(log_capture_string)  
+log_capture_handler = RingBufferHandler(LOG_BUFFER_LINES)
 formatter = logging.Formatter('%(asctime)s [%(levelname)s] %(message)s', datefmt='%H:%M:%S')  
-stream_handler.setFormatter(formatter)  
-logger.addHandler(stream_handler)  
+log_capture_handler.setFormatter(formatter)
+logger.addHandler(log_capture_handler)
 logger.propagate = False  
   
-# Initialize conversation history and flags  
-conversation_history = []  # Stores messages and reactions  
+# Initialize flags  
 show_internal_messages = False  # Toggle to display internal messages  
 waiting_for_response = False  
   
+# Function to pick the JSON encoder and decoder; encoders return compact UTF-8 bytes
+def load_json_codec(backend: str = "auto"):
+    """Returns (name, dumps, loads) for the requested backend, falling back to the standard library."""
+    if backend not in ("auto", "orjson", "msgspec", "json"):
+        raise ValueError(f"Unknown JSON backend '{backend}'.")
+    if backend in ("auto", "orjson"):
+        try:
+            import orjson
+            return "orjson", orjson.dumps, orjson.loads
+        except ImportError:
+            if backend == "orjson":
+                raise
+    if backend in ("auto", "msgspec"):
+        try:
+            import msgspec
+            return "msgspec", msgspec.json.encode, msgspec.json.decode
+        except ImportError:
+            if backend == "msgspec":
+                raise
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    return "json", dumps, json.loads
+
+json_backend, json_dumps, json_loads = load_json_codec(JSON_BACKEND)
+
 # Generate a unique thread_id  
 def generate_thread_id():  
     current_timestamp = datetime.now(timezone.utc).timestamp()  
     thread_id = "{:.4f}".format(current_timestamp)  
     return thread_id  
+
+# Generate a unique timestamp for an outgoing message
+def generate_message_timestamp():
+    current_timestamp = datetime.now(timezone.utc).timestamp()
+    return "{:.4f}".format(current_timestamp)
   
 thread_id = generate_thread_id()  
   
@@ -76,208 +180,2349 @@ REACTION_EMOJI_MAP = {
     "error": "❌",  
     "wait": "⌚",  
 }  
+
+# Separator of reactions in the on-disk history
+REACTION_SEPARATOR = "\x1f"
   
-# Event to signal that the assistant has finished processing  
-done_reaction_received = asyncio.Event()  
-  
-# Global variables for the main event loop and last user message index  
+# Function to resolve a future, handing it to its own loop when called from another thread
+def resolve_future(future, result=None):
+    def set_result():
+        if not future.done():
+            future.set_result(result)
+
+    loop = future.get_loop()
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        running_loop = None
+    if running_loop is loop:
+        set_result()
+    else:
+        loop.call_soon_threadsafe(set_result)
+
+# A single message of the conversation history
+class Message:
+    __slots__ = ("role", "content", "reactions", "timestamp", "index")
+
+    def __init__(self, role: str, content: str, timestamp: str = None, reactions: tuple = (), index: int = -1):
+        self.role = role
+        self.content = content
+        self.reactions = reactions  # Tuple of emojis, shared empty tuple until the first reaction
+        self.timestamp = timestamp
+        self.index = index  # Position in the whole history
+
+    def add_reaction(self, emoji: str) -> bool:
+        """Adds an emoji once and returns True if it was new."""
+        if emoji in self.reactions:
+            return False
+        self.reactions = self.reactions + (emoji,)
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "reactions": list(self.reactions),
+            "timestamp": self.timestamp,
+        }
+
+    def __repr__(self):
+        return f"Message(role={self.role!r}, content={self.content!r}, reactions={self.reactions!r})"
+
+# Append-only on-disk storage for messages evicted from memory
+class SpillStore:
+    """SQLite table holding the oldest messages of a history, read back lazily."""
+
+    def __init__(self, directory: str = None):
+        handle, self.path = tempfile.mkstemp(prefix="genaibot_history_", suffix=".sqlite3", dir=directory)
+        os.close(handle)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = OFF;
+            CREATE TABLE messages (
+                idx INTEGER PRIMARY KEY,
+                role TEXT NOT NULL,
+                content TEXT,
+                reactions TEXT NOT NULL,
+                timestamp TEXT
+            );
+            CREATE INDEX messages_role ON messages (role, idx);
+            CREATE INDEX messages_timestamp ON messages (timestamp);
+        """)
+
+    @staticmethod
+    def _to_message(row) -> Message:
+        idx, role, content, reactions, timestamp = row
+        return Message(role, content, timestamp, tuple(reactions.split(REACTION_SEPARATOR)) if reactions else (), idx)
+
+    def _query(self, sql: str, params: tuple = ()):
+        rows = self._connection.execute(sql, params).fetchall()
+        return [self._to_message(row) for row in rows]
+
+    def append(self, messages):
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?)",
+                ((m.index, m.role, m.content, REACTION_SEPARATOR.join(m.reactions), m.timestamp) for m in messages),
+            )
+
+    def update_reactions(self, message: Message):
+        with self._connection:
+            self._connection.execute(
+                "UPDATE messages SET reactions = ? WHERE idx = ?",
+                (REACTION_SEPARATOR.join(message.reactions), message.index),
+            )
+
+    def get(self, index: int):
+        rows = self._query("SELECT * FROM messages WHERE idx = ?", (index,))
+        return rows[0] if rows else None
+
+    def find_user_message(self, timestamp: str):
+        rows = self._query("SELECT * FROM messages WHERE timestamp = ? AND role = 'user' LIMIT 1", (timestamp,))
+        return rows[0] if rows else None
+
+    def range(self, start: int, end: int):
+        return self._query("SELECT * FROM messages WHERE idx >= ? AND idx < ? ORDER BY idx", (start, end))
+
+    def by_role(self, role: str, after: int, before: int):
+        return self._query("SELECT * FROM messages WHERE role = ? AND idx > ? AND idx < ? ORDER BY idx",
+                           (role, after, before))
+
+    def nth_index(self, role: str, number: int) -> int:
+        row = self._connection.execute(
+            "SELECT idx FROM messages WHERE role = ? ORDER BY idx LIMIT 1 OFFSET ?", (role, number)
+        ).fetchone()
+        return row[0]
+
+    def close(self):
+        self._connection.close()
+        for suffix in ("", "-wal", "-shm"):
+            try:
+                os.remove(self.path + suffix)
+            except FileNotFoundError:
+                pass
+
+# Layout of the session files written by /save and read by /load and --resume
+SESSION_MAGIC = b"GBSESS\x00\x01"
+SESSION_HEADER = struct.Struct("<8sQ")  # magic, position of the latest index record (0 = none)
+RECORD_HEAD = struct.Struct("<IB")  # payload length, record type
+MESSAGE_HEAD = struct.Struct("<BHH")  # role, timestamp and reactions lengths, then the content
+RECORD_THREAD, RECORD_MESSAGE, RECORD_REACTION, RECORD_INDEX = 1, 2, 3, 4
+INDEX_HEAD = struct.Struct("<QQQQ")  # messages, user messages, messages with reactions, position indexed up to
+NO_TIMESTAMP = 0xFFFF
+
+# Append-only binary journal of one conversation, also serving its older messages
+class SessionFile:
+    """Length-prefixed records of a conversation: its thread_id, messages and reactions.
+
+    Messages and reactions are appended as they happen. An index record
+    (message positions, user messages and reactions) is appended on close and
+    its position written to the header, so opening a large session maps the
+    file and reads a few arrays instead of decoding every message; records
+    written after the latest index, e.g. before a crash, are scanned. The
+    reactions in the index are decoded only when a message is read. Once
+    attached to a MessageStore, the file also stands in for its SpillStore.
+    """
+
+    def __init__(self, path: str, file, thread_id: str):
+        self.path = path
+        self.file = file
+        self.thread_id = thread_id
+        self.offsets = array("q")  # message index -> position of its record
+        self.users = array("q")  # indexes of the user messages
+        self.reactions = {}  # message index -> reactions added since the file was opened
+        self.reacted = array("q")  # indexes of the messages with reactions in the latest index, ascending
+        self.reaction_ends = array("q")  # end of the reactions of each of them in the text at reaction_text
+        self.reaction_text = 0
+        self.timestamps = None  # user message timestamp -> index, built on the first lookup
+        self.map = None
+        self.dirty = False  # Records written since the latest index
+
+    @classmethod
+    def create(cls, path: str, thread_id: str, messages=()):
+        """Writes a new session file holding the given messages and returns it open for appending."""
+        session = cls(path, open(path, "w+b"), thread_id)
+        session.file.write(SESSION_HEADER.pack(SESSION_MAGIC, 0))
+        session._write_record(RECORD_THREAD, thread_id.encode("utf-8"))
+        for message in messages:
+            session.write_message(message)
+        session.checkpoint()
+        return session
+
+    @classmethod
+    def open(cls, path: str):
+        """Reads the index of a session file and the records after it; raises ValueError if it is not one."""
+        file = open(path, "r+b")
+        try:
+            magic, index_position = SESSION_HEADER.unpack(file.read(SESSION_HEADER.size))
+        except struct.error:
+            magic = None
+        if magic != SESSION_MAGIC:
+            file.close()
+            raise ValueError(f"{path} is not a session file.")
+        session = cls(path, file, None)
+        session._remap()
+        position = session._read_index(index_position) if index_position else SESSION_HEADER.size
+        end = session._scan(position)
+        if end < len(session.map):
+            # Drop a record torn by a crash so new records follow the last complete one
+            session.map.close()
+            file.truncate(end)
+            session._remap()
+        file.seek(end)
+        if session.thread_id is None:
+            file.close()
+            raise ValueError(f"{path} has no thread ID.")
+        return session
+
+    def _remap(self):
+        if self.map is not None:
+            self.map.close()
+        self.file.flush()
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _read_index(self, position: int) -> int:
+        length, kind = RECORD_HEAD.unpack_from(self.map, position)
+        start = position + RECORD_HEAD.size
+        count, users, reacted, indexed_up_to = INDEX_HEAD.unpack_from(self.map, start)
+        start += INDEX_HEAD.size
+        self.offsets.frombytes(self.map[start:start + 8 * count])
+        start += 8 * count
+        self.users.frombytes(self.map[start:start + 8 * users])
+        start += 8 * users
+        self.reacted.frombytes(self.map[start:start + 8 * reacted])
+        start += 8 * reacted
+        self.reaction_ends.frombytes(self.map[start:start + 8 * reacted])
+        self.reaction_text = start + 8 * reacted
+        self.thread_id = self._read_thread()
+        return indexed_up_to
+
+    def _read_thread(self):
+        length, kind = RECORD_HEAD.unpack_from(self.map, SESSION_HEADER.size)
+        start = SESSION_HEADER.size + RECORD_HEAD.size
+        return str(self.map[start:start + length], "utf-8") if kind == RECORD_THREAD else None
+
+    def _scan(self, position: int) -> int:
+        """Reads the records from position on; returns where the last complete one ends."""
+        data, end = self.map, len(self.map)
+        while position + RECORD_HEAD.size <= end:
+            length, kind = RECORD_HEAD.unpack_from(data, position)
+            start = position + RECORD_HEAD.size
+            if start + length > end:
+                break
+            if kind == RECORD_MESSAGE:
+                role_length = data[start]
+                if data[start + MESSAGE_HEAD.size:start + MESSAGE_HEAD.size + role_length] == b"user":
+                    self.users.append(len(self.offsets))
+                self.offsets.append(position)
+            elif kind == RECORD_REACTION:
+                index = struct.unpack_from("<Q", data, start)[0]
+                emoji = str(data[start + 8:start + length], "utf-8")
+                reactions = self._reactions(index)
+                if reactions is None:
+                    reactions = self._decode(index).reactions
+                if emoji not in reactions:
+                    self.reactions[index] = reactions + (emoji,)
+            elif kind == RECORD_THREAD:
+                self.thread_id = str(data[start:start + length], "utf-8")
+            position = start + length
+        return position
+
+    def _write_record(self, kind: int, payload: bytes) -> int:
+        position = self.file.tell()
+        self.file.write(RECORD_HEAD.pack(len(payload), kind))
+        self.file.write(payload)
+        self.dirty = True
+        return position
+
+    def write_message(self, message: Message):
+        role = message.role.encode("utf-8")
+        timestamp = message.timestamp.encode("utf-8") if message.timestamp is not None else b""
+        reactions = REACTION_SEPARATOR.join(message.reactions).encode("utf-8")
+        head = MESSAGE_HEAD.pack(len(role), len(timestamp) if message.timestamp is not None else NO_TIMESTAMP,
+                                 len(reactions))
+        payload = b"".join((head, role, timestamp, reactions, (message.content or "").encode("utf-8")))
+        self.offsets.append(self._write_record(RECORD_MESSAGE, payload))
+        if message.role == "user":
+            self.users.append(message.index)
+            if self.timestamps is not None and message.timestamp is not None:
+                self.timestamps[message.timestamp] = message.index
+
+    def write_reaction(self, message: Message, emoji: str):
+        self._write_record(RECORD_REACTION, struct.pack("<Q", message.index) + emoji.encode("utf-8"))
+        self.reactions[message.index] = message.reactions
+
+    def flush(self):
+        self.file.flush()
+
+    def checkpoint(self):
+        """Appends an index of every message and points the header to it."""
+        position = self.file.tell()
+        groups = {index: self._indexed_reactions(index, decode=False) for index in self.reacted}
+        groups.update((index, REACTION_SEPARATOR.join(reactions).encode("utf-8"))
+                      for index, reactions in self.reactions.items())
+        reacted, ends, end = array("q", sorted(groups)), array("q"), 0
+        for index in reacted:
+            end += len(groups[index])
+            ends.append(end)
+        payload = b"".join((INDEX_HEAD.pack(len(self.offsets), len(self.users), len(reacted), position),
+                            self.offsets.tobytes(), self.users.tobytes(), reacted.tobytes(), ends.tobytes(),
+                            b"".join(groups[index] for index in reacted)))
+        self._write_record(RECORD_INDEX, payload)
+        self.file.flush()
+        os.pwrite(self.file.fileno(), SESSION_HEADER.pack(SESSION_MAGIC, position), 0)
+        self.dirty = False
+
+    def _indexed_reactions(self, index: int, decode: bool = True):
+        """Reactions of a message in the latest index, as a tuple or as encoded bytes; None if it has none."""
+        position = bisect_left(self.reacted, index)
+        if position == len(self.reacted) or self.reacted[position] != index:
+            return None
+        start = self.reaction_text + (self.reaction_ends[position - 1] if position else 0)
+        encoded = self.map[start:self.reaction_text + self.reaction_ends[position]]
+        return tuple(str(encoded, "utf-8").split(REACTION_SEPARATOR)) if decode else encoded
+
+    def _reactions(self, index: int):
+        """Reactions added after the message was written, or None to keep those of its record."""
+        reactions = self.reactions.get(index)
+        if reactions is None and self.reacted:
+            reactions = self._indexed_reactions(index)
+        return reactions
+
+    def _decode(self, index: int) -> Message:
+        position = self.offsets[index]
+        if self.map is None or position >= len(self.map):
+            self._remap()  # Written after the file was mapped
+        data = self.map
+        length = RECORD_HEAD.unpack_from(data, position)[0]
+        start = position + RECORD_HEAD.size
+        role_length, timestamp_length, reactions_length = MESSAGE_HEAD.unpack_from(data, start)
+        cursor = start + MESSAGE_HEAD.size
+        role = str(data[cursor:cursor + role_length], "utf-8")
+        cursor += role_length
+        timestamp = None
+        if timestamp_length != NO_TIMESTAMP:
+            timestamp = str(data[cursor:cursor + timestamp_length], "utf-8")
+            cursor += timestamp_length
+        reactions = str(data[cursor:cursor + reactions_length], "utf-8")
+        cursor += reactions_length
+        content = str(data[cursor:start + length], "utf-8")
+        return Message(role, content, timestamp, tuple(reactions.split(REACTION_SEPARATOR)) if reactions else (), index)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    # The methods below let the file stand in for the SpillStore of a MessageStore
+    def append(self, messages):
+        pass  # Already journaled when they were added
+
+    def update_reactions(self, message: Message):
+        pass  # Journaled by write_reaction
+
+    def get(self, index: int):
+        message = self._decode(index)
+        reactions = self._reactions(index)
+        if reactions is not None:
+            message.reactions = reactions
+        return message
+
+    def find_user_message(self, timestamp: str):
+        if self.timestamps is None:
+            self.timestamps = {}
+            for index in self.users:
+                message = self._decode(index)
+                if message.timestamp is not None:
+                    self.timestamps[message.timestamp] = index
+        index = self.timestamps.get(timestamp)
+        return self.get(index) if index is not None else None
+
+    def range(self, start: int, end: int):
+        return [self.get(index) for index in range(start, end)]
+
+    def by_role(self, role: str, after: int, before: int):
+        if role == "user":
+            users = self.users[bisect_right(self.users, after):bisect_left(self.users, before)]
+            return [self.get(index) for index in users]
+        return [message for message in self.range(after + 1, before) if message.role == role]
+
+    def nth_index(self, role: str, number: int) -> int:
+        if role == "user":
+            return self.users[number]
+        return [message.index for message in self.by_role(role, -1, len(self))][number]
+
+    def close(self):
+        """Writes a final index if anything was appended and closes the file."""
+        if self.file.closed:
+            return
+        if self.dirty:
+            self.checkpoint()
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+# Append-only conversation history with role indexes
+class MessageStore:
+    """Stores messages in arrival order and indexes them by role and by user turn.
+
+    The last user message and the internal messages of the current turn are
+    found without scanning the history. With a window, only the most recent
+    messages stay in memory; older ones are spilled to a SpillStore and read
+    back on demand. With a SessionFile attached, every message and reaction
+    is journaled to it and the file replaces the SpillStore.
+    """
+
+    __slots__ = (
+        "_messages", "_offset", "_by_role", "_turn_starts", "_spilled_turns", "_user_by_timestamp",
+        "_last_user", "_window", "_spill_batch", "_spill_dir", "_spill", "_session",
+    )
+
+    def __init__(self, window: int = None, spill_dir: str = None):
+        self._messages = []  # In-memory messages, starting at index _offset
+        self._offset = 0  # Number of messages spilled to disk
+        self._by_role = {}  # role -> array of in-memory message indexes
+        self._turn_starts = array("q")  # index of the user message opening each in-memory turn
+        self._spilled_turns = 0
+        self._user_by_timestamp = {}  # in-memory user message timestamp -> message index
+        self._last_user = None
+        self._window = window or None
+        self._spill_batch = max(1, self._window // 4) if self._window else 0
+        self._spill_dir = spill_dir
+        self._spill = None
+        self._session = None
+
+    def append(self, role: str, content: str, timestamp: str = None) -> Message:
+        message = Message(role, content, timestamp, index=self._offset + len(self._messages))
+        if self._session is not None:
+            self._session.write_message(message)
+        self._add(message)
+        return message
+
+    def _add(self, message: Message):
+        index, role, timestamp = message.index, message.role, message.timestamp
+        self._messages.append(message)
+        indexes = self._by_role.get(role)
+        if indexes is None:
+            indexes = self._by_role[role] = array("q")
+        indexes.append(index)
+        if role == "user":
+            self._turn_starts.append(index)
+            self._last_user = message
+            if timestamp is not None:
+                self._user_by_timestamp[timestamp] = index
+        if self._window and len(self._messages) >= self._window + self._spill_batch:
+            self._spill_oldest(self._spill_batch)
+
+    def _spill_oldest(self, count: int):
+        """Moves the oldest in-memory messages to disk and trims the indexes."""
+        if self._spill is None:
+            self._spill = SpillStore(self._spill_dir)
+        evicted = self._messages[:count]
+        self._spill.append(evicted)
+        del self._messages[:count]
+        self._offset += count
+        for indexes in self._by_role.values():
+            del indexes[:bisect_left(indexes, self._offset)]
+        spilled_turns = bisect_left(self._turn_starts, self._offset)
+        del self._turn_starts[:spilled_turns]
+        self._spilled_turns += spilled_turns
+        for message in evicted:
+            if message.role == "user" and message.timestamp is not None:
+                self._user_by_timestamp.pop(message.timestamp, None)
+
+    def add_reaction(self, message: Message, emoji: str) -> bool:
+        """Adds a reaction to a message, writing it through if the message was spilled."""
+        added = message.add_reaction(emoji)
+        if added and self._session is not None:
+            self._session.write_reaction(message, emoji)
+        elif added and message.index < self._offset and self._spill is not None:
+            self._spill.update_reactions(message)
+        return added
+
+    def save(self, session: SessionFile):
+        """Journals to a session file already holding every message; it replaces the SpillStore."""
+        self.close()
+        self._spill = self._session = session
+
+    def restore(self, session: SessionFile):
+        """Replaces the history with a session file's, loading only its last turn into memory."""
+        self.clear()
+        count = len(session)
+        start = session.users[-1] if session.users else count
+        if self._window:
+            start = max(start, count - self._window)
+        self._spill = self._session = session
+        self._offset = start
+        self._spilled_turns = bisect_left(session.users, start)
+        for message in session.range(start, count):
+            self._add(message)
+        if session.users and self._last_user is None:
+            self._last_user = session.get(session.users[-1])
+
+    def flush(self):
+        if self._session is not None:
+            self._session.flush()
+
+    def clear(self):
+        self.close()
+        self._messages.clear()
+        self._offset = 0
+        self._by_role.clear()
+        self._turn_starts = array("q")
+        self._spilled_turns = 0
+        self._user_by_timestamp.clear()
+        self._last_user = None
+
+    def close(self):
+        """Deletes the on-disk part of the history, or closes its session file."""
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+            self._session = None
+
+    @property
+    def spilled(self) -> int:
+        return self._offset
+
+    @property
+    def session(self):
+        return self._session
+
+    def __len__(self):
+        return self._offset + len(self._messages)
+
+    def __getitem__(self, index: int):
+        if index < 0:
+            index += len(self)
+        if index >= len(self) or index < 0:
+            raise IndexError("message index out of range")
+        if index >= self._offset:
+            return self._messages[index - self._offset]
+        return self._spill.get(index)
+
+    def __iter__(self):
+        # Read in batches so spilled messages are streamed from disk
+        start, end = 0, len(self)
+        while start < end:
+            batch = self.range(start, min(start + 1000, end))
+            yield from batch
+            start += len(batch)
+
+    def range(self, start: int, end: int):
+        """Returns the messages with start <= index < end."""
+        spilled = self._spill.range(start, min(end, self._offset)) if start < self._offset else []
+        return spilled + self._messages[max(start - self._offset, 0):max(end - self._offset, 0)]
+
+    @property
+    def last_user_index(self) -> int:
+        return self._last_user.index if self._last_user is not None else -1
+
+    def last_user_message(self):
+        return self._last_user
+
+    def find_user_message(self, timestamp: str):
+        index = self._user_by_timestamp.get(timestamp)
+        if index is not None:
+            return self._messages[index - self._offset]
+        if self._spill is not None:
+            return self._spill.find_user_message(timestamp)
+        return None
+
+    def messages_by_role(self, role: str, after: int = -1, before: int = None):
+        """Returns the messages with the given role whose index is greater than after (and less than before)."""
+        if before is None:
+            before = len(self)
+        if self._spill is not None and after + 1 < min(self._offset, before):
+            messages = self._spill.by_role(role, after, min(self._offset, before))
+        else:
+            messages = []
+        indexes = self._by_role.get(role)
+        if indexes:
+            start, end = bisect_right(indexes, after), bisect_left(indexes, before)
+            messages.extend(self._messages[index - self._offset] for index in indexes[start:end])
+        return messages
+
+    def next_user_index(self, after: int) -> int:
+        """Returns the index of the first user message after the given index, or len(self) if there is none."""
+        later = self.messages_by_role("user", after)
+        return later[0].index if later else len(self)
+
+    def internal_since_last_user(self):
+        return self.messages_by_role("assistant_internal", after=self.last_user_index)
+
+    def turn_count(self) -> int:
+        return self._spilled_turns + len(self._turn_starts)
+
+    def _turn_start(self, number: int) -> int:
+        if number >= self._spilled_turns:
+            return self._turn_starts[number - self._spilled_turns]
+        return self._spill.nth_index("user", number)
+
+    def turn(self, number: int):
+        """Returns the messages of a user turn, from its user message to the next one."""
+        start = self._turn_start(number)
+        end = self._turn_start(number + 1) if number + 1 < self.turn_count() else len(self)
+        return self.range(start, end)
+
+# Timing of one user message, from sending to the 'done' reaction
+class Turn:
+    """Awaitable that completes when the 'done' reaction of a user message arrives.
+
+    marks holds the monotonic time of the first occurrence of each event
+    (reaction names, 'first_message', 'first_token'), in arrival order.
+    """
+
+    __slots__ = ("timestamp", "future", "sent_at", "first_token_at", "done_at", "marks")
+
+    def __init__(self, timestamp: str, future):
+        self.timestamp = timestamp
+        self.future = future
+        self.sent_at = time.monotonic()
+        self.first_token_at = None
+        self.done_at = None
+        self.marks = {}
+
+    def __await__(self):
+        return self.future.__await__()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def mark(self, event: str, at: float = None):
+        if event not in self.marks:
+            self.marks[event] = time.monotonic() if at is None else at
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+            self.mark("first_token", self.first_token_at)
+
+    def mark_done(self):
+        self.done_at = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = self.done_at
+        self.mark("done", self.done_at)
+
+    def phases(self):
+        """Returns (phase, seconds) from sending to each event, then between successive reactions."""
+        phases = [(f"sent->{event}", at - self.sent_at) for event, at in self.marks.items()]
+        reactions = [(event, at) for event, at in self.marks.items() if event in REACTION_EMOJI_MAP]
+        phases.extend(
+            (f"{previous}->{event}", at - previous_at)
+            for (previous, previous_at), (event, at) in zip(reactions, reactions[1:])
+        )
+        return phases
+
+    @property
+    def time_to_first_token(self):
+        return self.first_token_at - self.sent_at if self.first_token_at is not None else None
+
+    @property
+    def time_to_done(self):
+        return self.done_at - self.sent_at if self.done_at is not None else None
+
+# Rolling latency statistics of turn phases
+class TurnStats:
+    """Keeps the last window samples of each phase for percentiles, plus all-time counts and sums."""
+
+    QUANTILES = (50, 95, 99)
+
+    def __init__(self, window: int):
+        self.window = window
+        self.samples = {}  # phase -> deque of the most recent durations, in seconds
+        self.counts = {}
+        self.sums = {}
+        self.failures = {}  # reason -> turns that never got their 'done' reaction
+
+    def record_turn(self, turn: Turn):
+        for phase, seconds in turn.phases():
+            samples = self.samples.get(phase)
+            if samples is None:
+                samples = self.samples[phase] = deque(maxlen=self.window)
+                self.counts[phase] = 0
+                self.sums[phase] = 0.0
+            samples.append(seconds)
+            self.counts[phase] += 1
+            self.sums[phase] += seconds
+
+    def record_failure(self, reason: str):
+        self.failures[reason] = self.failures.get(reason, 0) + 1
+
+    def percentile(self, phase: str, quantile: float) -> float:
+        """Nearest-rank percentile of the phase over the rolling window."""
+        ordered = sorted(self.samples[phase])
+        rank = max(0, min(len(ordered) - 1, math.ceil(quantile * len(ordered) / 100) - 1))
+        return ordered[rank]
+
+    def summary(self) -> dict:
+        return {
+            phase: {
+                "count": self.counts[phase],
+                "sum": self.sums[phase],
+                **{f"p{q}": self.percentile(phase, q) for q in self.QUANTILES},
+            }
+            for phase in self.samples
+        }
+
+    def to_prometheus(self) -> str:
+        """Renders the phases as a Prometheus summary in the text exposition format."""
+        name = "genaibot_client_turn_phase_seconds"
+        lines = [
+            f"# HELP {name} Time from sending a user message to each event, and between successive reactions.",
+            f"# TYPE {name} summary",
+        ]
+        for phase in self.samples:
+            label = escape_label_value(phase)
+            for q in self.QUANTILES:
+                lines.append(f'{name}{{phase="{label}",quantile="{q / 100}"}} {self.percentile(phase, q):.6f}')
+            lines.append(f'{name}_sum{{phase="{label}"}} {self.sums[phase]:.6f}')
+            lines.append(f'{name}_count{{phase="{label}"}} {self.counts[phase]}')
+        lines.append("# HELP genaibot_client_turn_failures_total Turns that failed, by reason.")
+        lines.append("# TYPE genaibot_client_turn_failures_total counter")
+        for reason, count in self.failures.items():
+            lines.append(f'genaibot_client_turn_failures_total{{reason="{escape_label_value(reason)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        self.samples.clear()
+        self.counts.clear()
+        self.sums.clear()
+        self.failures.clear()
+
+# Function to escape a Prometheus label value (backslash, double quote and newline)
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Latencies of every finished turn, for /stats and the metrics endpoint
+turn_stats = TurnStats(STATS_WINDOW)
+
+# Per-conversation state, addressed by thread_id
+class Conversation:
+    """History of one conversation and the user messages still waiting for 'done'."""
+
+    ABANDONED_LIMIT = 1000  # Abandoned turns remembered for their late events; the oldest are forgotten first
+
+    def __init__(self, thread_id: str, render: bool = True):
+        self.thread_id = thread_id
+        self.render = render  # Print incoming events to the console
+        self.history = MessageStore(HISTORY_WINDOW, HISTORY_SPILL_DIR)  # Stores messages and reactions
+        self.pending = {}  # user message timestamp -> Turn resolved by 'done'
+        self.abandoned = {}  # timestamps of turns given up on, whose late events must not resolve another turn
+        self.streams = {}  # streamed message id -> text chunks received so far
+        self.attachments = []  # paths of the files sent with the next user message
+        self.observer = None  # Optional callable(kind, value) told about every message and reaction
+
+    def add_message(self, role: str, content: str, timestamp: str = None) -> Message:
+        message = self.history.append(role, content, timestamp)
+        self.notify(role, content)
+        return message
+
+    def notify(self, kind: str, value: str):
+        if self.observer is not None:
+            self.observer(kind, value)
+
+    @property
+    def last_user_message_index(self) -> int:
+        return self.history.last_user_index
+
+    def last_user_message(self):
+        return self.history.last_user_message()
+
+    def find_user_message(self, timestamp: str = None):
+        """Returns the user message a reaction refers to, defaulting to the last one."""
+        if timestamp is not None:
+            message = self.history.find_user_message(timestamp)
+            if message is not None:
+                return message
+        return self.history.last_user_message()
+
+    def add_reaction(self, message: Message, emoji: str) -> bool:
+        return self.history.add_reaction(message, emoji)
+
+    def expect_done(self, timestamp: str) -> Turn:
+        """Returns a Turn resolved when the 'done' reaction for this message arrives."""
+        turn = Turn(timestamp, asyncio.get_running_loop().create_future())
+        self.pending[timestamp] = turn
+        return turn
+
+    def pending_turn(self, timestamp: str = None):
+        """Returns the turn of the given message, or the oldest pending one if it is unknown."""
+        turn = self.pending.get(timestamp)
+        if turn is None and self.pending and timestamp not in self.abandoned:
+            turn = next(iter(self.pending.values()))
+        return turn
+
+    def mark_first_token(self, timestamp: str = None):
+        turn = self.pending_turn(timestamp)
+        if turn is not None:
+            turn.mark_first_token()
+
+    def mark_event(self, timestamp: str, event: str):
+        turn = self.pending_turn(timestamp)
+        if turn is not None:
+            turn.mark(event)
+
+    def resolve_done(self, timestamp: str = None):
+        """Resolves the turn of the given message, or the oldest pending one if it is unknown."""
+        if timestamp in self.abandoned:
+            del self.abandoned[timestamp]  # The late 'done' is the last event of an abandoned turn
+            return False
+        turn = self.pending_turn(timestamp)
+        if turn is None:
+            return False
+        del self.pending[turn.timestamp]
+        turn.mark_done()
+        turn_stats.record_turn(turn)
+        resolve_future(turn.future, True)
+        return True
+
+    def abandon(self, turn: Turn, reason: str):
+        """Stops waiting for a turn and counts it as failed."""
+        if self.pending.pop(turn.timestamp, None) is not None:
+            self.abandoned[turn.timestamp] = None
+            if len(self.abandoned) > self.ABANDONED_LIMIT:
+                del self.abandoned[next(iter(self.abandoned))]
+            turn_stats.record_failure(reason)
+            self.untrack_streams()
+            if not turn.future.done():
+                turn.future.cancel()
+
+    async def wait_done(self, turn: Turn, timeout: float = None) -> bool:
+        """Waits for the 'done' reaction of a turn; abandons it as timed out after timeout seconds."""
+        try:
+            await asyncio.wait_for(asyncio.shield(turn.future), timeout or None)
+            return True
+        except asyncio.TimeoutError:
+            self.abandon(turn, "timeout")
+            return False
+
+    def append_chunk(self, message_id: str, text: str):
+        """Adds a streamed chunk and returns the chunks of that message so far."""
+        chunks = self.streams.get(message_id)
+        if chunks is None:
+            chunks = self.streams[message_id] = []
+        chunks.append(text)
+        return chunks
+
+    def finish_stream(self, message_id: str, text: str = None):
+        """Closes a streamed message and returns its full text (the final text wins if given)."""
+        chunks = self.streams.pop(message_id, None)
+        if not text and chunks:
+            text = "".join(chunks)
+        return text
+
+    def untrack_streams(self):
+        """Removes the partial messages of this conversation from the live region."""
+        for message_id in self.streams:
+            stream_renderer.untrack((self.thread_id, message_id))
+
+    def close(self):
+        self.history.close()
+
+    def reset(self, new_thread_id: str):
+        for turn in self.pending.values():
+            turn.future.cancel()
+        self.pending.clear()
+        self.abandoned.clear()
+        self.untrack_streams()
+        self.streams.clear()
+        self.attachments.clear()
+        self.history.clear()
+        self.thread_id = new_thread_id
+
+# Conversations by thread_id, used to route callbacks
+conversations = {}
+
+# Function to make a conversation reachable by its callbacks
+def register_conversation(conversation: Conversation):
+    conversations[conversation.thread_id] = conversation
+    return conversation
+
+# The conversation driven by the interactive prompt
+active_conversation = register_conversation(Conversation(thread_id))
+conversation_history = active_conversation.history  # Stores messages and reactions
+
+# Global variable for the main event loop
 main_loop = None  
-last_user_message_index = -1  
+
+# Shared HTTP session, created by main() and reused for every message
+http_session = None
   
+# Mapping of roles to styles  
+ROLE_STYLES = {  
+    "Assistant": "assistant",  
+    "ASSISTANT (internal)": "assistant_internal",  
+    "Reaction": "reaction",  
+    "Command": "command",  
+    "Error": "error",  
+    "System": "system"  
+}  
+
+# Roles whose lines may be dropped when the console cannot keep up
+LOW_PRIORITY_ROLES = ("Reaction", "ASSISTANT (internal)")
+
+# Styles of the queued lines that are never evicted for a newer one: answers and errors
+KEPT_STYLES = ("assistant", "error")
+
+# Last formatted wall-clock second, so strftime runs at most once per second
+clock_cache = [None, ""]
+
+# Function to return the current time as HH:MM:SS
+def current_clock() -> str:
+    now = time.time()
+    second = int(now)
+    if clock_cache[0] != second:
+        clock_cache[0] = second
+        clock_cache[1] = time.strftime("%H:%M:%S", time.localtime(now))
+    return clock_cache[1]
+
+# Console output batched per frame on the event loop
+class ConsoleRenderer:
+    """Bounded queue of console lines, written in one batch per frame by a task on the event loop.
+
+    Callers only enqueue. A line is a string or any rich renderable, such as
+    a Table; a line identical to the previous one is collapsed into a repeat
+    count. When the queue is full, reactions and internal messages are
+    dropped first, then the oldest other lines; queued answers, errors and
+    tables are never evicted, the new line is dropped instead. The number of
+    dropped lines is reported. Until start() is called, lines are printed
+    immediately.
+    """
+
+    def __init__(self, frame_rate: float, capacity: int):
+        self.frame_interval = 1 / frame_rate
+        self.capacity = capacity
+        self.pending = deque()  # [text, style, low priority, repeat count]
+        self.dropped = 0
+        self.task = None
+
+    def submit(self, text, style: str = None, low_priority: bool = False):
+        """Queues a string or rich renderable; only identical strings are collapsed."""
+        if self.task is None:
+            console.print(text, style=style)
+            return
+        if self.pending and isinstance(text, str) and text:
+            last = self.pending[-1]
+            if last[0] == text and last[1] == style:
+                last[3] += 1
+                return
+        if len(self.pending) >= self.capacity and not self._make_room(low_priority):
+            self.dropped += 1
+            return
+        self.pending.append([text, style, low_priority, 1])
+
+    def _make_room(self, low_priority: bool) -> bool:
+        """Evicts a queued line for a new one; returns False if the new line should be dropped instead."""
+        if low_priority:
+            return False
+        for index, line in enumerate(self.pending):
+            if line[2]:
+                break
+        else:
+            for index, line in enumerate(self.pending):
+                if isinstance(line[0], str) and line[1] not in KEPT_STYLES:
+                    break
+            else:
+                return False
+        del self.pending[index]
+        self.dropped += 1
+        return True
+
+    def flush(self):
+        """Writes every queued line now."""
+        if not self.pending and not self.dropped:
+            return
+        with console:  # Buffer the whole batch into a single write
+            while self.pending:
+                text, style, _, repeat = self.pending.popleft()
+                console.print(text if repeat == 1 else f"{text} (x{repeat})", style=style)
+            if self.dropped:
+                console.print(f"[{current_clock()}] [System] {self.dropped} lines dropped to keep up.", style="system")
+                self.dropped = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.frame_interval)
+            self.flush()
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        self.flush()
+
+console_renderer = ConsoleRenderer(STREAM_FRAME_RATE, CONSOLE_QUEUE_SIZE)
+
+# Output modes of the `run` command: the rich console, or headless output for pipes and CI
+OUTPUT_MODES = ("rich", "plain", "jsonl")
+
+# Roles of the lines the jsonl mode takes from the conversation observer instead
+OBSERVED_ROLES = ("Assistant", "ASSISTANT (internal)", "Reaction")
+
+# Headless output
+class EventLog:
+    """Buffered writer replacing the rich console in the plain and jsonl output modes.
+
+    plain writes the same "[time] [role] message" lines without markup. jsonl
+    writes one compact record per message, reaction and system line, with the
+    thread_id and a monotonic timestamp "t". Output is written when the buffer
+    is full, after every turn and on close.
+    """
+
+    def __init__(self, mode: str, stream=None, buffer_size: int = 65536):
+        self.mode = mode
+        self.stream = stream if stream is not None else sys.stdout.buffer
+        self.buffer = bytearray()
+        self.buffer_size = buffer_size
+
+    def record(self, kind: str, thread_id: str, **fields):
+        self._append(json_dumps({"t": round(time.monotonic(), 6), "thread_id": thread_id, "type": kind, **fields}))
+
+    def line(self, role: str, message: str):
+        if self.mode == "plain":
+            self._append(f"[{current_clock()}] [{role}] {message}".encode())
+        elif role not in OBSERVED_ROLES:
+            self.record(role.lower(), active_conversation.thread_id, text=message)
+
+    def text(self, text: str):
+        if self.mode == "plain":
+            self._append(text.encode())
+        elif text.strip():
+            self.record("text", active_conversation.thread_id, text=text.strip())
+
+    def observe(self, conversation: Conversation):
+        """Returns a conversation observer recording its messages and reactions (jsonl only)."""
+        def observer(kind: str, value: str):
+            if kind == "reaction":
+                self.record("reaction", conversation.thread_id, reaction=value)
+            elif kind != "assistant_internal" or show_internal_messages:
+                self.record("message", conversation.thread_id, role=kind, text=value)
+        return observer if self.mode == "jsonl" else None
+
+    def _append(self, data: bytes):
+        self.buffer += data
+        self.buffer += b"\n"
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write(self.buffer)
+            self.stream.flush()
+            self.buffer.clear()
+
+    def close(self):
+        self.flush()
+
+# Headless output of the running `run` command, None on the rich console
+event_log = None
+
+# Function to queue a line for the console
+def print_line(text: str = "", style: str = None):
+    if event_log is not None:
+        event_log.text(text)
+        return
+    console_renderer.submit(text, style)
+
 def print_with_timestamp(role: str, message: str):  
     """Prints a message with a timestamp."""  
-    current_time = datetime.now().strftime("%H:%M:%S")  
-  
-    # Mapping of roles to styles  
-    style_map = {  
-        "Assistant": "assistant",  
-        "ASSISTANT (internal)": "assistant_internal",  
-        "Reaction": "reaction",  
-        "Command": "command",  
-        "Error": "error",  
-        "System": "system"  
-    }  
-  
-    style = style_map.get(role, None)  
+    if event_log is not None:
+        event_log.line(role, message)
+        return
+    console_renderer.submit(
+        f"[{current_clock()}] [{role}] {message}", ROLE_STYLES.get(role), role in LOW_PRIORITY_ROLES
+    )
   
-    console.print(f"[{current_time}] [{role}] {message}", style=style)  
-  
-# Function to send user input to the tested LLM (LLM1)  
-async def call_tested_llm(user_input: str):  
-    global thread_id  
-    headers = {"Content-Type": "application/json"}  
-  
-    # Generate a unique timestamp for the message  
-    current_timestamp = datetime.now(timezone.utc).timestamp()  
-    timestamp_with_millis = "{:.4f}".format(current_timestamp)  
-  
-    payload = {  
+# Live rendering of messages that are still being streamed
+class StreamRenderer:
+    """Shows partial messages in a rich Live region redrawn at a fixed frame rate.
+
+    Chunks only mark the region as dirty, so a burst of chunks costs at most
+    one redraw per frame.
+    """
+
+    def __init__(self, frame_rate: float):
+        self.frame_interval = 1 / frame_rate
+        self.streams = {}  # (thread_id, message id) -> (role label, chunks)
+        self.dirty = False
+        self.task = None
+
+    def track(self, key, role: str, chunks):
+        self.streams[key] = (role, chunks)
+        self.dirty = True
+        if self.task is None and main_loop is not None:
+            self.task = main_loop.create_task(self._run())
+
+    def touch(self):
+        self.dirty = True
+
+    def untrack(self, key):
+        if self.streams.pop(key, None) is not None:
+            self.dirty = True
+
+    def render(self):
+        from rich.console import Group
+        from rich.text import Text
+
+        current_time = current_clock()
+        return Group(*(
+            Text(f"[{current_time}] [{role}] {''.join(chunks)}▌", style=ROLE_STYLES.get(role))
+            for role, chunks in list(self.streams.values())
+        ))
+
+    async def _run(self):
+        from rich.live import Live
+
+        try:
+            with Live(console=console, auto_refresh=False, transient=True) as live:
+                while self.streams:
+                    if self.dirty:
+                        self.dirty = False
+                        live.update(self.render(), refresh=True)
+                    await asyncio.sleep(self.frame_interval)
+        finally:
+            self.task = None
+
+stream_renderer = StreamRenderer(STREAM_FRAME_RATE)
+
+# Function to create the pooled HTTP session used to reach the tested LLM
+def create_http_session():
+    """Creates a keep-alive HTTP session with a bounded connection pool."""
+    import aiohttp
+
+    connector = aiohttp.TCPConnector(
+        limit=HTTP_POOL_LIMIT,
+        limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        use_dns_cache=True,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+# Function to close the shared HTTP session
+async def close_http_session():
+    global http_session
+    if http_session is not None:
+        await http_session.close()
+        http_session = None
+
+# Function to serialize once the fields of the payload that are the same for every message of a thread
+@lru_cache(maxsize=4096)
+def payload_prefix(target_thread_id: str, client_id: str, callback_url: str = None) -> bytes:
+    """Returns the constant fields as an unclosed JSON object ending with a comma."""
+    constant = {  
         "channel_id": 1,  
         "event_type": "MESSAGE",  
         "response_id": 1,  
-        "text": user_input,  
-        "thread_id": thread_id,  # Use the correct thread_id variable here  
-        "timestamp": timestamp_with_millis,  
-        "user_email": f"{CLIENT_ID}@example.com",  
+        "thread_id": target_thread_id,
+        "user_email": f"{client_id}@example.com",  
         "user_id": 1,  
-        "user_name": CLIENT_ID,  
+        "user_name": client_id,  
         "reaction_name": None,  
-        "files_content": [],  
-        "images": [],  
         "is_mention": True,  
-        "origin_plugin_name": CLIENT_ID,  
+        "origin_plugin_name": client_id,  
         "message_type": "TEXT",  
         "is_internal": False,  
-        "raw_data": {"text": user_input},  
-        "username": CLIENT_ID,  
+        "username": client_id,  
         "event_label": "message",  
         "api_app_id": "genaibot",  
-        "app_id": "genaibot"  
+        "app_id": "genaibot",
     }  
+    if callback_url:
+        # Lets a bot that supports it post the events to this client rather than its configured URL
+        constant["callback_url"] = callback_url
+    return json_dumps(constant)[:-1] + b","
+
+# End of a payload without attachments
+NO_ATTACHMENTS = b',"files_content":[],"images":[]}'
+
+# Function to build the JSON body of a user message from the cached prefix and its variable fields
+def build_payload(user_input: str, target_thread_id: str, timestamp: str, idempotency_key: str,
+                  tail: bytes = NO_ATTACHMENTS) -> bytes:
+    text = json_dumps(user_input)
+    return b"".join((
+        payload_prefix(target_thread_id, CLIENT_ID, CALLBACK_URL),
+        b'"text":', text,
+        b',"timestamp":', json_dumps(timestamp),
+        b',"raw_data":{"text":', text,
+        b'},"idempotency_key":', json_dumps(idempotency_key),
+        tail,
+    ))
+
+# Base64 encodings of attached files, kept on disk by content hash
+class AttachmentCache:
+    """Encodes each attached file once, then streams the encoding from disk on every turn sending it.
+
+    A file is looked up by path, size and modification time, then by the
+    SHA-256 of its content, so an unchanged file is never read again and a
+    copy under another name reuses the same encoding. Files are read in
+    ATTACHMENT_CHUNK_SIZE blocks: neither a file nor its encoding is ever
+    held in memory whole. The encodings are deleted by close().
+    """
+
+    def __init__(self, chunk_size: int = ATTACHMENT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.directory = None
+        self.by_stat = {}  # (path, size, mtime) -> content hash
+        self.encoded = {}  # content hash -> path of the base64 file
+        self.encodes = 0  # Files actually encoded, for tests and benchmarks
+
+    def encode(self, path: str) -> str:
+        """Returns the path of the base64 encoding of a file, encoding it first if needed. Blocking."""
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self.by_stat.get(key)
+        if digest is not None:
+            return self.encoded[digest]
+
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="genaibot-attachments-")
+        content_hash = hashlib.sha256()
+        descriptor, partial_path = tempfile.mkstemp(dir=self.directory, suffix=".partial")
+        with open(path, "rb") as source, os.fdopen(descriptor, "wb") as target:
+            while block := source.read(self.chunk_size):
+                content_hash.update(block)
+                target.write(base64.b64encode(block))
+        digest = content_hash.hexdigest()
+        if digest in self.encoded:
+            os.remove(partial_path)
+        else:
+            self.encoded[digest] = os.path.join(self.directory, f"{digest}.b64")
+            os.replace(partial_path, self.encoded[digest])
+            self.encodes += 1
+        self.by_stat[key] = digest
+        return self.encoded[digest]
+
+    def close(self):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory = None
+        self.by_stat.clear()
+        self.encoded.clear()
+
+attachment_cache = AttachmentCache()
+
+# Files attached to every message of the session (--attach)
+session_attachments = []
+
+# Function to stream a message body with its attachments
+def streamed_payload(head: bytes, encoded: list, chunk_size: int = ATTACHMENT_CHUNK_SIZE):
+    """Returns a function creating an async iterator over the body, so each retry streams it again.
+
+    head is the payload up to its attachments, encoded a list of
+    ("files_content" or "images", path of the base64 encoding).
+    """
+    read_size = chunk_size // 3 * 4
+
+    async def body():
+        yield head
+        for field in ("files_content", "images"):
+            yield b',"files_content":[' if field == "files_content" else b'],"images":['
+            paths = [path for kind, path in encoded if kind == field]
+            for index, path in enumerate(paths):
+                yield b',"' if index else b'"'
+                with open(path, "rb") as file:
+                    while block := await asyncio.to_thread(file.read, read_size):
+                        yield block
+                yield b'"'
+        yield b"]}"
+
+    return body
+
+# Function to tell which payload field an attachment goes in
+def attachment_field(path: str) -> str:
+    return "images" if path.lower().endswith(IMAGE_EXTENSIONS) else "files_content"
+
+# Function to queue a file for the next message of the active thread
+def attach_file(path: str):
+    if not os.path.isfile(path):
+        print_with_timestamp("Error", f"No such file: {path}")
+        return
+    active_conversation.attachments.append(path)
+    size = os.path.getsize(path)
+    print_with_timestamp(
+        "System", f"Attached {os.path.basename(path)} ({size:,} bytes) as {attachment_field(path)} to your next message."
+    )
+
+# Function to send user input to the tested LLM (LLM1)  
+async def call_tested_llm(user_input: str, session=None, target_thread_id: str = None, timestamp: str = None,
+                          attachments: list = None, endpoint: str = None):  
+    """Sends a user message, with the given files attached, to the tested LLM and returns True if it was accepted.
+
+    With an endpoint, the message is posted there over HTTP instead of going through the transport.
+    """
+    # Generate a unique timestamp for the message  
+    timestamp_with_millis = timestamp or generate_message_timestamp()
+    target_thread_id = target_thread_id or thread_id  # Use the correct thread_id variable here
+    # Same key on every retry of this message, so the bot can drop duplicates
+    idempotency_key = f"{CLIENT_ID}:{target_thread_id}:{timestamp_with_millis}"
+    if attachments:
+        try:
+            encoded = [
+                (attachment_field(path), await asyncio.to_thread(attachment_cache.encode, path)) for path in attachments
+            ]
+        except OSError as e:
+            logger.error(f"Could not read attachment: {str(e)}")
+            return False
+        head = build_payload(user_input, target_thread_id, timestamp_with_millis, idempotency_key, tail=b"")
+        body = streamed_payload(head, encoded)
+    else:
+        body = build_payload(user_input, target_thread_id, timestamp_with_millis, idempotency_key)
   
-    async with aiohttp.ClientSession() as session:  
-        try:  
-            async with session.post(LLM_NOTIFICATION_ENDPOINT, headers=headers, json=payload) as response:  
-                if response.status in [200, 202]:  
-                    logger.info("Message accepted by LLM [ASSISTANT] successfully.")  
-                else:  
-                    logger.error(f"Failed to send message to LLM [ASSISTANT]: {response.status}")  
-        except Exception as e:  
-            logger.error(f"Error during LLM [ASSISTANT] interaction: {str(e)}.")  
-  
-# FastAPI endpoint to receive messages from LLM1  
-@fastapi_app.post("/api/receive_message")  
-async def receive_message(request: Request):  
-    global conversation_history, waiting_for_response, show_internal_messages, main_loop  
-    try:  
-        message = await request.json()  
-        event_type = message.get("event_type", "")  
-        text = message.get("text", "")  
-        reaction_name = message.get("reaction_name", "")  
-        is_internal = message.get("is_internal", False)  
-  
-        if event_type == "MESSAGE":  
-            # Different display for internal messages  
-            if is_internal:  
-                conversation_history.append({  
-                    "role": "assistant_internal",  
-                    "content": text,  
-                    "reactions": [],  
-                })  
-                if show_internal_messages:  
-                    print_with_timestamp("ASSISTANT (internal)", text)  
-            else:  
-                conversation_history.append({  
-                    "role": "assistant",  
-                    "content": text,  
-                    "reactions": [],  
-                })  
+    if session is not None or endpoint is not None:
+        return await post_to_tested_llm(session or http_session, request_headers(idempotency_key), body, endpoint)
+    return await transport.send(body, idempotency_key)
+
+# Function to build the HTTP headers of a message
+def request_headers(idempotency_key: str) -> dict:
+    return {"Content-Type": "application/json", "Idempotency-Key": idempotency_key}
+
+# Function to compute the delay before a retry: exponential backoff with full jitter
+def retry_delay(attempt: int) -> float:
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** (attempt - 1)))
+
+# Function to post a payload to the tested LLM, retrying connection errors, timeouts and 5xx responses
+async def post_to_tested_llm(session, headers: dict, body, endpoint: str = None):
+    """body is bytes, or a function returning an async iterator of bytes (see streamed_payload).
+
+    Posts to LLM_NOTIFICATION_ENDPOINT unless another endpoint is given.
+    """
+    import aiohttp
+
+    endpoint = endpoint or LLM_NOTIFICATION_ENDPOINT
+    if callable(body):
+        # An upload may take longer than SEND_TIMEOUT in total; bound the connection and the wait for the response
+        timeout = aiohttp.ClientTimeout(sock_connect=SEND_TIMEOUT, sock_read=SEND_TIMEOUT)
+    else:
+        timeout = aiohttp.ClientTimeout(total=SEND_TIMEOUT)
+    for attempt in range(SEND_RETRIES + 1):
+        if attempt:
+            delay = retry_delay(attempt)
+            logger.warning(f"Retrying message to LLM [ASSISTANT] in {delay:.2f}s ({attempt}/{SEND_RETRIES}).")
+            await asyncio.sleep(delay)
+        try:
+            data = body() if callable(body) else body
+            async with session.post(endpoint, headers=headers, data=data, timeout=timeout) as response:
+                if response.status in [200, 202]:
+                    logger.info("Message accepted by LLM [ASSISTANT] successfully.")
+                    return True
+                if response.status == 409:
+                    # The bot already has a message with this idempotency key: an earlier attempt got through
+                    logger.info("Message already received by LLM [ASSISTANT].")
+                    return True
+                logger.error(f"Failed to send message to LLM [ASSISTANT]: {response.status}")
+                if response.status < 500:
+                    return False
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"Error during LLM [ASSISTANT] interaction: {str(e) or type(e).__name__}.")
+        except Exception as e:
+            logger.error(f"Error during LLM [ASSISTANT] interaction: {str(e)}.")
+            return False
+    return False
+
+# Function to apply an event from the bot, whatever transport delivered it
+def dispatch_event(message: dict):
+    global waiting_for_response
+    event_type = message.get("event_type", "")  
+    text = message.get("text", "")  
+    reaction_name = message.get("reaction_name", "")  
+    is_internal = message.get("is_internal", False)  
+
+    # Route the event to the conversation owning its thread_id
+    event_thread_id = message.get("thread_id")
+    conversation = conversations.get(event_thread_id) if event_thread_id else active_conversation
+    if conversation is None:
+        logger.warning(f"Ignoring {event_type} for unknown thread {event_thread_id}.")
+        return
+
+    if event_type == "MESSAGE_DELTA":
+        # Partial message: buffer the chunk and let the live region show it
+        message_id = message.get("message_id") or message.get("response_id")
+        conversation.mark_event(message.get("timestamp"), "first_message")
+        if not is_internal:
+            conversation.mark_first_token(message.get("timestamp"))
+        chunks = conversation.append_chunk(message_id, text)
+        # Late chunks of an abandoned turn are kept for its final message but not shown live
+        if conversation.render and event_log is None and (show_internal_messages or not is_internal) \
+                and message.get("timestamp") not in conversation.abandoned:
+            if len(chunks) == 1:
+                role = "ASSISTANT (internal)" if is_internal else "Assistant"
+                stream_renderer.track((conversation.thread_id, message_id), role, chunks)
+            else:
+                stream_renderer.touch()
+        return
+
+    if event_type in ("MESSAGE", "MESSAGE_END"):
+        # A complete message, possibly closing a streamed one
+        message_id = message.get("message_id") or message.get("response_id")
+        if message_id in conversation.streams:
+            text = conversation.finish_stream(message_id, text)
+            stream_renderer.untrack((conversation.thread_id, message_id))
+        elif event_type == "MESSAGE_END":
+            return
+        conversation.mark_event(message.get("timestamp"), "first_message")
+        if not is_internal:
+            conversation.mark_first_token(message.get("timestamp"))
+
+        # Different display for internal messages  
+        if is_internal:  
+            conversation.add_message("assistant_internal", text)
+            if show_internal_messages and conversation.render:  
+                print_with_timestamp("ASSISTANT (internal)", text)  
+        else:  
+            conversation.add_message("assistant", text)
+            if conversation.render:
                 print_with_timestamp("Assistant", text)  
-        elif event_type == "REACTION_ADD":  
-            emoji = REACTION_EMOJI_MAP.get(reaction_name.lower(), f":{reaction_name}:")  
-            # Find the last user message  
-            last_user_message = next((msg for msg in reversed(conversation_history) if msg["role"] == "user"), None)  
-            if last_user_message:  
-                if emoji not in last_user_message["reactions"]:  
-                    last_user_message["reactions"].append(emoji)  
+    elif event_type == "REACTION_ADD":  
+        emoji = REACTION_EMOJI_MAP.get(reaction_name.lower(), f":{reaction_name}:")  
+        if reaction_name.lower() != 'done':
+            # Reactions outside the known set share one phase, keeping the metric labels bounded
+            phase_event = reaction_name.lower() if reaction_name.lower() in REACTION_EMOJI_MAP else "other"
+            conversation.mark_event(message.get("timestamp"), phase_event)
+        conversation.notify("reaction", reaction_name.lower())
+        # Find the user message the reaction refers to  
+        user_message = conversation.find_user_message(message.get("timestamp"))
+        if user_message:  
+            if conversation.add_reaction(user_message, emoji):
+                if conversation.render:
                     print_with_timestamp("Reaction", f"'{emoji}' added to your last message.")  
-                if reaction_name.lower() == 'done':  
-                    waiting_for_response = False  
-                    if main_loop is not None:  
-                        main_loop.call_soon_threadsafe(done_reaction_received.set)  
-        return {"status": "OK"}  
+        if reaction_name.lower() == 'done':  
+            if conversation is active_conversation:
+                waiting_for_response = False  
+            conversation.resolve_done(message.get("timestamp"))
+
+# Function to build the FastAPI application receiving the bot's callbacks
+def create_fastapi_app():
+    from fastapi import FastAPI, Request
+
+    fastapi_app = FastAPI()
+
+    # FastAPI endpoint to receive messages from LLM1  
+    @fastapi_app.post("/api/receive_message")  
+    async def receive_message(request: Request):  
+        try:  
+            message = json_loads(await request.body())
+            dispatch_event(message)
+            return {"status": "OK"}  
   
-    except Exception as e:  
-        logger.error(f"Error receiving message from LLM1: {str(e)}")  
-        return {"status": "ERROR", "message": str(e)}  
+        except Exception as e:  
+            logger.error(f"Error receiving message from LLM1: {str(e)}")  
+            return {"status": "ERROR", "message": str(e)}  
+
+    if METRICS_ENABLED:
+        from fastapi.responses import PlainTextResponse
+
+        # Turn latencies, as Prometheus text by default or JSON with ?format=json
+        @fastapi_app.get("/metrics")
+        async def metrics(format: str = "prometheus"):
+            if format == "json":
+                return {"phases": turn_stats.summary(), "failures": turn_stats.failures}
+            return PlainTextResponse(turn_stats.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+    return fastapi_app
   
-# Function to start the uvicorn server in a separate thread  
-def start_uvicorn():  
-    config = uvicorn.Config(fastapi_app, host="0.0.0.0", port=8000, log_level="warning")  
-    server = uvicorn.Server(config)  
-    server.run()  
+# Transport posting each message and receiving events on /api/receive_message
+class HttpCallbackTransport:
+    """Sends every message as a POST to LLM_NOTIFICATION_ENDPOINT; the bot posts events back."""
+
+    name = "http"
+    needs_callback_server = True
+
+    async def start(self):
+        pass
+
+    async def send(self, body, idempotency_key: str) -> bool:
+        headers = request_headers(idempotency_key)
+        if http_session is None:
+            # No shared session available: fall back to a one-shot session
+            import aiohttp
+
+            async with aiohttp.ClientSession() as one_shot_session:
+                return await post_to_tested_llm(one_shot_session, headers, body)
+        return await post_to_tested_llm(http_session, headers, body)
+
+    async def close(self):
+        pass
+
+# Transport exchanging messages and events as JSON frames on one WebSocket
+class WebSocketTransport:
+    """Keeps a single WebSocket open to the bot, so no per-event HTTP request is needed."""
+
+    name = "websocket"
+    needs_callback_server = False
+
+    def __init__(self, url: str):
+        self.url = url
+        self.websocket = None
+        self.reader_task = None
+
+    async def start(self):
+        self.websocket = await http_session.ws_connect(self.url, heartbeat=30)
+        self.reader_task = asyncio.create_task(self._read_events())
+        logger.info(f"WebSocket transport connected to {self.url}.")
+
+    async def _read_events(self):
+        import aiohttp
+
+        async for frame in self.websocket:
+            if frame.type == aiohttp.WSMsgType.TEXT:
+                try:
+                    dispatch_event(json_loads(frame.data))
+                except Exception as e:
+                    logger.error(f"Error receiving message from LLM1: {str(e)}")
+            elif frame.type == aiohttp.WSMsgType.ERROR:
+                logger.error(f"WebSocket transport error: {self.websocket.exception()}")
+                break
+
+    async def send(self, body, idempotency_key: str) -> bool:
+        try:
+            if callable(body):
+                # A WebSocket frame cannot be streamed: attachments are assembled in memory
+                body = b"".join([chunk async for chunk in body()])
+            await self.websocket.send_str(body.decode("utf-8"))
+            return True
+        except Exception as e:
+            logger.error(f"Error during LLM [ASSISTANT] interaction: {str(e)}.")
+            return False
+
+    async def close(self):
+        if self.websocket is not None:
+            await self.websocket.close()
+        if self.reader_task is not None:
+            await self.reader_task
+
+# Transports the `run` command can use
+TRANSPORTS = ("http", "websocket")
+
+# Function to build the transport selected by name
+def create_transport(name: str):
+    if name == "http":
+        return HttpCallbackTransport()
+    if name == "websocket":
+        return WebSocketTransport(LLM_WEBSOCKET_ENDPOINT)
+    raise ValueError(f"Unknown transport '{name}', expected 'http' or 'websocket'.")
+
+# Transport used by call_tested_llm
+transport = HttpCallbackTransport()
+
+# Callback server running as a task on the current event loop
+class CallbackServer:
+    """uvicorn server sharing the prompt's event loop, so callbacks need no cross-thread hop."""
+
+    def __init__(self, host: str, port: int):
+        import uvicorn
+
+        self.host = host
+        self.port = port
+        config = uvicorn.Config(lazy_attribute("fastapi_app"), host=host, port=port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.task = None
+
+    async def _serve(self):
+        try:
+            await self.server.serve()
+        except SystemExit:
+            # uvicorn exits the process when it cannot bind; report it as an error instead
+            raise RuntimeError(f"Callback server could not listen on {self.host}:{self.port}.")
+
+    async def start(self):
+        """Starts serving and returns once the server is listening."""
+        self.task = asyncio.create_task(self._serve())
+        while not self.server.started:
+            if self.task.done():
+                self.task.result()
+                raise RuntimeError(f"Callback server stopped while starting on {self.host}:{self.port}.")
+            await asyncio.sleep(0.01)
+        if self.port == 0:
+            # Port 0 asks the system for a free port; keep the one it picked
+            self.port = self.server.servers[0].sockets[0].getsockname()[1]
+        logger.info(f"Callback server listening on {self.host}:{self.port}.")
+
+    async def stop(self, timeout: float = 5.0):
+        """Stops accepting callbacks, letting in-flight requests finish for up to timeout seconds."""
+        if self.task is None:
+            return
+        self.server.should_exit = True
+        try:
+            await asyncio.wait_for(asyncio.shield(self.task), timeout)
+        except asyncio.TimeoutError:
+            self.server.force_exit = True
+            await self.task
+        self.task = None
+
+# Function to start the callback server on the running event loop
+async def start_callback_server(host: str = None, port: int = None) -> CallbackServer:
+    server = CallbackServer(CALLBACK_HOST if host is None else host, CALLBACK_PORT if port is None else port)
+    await server.start()
+    return server
   
+# Profiler of the interactive session
+class Profiler:
+    """cProfile of the event loop thread, stack samples of every thread and slow callbacks.
+
+    The callback server shares the event loop, so the deterministic profile
+    covers the prompt, the transports and FastAPI alike; the sampler adds the
+    worker threads (stdin, completions). Every event loop callback is timed
+    and those holding the loop for SLOW_CALLBACK_MS or more are kept, as
+    asyncio debug mode would report them but without its per-callback
+    traceback capture. Nothing is installed while the profiler is stopped.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR, sample_interval: float = PROFILE_SAMPLE_INTERVAL,
+                 slow_callback_ms: float = SLOW_CALLBACK_MS):
+        self.directory = directory
+        self.sample_interval = sample_interval
+        self.slow_callback_ms = slow_callback_ms
+        self.profile = None
+        self.samples = {}  # collapsed stack -> number of samples
+        self.sampler = None
+        self.stopping = threading.Event()
+        self.slow_callbacks = []
+        self.handle_run = None
+        self.started_at = None
+
+    @property
+    def running(self) -> bool:
+        return self.profile is not None
+
+    def start(self):
+        """Starts profiling; call it from the event loop thread."""
+        import cProfile
+
+        self.slow_callbacks = []
+        self.handle_run = asyncio.Handle._run
+        handle_run, threshold, slow_callbacks = self.handle_run, self.slow_callback_ms / 1000, self.slow_callbacks
+
+        def timed_run(handle):
+            started = time.perf_counter()
+            handle_run(handle)
+            duration = time.perf_counter() - started
+            if duration >= threshold:
+                # Name the task a step belongs to rather than its step wrapper, as asyncio does
+                task = getattr(handle._callback, "__self__", None)
+                label = repr(task) if isinstance(task, asyncio.Task) else repr(handle)
+                at = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+                slow_callbacks.append(f"{at} Executing {label} took {duration:.3f} seconds")
+
+        asyncio.Handle._run = timed_run
+        self.samples = {}
+        self.stopping.clear()
+        self.sampler = threading.Thread(target=self._sample, name="profile-sampler", daemon=True)
+        self.sampler.start()
+        self.started_at = time.monotonic()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self.stopping.wait(self.sample_interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                key = ";".join(reversed(stack))
+                self.samples[key] = self.samples.get(key, 0) + 1
+
+    def stop(self) -> dict:
+        """Stops profiling and writes <stamp>.pstats, <stamp>.collapsed and <stamp>-slow.txt; returns a summary."""
+        import pstats
+
+        self.profile.disable()
+        self.stopping.set()
+        self.sampler.join()
+        asyncio.Handle._run = self.handle_run
+
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')[:-3]}")
+        self.profile.dump_stats(f"{base}.pstats")
+        with open(f"{base}.collapsed", "w", encoding="utf-8") as file:
+            for stack, count in self.samples.items():
+                file.write(f"{stack} {count}\n")
+        with open(f"{base}-slow.txt", "w", encoding="utf-8") as file:
+            file.writelines(f"{message}\n" for message in self.slow_callbacks)
+
+        stats = pstats.Stats(self.profile)
+        top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:5]  # by own time
+        summary = {
+            "duration": time.monotonic() - self.started_at,
+            "files": [f"{base}.pstats", f"{base}.collapsed", f"{base}-slow.txt"],
+            "samples": sum(self.samples.values()),
+            "slow_callbacks": len(self.slow_callbacks),
+            "top": [(f"{function} ({os.path.basename(filename)}:{line})", own_time)
+                    for (filename, line, function), (_, _, own_time, _, _) in top],
+        }
+        self.profile = None
+        self.sampler = None
+        self.handle_run = None
+        return summary
+
+profiler = Profiler()
+
+# Function to start or stop the profiler from the /profile command
+def toggle_profiler(action: str):
+    if action == "start":
+        if profiler.running:
+            print_with_timestamp("Error", "The profiler is already running.")
+            return
+        profiler.start()
+        print_with_timestamp("System", f"Profiling started; slow callbacks are those over {profiler.slow_callback_ms:g} ms.")
+    elif action == "stop":
+        if not profiler.running:
+            print_with_timestamp("Error", "The profiler is not running.")
+            return
+        show_profile_summary(profiler.stop())
+    else:
+        status = "running" if profiler.running else "stopped"
+        print_with_timestamp("System", f"The profiler is {status}. Usage: /profile start|stop")
+
+# Function to report where a finished profile was written and where the time went
+def show_profile_summary(summary: dict):
+    print_with_timestamp(
+        "System",
+        f"Profiled {summary['duration']:.1f}s: {summary['samples']} stack samples, "
+        f"{summary['slow_callbacks']} slow callbacks. Written to {', '.join(summary['files'])}.",
+    )
+    for function, own_time in summary["top"]:
+        print_line(f"  {own_time:8.3f}s  {function}")
+
+# Function to list the slash commands
+def print_available_commands():
+    print_line("Available Commands:")  
+    print_line("  /toggle_internal - Toggle internal messages on/off.")  
+    print_line("  /reset           - Clear the conversation history.")  
+    print_line("  /show_last_mind  - Display internal messages since your last message.")  
+    print_line("  /export <path>   - Write the whole conversation history to a JSONL file.")
+    print_line("  /attach <path>   - Send a file (or an image) with your next message.")
+    print_line("  /prompt <name>   - Load a system prompt from the library; without a name, list them.")
+    print_line("  /stats           - Show p50/p95/p99 latencies of each turn phase.")
+    print_line("  /profile start|stop - Profile the session; stopping writes pstats, collapsed stacks and slow callbacks.")
+    print_line("  /new             - Start another thread; the current one keeps running.")
+    print_line("  /switch <id>     - Make another thread active (number from /threads, ID or ID prefix).")
+    print_line("  /threads         - List the open threads and their turns in flight.")
+    print_line("  /save <path>     - Save the active thread to a session file and keep appending to it.")
+    print_line("  /load <path>     - Open a saved session as a thread, with its thread ID, and make it active.")
+    print_line("  /exit or /quit   - Exit the application.\n")  
+
 # Function to reset the conversation history and refresh the console  
 def reset_conversation():  
-    global conversation_history, thread_id, last_user_message_index  
-    conversation_history.clear()  
-    console.clear()  
+    global thread_id
+    if event_log is None:
+        console_renderer.flush()
+        console.clear()  
     print_with_timestamp("System", "Conversation history has been reset.")  
-    console.print("Available Commands:")  
-    console.print("  /toggle_internal - Toggle internal messages on/off.")  
-    console.print("  /reset           - Clear the conversation history.")  
-    console.print("  /show_last_mind  - Display internal messages since your last message.")  
-    console.print("  /exit or /quit   - Exit the application.\n")  
+    if event_log is None:
+        print_available_commands()
   
-    # Generate a new unique thread_id  
+    # Clear the history and move the conversation to a new unique thread_id  
+    conversations.pop(active_conversation.thread_id, None)
+    session = active_conversation.history.session
     thread_id = generate_thread_id()  
+    active_conversation.reset(thread_id)
+    register_conversation(active_conversation)
     print_with_timestamp("System", f"New thread ID generated: {thread_id}")  
+    if session is not None:
+        # The session file keeps the old thread; the new one is only journaled once saved
+        print_with_timestamp("System", f"{session.path} keeps thread {session.thread_id} and is no longer "
+                                       "appended to; /save to journal the new thread.")
   
-    # Reset the last user message index  
-    last_user_message_index = -1  
-  
+# Function to start a new thread next to the existing ones and make it active
+def new_conversation():
+    new_thread_id = generate_thread_id()
+    while new_thread_id in conversations:
+        new_thread_id = generate_thread_id()
+    conversation = register_conversation(Conversation(new_thread_id, render=False))
+    if event_log is not None:
+        conversation.observer = event_log.observe(conversation)
+    switch_conversation(conversation)
+    print_with_timestamp("System", f"New thread ID generated: {new_thread_id}")
+    return conversation
+
+# Function to make another thread the one the prompt talks to
+def switch_conversation(conversation: Conversation):
+    """Shows the events of the new active thread only; the others keep running in the background."""
+    global active_conversation, conversation_history, thread_id
+    active_conversation.render = False
+    conversation.render = True
+    active_conversation = conversation
+    conversation_history = conversation.history
+    thread_id = conversation.thread_id
+
+# Function to find a thread by its number in /threads, its ID or a unique prefix of its ID
+def find_conversation(reference: str):
+    threads = list(conversations.values())
+    if reference.isdigit() and 1 <= int(reference) <= len(threads) and reference not in conversations:
+        return threads[int(reference) - 1]
+    if reference in conversations:
+        return conversations[reference]
+    matches = [conversation for conversation in threads if conversation.thread_id.startswith(reference)]
+    return matches[0] if len(matches) == 1 else None
+
+# Function to switch threads and show the replies received there since its last user message
+def switch_to(reference: str):
+    conversation = find_conversation(reference)
+    if conversation is None:
+        print_with_timestamp("Error", f"No thread matches '{reference}'; see /threads.")
+        return
+    switch_conversation(conversation)
+    print_with_timestamp("System", f"Switched to thread {conversation.thread_id}.")
+    history = conversation.history
+    last_user = history.last_user_message()
+    if last_user is not None:
+        print_with_timestamp("System", f"Your last message: {last_user.content}")
+    for message in history.messages_by_role("assistant", history.last_user_index):
+        print_with_timestamp("Assistant", message.content)
+    if conversation.pending:
+        print_with_timestamp("System", f"{len(conversation.pending)} turn(s) still waiting for the assistant.")
+
+# Function to list the open threads
+def show_threads():
+    print_with_timestamp("System", "Open threads:")
+    for number, conversation in enumerate(conversations.values(), 1):
+        marker = "*" if conversation is active_conversation else " "
+        in_flight = f", {len(conversation.pending)} in flight" if conversation.pending else ""
+        print_line(f"{marker} {number}. {conversation.thread_id}  {len(conversation.history)} messages{in_flight}")
+
+# Function to wait for the 'done' reaction of a turn and report it, as a notification if its thread is in the background
+async def finish_turn(conversation: Conversation, turn: Turn):
+    global waiting_for_response
+    done = await conversation.wait_done(turn, TIMEOUT)
+    conversation.history.flush()  # Journal the turn to its session file, if any
+    if conversation is not active_conversation:
+        outcome = f"reply received after {turn.time_to_done:.2f}s" if done else f"no 'done' reaction after {TIMEOUT:g}s"
+        print_with_timestamp("System", f"Thread {conversation.thread_id}: {outcome}; /switch {conversation.thread_id} to read it.")
+        return
+    if done:
+        print_with_timestamp("System", format_turn_timings(turn))
+    else:
+        print_with_timestamp("Error", f"No 'done' reaction after {TIMEOUT:g}s; the turn is counted as timed out.")
+    if not conversation.pending:
+        waiting_for_response = False
+
+    # Print an empty line to separate interactions  
+    print_line()  
+
+# Side-by-side comparison of several bot deployments, enabled by run --compare
+class Comparison:
+    """Sends every user turn to several endpoints at once, each in its own thread.
+
+    Every endpoint gets a conversation with its own thread_id. The bots post
+    their events to the one callback server, which routes them by thread_id,
+    so the answers of each deployment stay apart. A turn is over when every
+    endpoint has sent 'done' or timed out.
+    """
+
+    def __init__(self, endpoints):
+        self.lanes = []  # (endpoint, conversation)
+        for endpoint in endpoints:
+            lane_thread_id = generate_thread_id()
+            while lane_thread_id in conversations:
+                lane_thread_id = generate_thread_id()
+            self.lanes.append((endpoint, register_conversation(Conversation(lane_thread_id, render=False))))
+        self.lock = asyncio.Lock()
+
+    async def play(self, user_input: str, attachments: list = None, on_start=None):
+        """Sends the turn to every endpoint and returns one result per endpoint once all of them are over.
+
+        Turns are played one at a time: the bots' messages do not say which user
+        message they answer, so a turn is only sent once the previous one is over.
+        on_start is called once the previous turn is over, just before this one is sent.
+        """
+        async with self.lock:
+            if on_start is not None:
+                on_start()
+            return await self._play(user_input, attachments)
+
+    async def _play(self, user_input: str, attachments: list = None):
+        timestamp = generate_message_timestamp()
+        turns, user_messages = [], []
+        for _, conversation in self.lanes:
+            user_messages.append(conversation.add_message("user", user_input, timestamp))
+            turns.append(conversation.expect_done(timestamp))
+        sent = await asyncio.gather(*(
+            call_tested_llm(user_input, target_thread_id=conversation.thread_id, timestamp=timestamp,
+                            attachments=attachments, endpoint=endpoint)
+            for endpoint, conversation in self.lanes
+        ))
+
+        async def outcome(conversation: Conversation, turn: Turn, accepted: bool) -> str:
+            if not accepted:
+                conversation.abandon(turn, "send_error")
+                return "send_error"
+            return "done" if await conversation.wait_done(turn, TIMEOUT) else "timeout"
+
+        statuses = await asyncio.gather(*(
+            outcome(conversation, turn, accepted)
+            for (_, conversation), turn, accepted in zip(self.lanes, turns, sent)
+        ))
+        results = []
+        for (endpoint, conversation), turn, user_message, status in zip(self.lanes, turns, user_messages, statuses):
+            conversation.history.flush()
+            history = conversation.history
+            answers = history.messages_by_role("assistant", user_message.index,
+                                               history.next_user_index(user_message.index))
+            results.append({
+                "endpoint": endpoint,
+                "thread_id": conversation.thread_id,
+                "status": status,
+                "answer": "\n".join(message.content for message in answers),
+                "time_to_first_token": turn.time_to_first_token,
+                "time_to_done": turn.time_to_done,
+                "timeline": {event: round(at - turn.sent_at, 3) for event, at in turn.marks.items()},
+            })
+        return results
+
+# Function to describe how one endpoint's turn went
+def format_comparison_timing(result: dict) -> str:
+    if result["status"] == "send_error":
+        return "Not sent; see the logs."
+    if result["status"] == "timeout":
+        summary = f"No 'done' after {TIMEOUT:g}s"
+    else:
+        summary = f"First token {result['time_to_first_token']:.2f}s, done {result['time_to_done']:.2f}s"
+    events = ", ".join(f"{event} +{at:.2f}s" for event, at in result["timeline"].items())
+    return f"{summary} ({events})" if events else summary
+
+# Function to play a turn on every compared endpoint and show the answers side by side
+async def finish_comparison(comparison: Comparison, user_input: str, attachments: list = None):
+    def announce():
+        print_with_timestamp("System", f"Sent to {len(comparison.lanes)} endpoints, waiting for all of them...")
+
+    results = await comparison.play(user_input, attachments, on_start=announce)
+    if event_log is not None:
+        for result in results:
+            if event_log.mode == "jsonl":
+                fields = {key: value for key, value in result.items() if key != "thread_id"}
+                event_log.record("comparison", result["thread_id"], **fields)
+            else:
+                event_log.line("Compare", f"{result['endpoint']}: {format_comparison_timing(result)}")
+                event_log.text(result["answer"] or "(no answer)")
+        event_log.flush()
+        return
+    from rich.table import Table
+
+    table = Table(show_lines=True, expand=True)
+    for result in results:
+        table.add_column(f"{result['endpoint']}\n{result['thread_id']}", style="assistant", ratio=1)
+    table.add_row(*(result["answer"] or "(no answer)" for result in results))
+    table.add_row(*(format_comparison_timing(result) for result in results), style="system")
+    console_renderer.submit(table)
+    print_line()
+
+# Function to save the active thread to a session file and keep appending to it
+def save_session(path: str):
+    history = active_conversation.history
+    try:
+        if history.session is not None and os.path.abspath(history.session.path) == os.path.abspath(path):
+            history.session.checkpoint()
+        else:
+            history.save(SessionFile.create(path, active_conversation.thread_id, history))
+    except OSError as e:
+        print_with_timestamp("Error", f"Could not save the session: {str(e)}")
+        return
+    print_with_timestamp("System", f"Saved {len(history)} messages of thread {active_conversation.thread_id} to {path}; "
+                                   "new messages are appended to it.")
+
+# Function to load a session file as a thread, keeping its thread_id, and make it active
+def load_session(path: str, into: Conversation = None):
+    """Opens the file as a new thread, or in place of the `into` conversation."""
+    started = time.perf_counter()
+    try:
+        session = SessionFile.open(path)
+    except (OSError, ValueError) as e:
+        print_with_timestamp("Error", f"Could not load the session: {str(e)}")
+        return None
+    if session.thread_id in conversations and conversations[session.thread_id] is not into:
+        session.close()
+        print_with_timestamp("Error", f"Thread {session.thread_id} of {path} is already open; /switch to it.")
+        return None
+    if into is None:
+        conversation = Conversation(session.thread_id, render=False)
+        if event_log is not None:
+            conversation.observer = event_log.observe(conversation)
+    else:
+        conversation = into
+        conversations.pop(conversation.thread_id, None)
+        conversation.reset(session.thread_id)
+    conversation.history.restore(session)
+    register_conversation(conversation)
+    switch_conversation(conversation)
+    elapsed = (time.perf_counter() - started) * 1000
+    print_with_timestamp("System", f"Loaded {len(session)} messages of thread {session.thread_id} from {path} "
+                                   f"in {elapsed:.1f} ms; new messages are appended to it.")
+    return conversation
+
 # Function to display internal messages since the last user message  
 def show_last_internal_messages():  
-    global conversation_history, last_user_message_index  
     # Collect internal messages since the last user message  
-    internal_messages = []  
-    for msg in conversation_history[last_user_message_index+1:]:  
-        if msg["role"] == "assistant_internal":  
-            internal_messages.append(msg["content"])  
+    internal_messages = [msg.content for msg in active_conversation.history.internal_since_last_user()]
     if internal_messages:  
         print_with_timestamp("System", "Internal messages since your last message:")  
         for idx, msg in enumerate(internal_messages, 1):  
-            console.print(f"{idx}. {msg}", style="assistant_internal")  
+            print_line(f"{idx}. {msg}", style="assistant_internal")  
     else:  
         print_with_timestamp("System", "No internal messages since your last message.")  
   
+# Function to display rolling latency percentiles of each turn phase
+def show_turn_stats():
+    summary = turn_stats.summary()
+    if not summary and not turn_stats.failures:
+        print_with_timestamp("System", "No finished turns yet.")
+        return
+    print_with_timestamp("System", f"Turn phases over the last {turn_stats.window} turns (seconds):")
+    width = max((len(phase) for phase in summary), default=0)
+    for phase, stats in summary.items():
+        print_line(
+            f"  {phase:<{width}}  n={stats['count']:<5} p50={stats['p50']:7.3f}  "
+            f"p95={stats['p95']:7.3f}  p99={stats['p99']:7.3f}"
+        )
+    if turn_stats.failures:
+        print_line("  failed turns: " + ", ".join(f"{reason}={count}" for reason, count in turn_stats.failures.items()))
+
+# Function to describe when each event of a finished turn arrived
+def format_turn_timings(turn: Turn) -> str:
+    events = ", ".join(f"{event} +{at - turn.sent_at:.2f}s" for event, at in turn.marks.items())
+    return f"First token after {turn.time_to_first_token:.2f}s, done after {turn.time_to_done:.2f}s ({events})."
+
+# Function to write the conversation history, including spilled messages, to a JSONL file
+def export_conversation(path: str):
+    count = 0
+    try:
+        with open(path, "w", encoding="utf-8") as file:
+            for message in active_conversation.history:
+                file.write(json.dumps(message.to_dict(), ensure_ascii=False))
+                file.write("\n")
+                count += 1
+    except OSError as e:
+        print_with_timestamp("Error", f"Could not export the conversation: {str(e)}")
+        return
+    print_with_timestamp("System", f"Exported {count} messages to {path}.")
+
 # Define a list of available commands for autocompletion  
 COMMANDS = [  
     "/toggle_internal",  
     "/reset",  
     "/show_last_mind",  
+    "/export",
+    "/attach",
+    "/prompt",
+    "/stats",
+    "/profile",
+    "/new",
+    "/switch",
+    "/threads",
+    "/save",
+    "/load",
     "/exit",  
     "/quit"  
 ]  
   
-# Implement a custom completer  
-class CommandCompleter(Completer):  
-    def get_completions(self, document, complete_event):  
-        # Tokenize the input so far  
-        text = document.text_before_cursor  
-        if text.startswith('/'):  
-            for cmd in COMMANDS:  
-                if cmd.startswith(text):  
-                    yield Completion(cmd, start_position=-len(text))  
+# Arguments of /profile
+PROFILE_ACTIONS = ("start", "stop")
+
+# Completions offered at most, and recent user inputs offered as completions
+COMPLETION_LIMIT = 50
+COMPLETION_HISTORY = 1000
+
+# Node of a PrefixTrie
+class TrieNode:
+    __slots__ = ("children", "count")
+
+    def __init__(self):
+        self.children = {}  # first character of an edge -> (edge label, child node)
+        self.count = 0  # Times the word ending here was added
+
+# Prefix tree of completion candidates
+class PrefixTrie:
+    """Radix tree of words: chains of single-child nodes are merged into one edge.
+
+    Listing the words with a prefix costs the length of the prefix plus the
+    number of branches below it, however many words are stored. A word added
+    several times is listed once and stays until discarded as many times.
+    """
+
+    __slots__ = ("root", "size")
+
+    def __init__(self, words=()):
+        self.root = TrieNode()
+        self.size = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        node = self.root
+        rest = word
+        while rest:
+            edge = node.children.get(rest[0])
+            if edge is None:
+                child = node.children[rest[0]] = (rest, TrieNode())
+                node = child[1]
+                break
+            label, child = edge
+            common = 1
+            while common < len(label) and common < len(rest) and label[common] == rest[common]:
+                common += 1
+            if common < len(label):
+                # The word leaves this edge midway: split it
+                middle = TrieNode()
+                middle.children[label[common]] = (label[common:], child)
+                node.children[rest[0]] = (label[:common], middle)
+                child = middle
+            node = child
+            rest = rest[common:]
+        if not node.count:
+            self.size += 1
+        node.count += 1
+
+    def discard(self, word: str):
+        node = self.root
+        rest = word
+        path = []  # (parent, edge key) of each edge followed
+        while rest:
+            edge = node.children.get(rest[0])
+            if edge is None or not rest.startswith(edge[0]):
+                return
+            path.append((node, rest[0]))
+            node = edge[1]
+            rest = rest[len(edge[0]):]
+        if not node.count:
+            return
+        node.count -= 1
+        if node.count:
+            return
+        self.size -= 1
+        if not path:
+            return
+        parent, key = path[-1]
+        if not node.children:
+            del parent.children[key]
+            node = parent
+            if len(path) < 2:
+                return
+            parent, key = path[-2]
+        # A node left with no word and a single child is merged into the edge above it
+        if not node.count and len(node.children) == 1:
+            label = parent.children[key][0]
+            child_label, child = next(iter(node.children.values()))
+            parent.children[key] = (label + child_label, child)
+
+    def complete(self, prefix: str, limit: int = None):
+        """Returns the words starting with prefix in alphabetical order, at most limit of them."""
+        node = self.root
+        word = ""
+        rest = prefix
+        while rest:
+            edge = node.children.get(rest[0])
+            if edge is None:
+                return []
+            label, child = edge
+            if not (label.startswith(rest) or rest.startswith(label)):
+                return []
+            word += label
+            rest = rest[len(label):]
+            node = child
+        words = []
+        stack = [(word, node)]
+        while stack:
+            word, node = stack.pop()
+            if node.count:
+                words.append(word)
+                if limit and len(words) >= limit:
+                    break
+            children = node.children
+            stack.extend((word + children[key][0], children[key][1]) for key in sorted(children, reverse=True))
+        return words
+
+# Completion candidates of the prompt
+class CompletionEngine:
+    """Completes slash commands, their arguments and recent user inputs from prefix tries.
+
+    Commands are indexed once. The arguments of /switch (thread IDs) and
+    /prompt (prompt names) are indexed again only when their source
+    changes, and user inputs as they are sent. The prompt asks for
+    completions from a worker thread, so the tries are guarded by a lock.
+    """
+
+    def __init__(self, limit: int = COMPLETION_LIMIT, history_size: int = COMPLETION_HISTORY):
+        self.limit = limit
+        self.history_size = history_size
+        self.lock = threading.Lock()
+        self.commands = PrefixTrie(COMMANDS)
+        self.argument_sources = {
+            "/switch": lambda: tuple(conversations),
+            "/prompt": lambda: prompt_registry.names(),
+            "/profile": lambda: PROFILE_ACTIONS,
+        }
+        self.argument_tries = {}  # command -> (snapshot of its source, trie)
+        self.recent = deque()  # recent user inputs, oldest first
+        self.inputs = PrefixTrie()
+
+    def remember(self, user_input: str):
+        with self.lock:
+            self.recent.append(user_input)
+            self.inputs.add(user_input)
+            if len(self.recent) > self.history_size:
+                self.inputs.discard(self.recent.popleft())
+
+    def _argument_trie(self, command: str) -> PrefixTrie:
+        snapshot = self.argument_sources[command]()
+        indexed = self.argument_tries.get(command)
+        if indexed is None or (indexed[0] is not snapshot and indexed[0] != snapshot):
+            indexed = self.argument_tries[command] = (snapshot, PrefixTrie(snapshot))
+        return indexed[1]
+
+    def complete(self, text: str):
+        """Returns the candidates for the text before the cursor and how many characters they replace."""
+        if not text:
+            return [], 0
+        with self.lock:
+            if not text.startswith("/"):
+                return self.inputs.complete(text, self.limit), len(text)
+            command, separator, argument = text.partition(" ")
+            if not separator:
+                return self.commands.complete(text, self.limit), len(text)
+            if command in self.argument_sources:
+                return self._argument_trie(command).complete(argument, self.limit), len(argument)
+            return [], 0
+
+completion_engine = CompletionEngine()
+
+# Function to build the slash command completer class
+def create_command_completer():
+    from prompt_toolkit.completion import Completer, Completion
+
+    # Implement a custom completer  
+    class CommandCompleter(Completer):  
+        def get_completions(self, document, complete_event):  
+            candidates, replaced = completion_engine.complete(document.text_before_cursor)
+            for candidate in candidates:
+                yield Completion(candidate, start_position=-replaced)
+
+    return CommandCompleter
+
+# Attributes built on first access, so commands that never prompt or receive callbacks skip their imports
+LAZY_ATTRIBUTES = {
+    "fastapi_app": create_fastapi_app,
+    "CommandCompleter": create_command_completer,
+    "ThreadedCompleter": lambda: importlib.import_module("prompt_toolkit.completion").ThreadedCompleter,
+    "PromptSession": lambda: importlib.import_module("prompt_toolkit").PromptSession,
+    "patch_stdout": lambda: importlib.import_module("prompt_toolkit.patch_stdout").patch_stdout,
+}
+
+def __getattr__(name):
+    if name not in LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = LAZY_ATTRIBUTES[name]()
+    return value
+
+# Function to read a lazy attribute from inside the module (a patched value wins)
+def lazy_attribute(name: str):
+    return globals()[name] if name in globals() else __getattr__(name)
   
 # Main function to run the interactive session  
-async def main(show_internal_messages_arg: bool, prompt_name: str):  
-    global waiting_for_response, show_internal_messages, main_loop, thread_id, last_user_message_index  
+async def main(show_internal_messages_arg: bool, prompt_name: str, transport_name: str = "http",
+               callback_host: str = None, callback_port: int = None, output: str = "rich", attachments: list = None,
+               profile: bool = False, resume: str = None, compare: list = None):
+    global waiting_for_response, show_internal_messages, main_loop, http_session, transport, event_log
   
     # Set the flag for internal messages  
     show_internal_messages = show_internal_messages_arg  
   
-    # Start the FastAPI server in a separate thread  
-    server_thread = threading.Thread(target=start_uvicorn, daemon=True)  
-    server_thread.start()  
-    logger.info("FastAPI server started.")  
-  
     # Get the main event loop  
     main_loop = asyncio.get_running_loop()  
+    if output == "rich":
+        console_renderer.start()
+    else:
+        event_log = EventLog(output)
+        active_conversation.observer = event_log.observe(active_conversation)
+
+    # Start the FastAPI server on this loop when events come back over HTTP or metrics are served
+    transport = create_transport(transport_name)
+    callback_server = None
+    try:
+        if transport.needs_callback_server or METRICS_ENABLED:
+            callback_server = await start_callback_server(callback_host, callback_port)
+    except Exception as e:
+        print_with_timestamp("Error", str(e))
+        await console_renderer.stop()
+        close_event_log()
+        return
+
+    # Open the shared HTTP session used for every outgoing message
+    http_session = create_http_session()
+    try:
+        await transport.start()
+    except Exception as e:
+        print_with_timestamp("Error", f"Could not start the {transport.name} transport: {str(e)}")
+        await close_http_session()
+        if callback_server is not None:
+            await callback_server.stop()
+        await console_renderer.stop()
+        close_event_log()
+        return
   
-    # Create the PromptSession with the CommandCompleter  
-    session = PromptSession(completer=CommandCompleter())  
+    # Endpoints compared side by side, each turn being sent to all of them
+    comparison = None
+    if compare:
+        comparison = Comparison(compare)
+        if event_log is not None:
+            for _, lane in comparison.lanes:
+                lane.observer = event_log.observe(lane)
+
+    # Profile the session once the server and the transport are up
+    if profile:
+        profiler.start()
+
+    # Index the prompt library and pick up prompts added while the session runs
+    prompt_registry.scan()
+    prompt_registry.start_watching()
+
+    # Turns waited for in the background while the prompt is in use
+    turn_tasks = set()
+
+    # Read input with a PromptSession and the CommandCompleter, or line by line from stdin when headless
+    if event_log is None:
+        # Completions are computed in a worker thread so typing never waits for them
+        completer = lazy_attribute("ThreadedCompleter")(lazy_attribute("CommandCompleter")())
+        session = lazy_attribute("PromptSession")(completer=completer)  
+
+        async def read_input():
+            with lazy_attribute("patch_stdout")():  
+                return await session.prompt_async("You: ")  
+    else:
+        read_input = read_stdin_line
   
     # Display a welcome message  
     print_with_timestamp("System", "Welcome to the Assistant CLI!")  
-    console.print("Available Commands:")  
-    console.print("  /toggle_internal - Toggle internal messages on/off.")  
-    console.print("  /reset           - Clear the conversation history.")  
-    console.print("  /show_last_mind  - Display internal messages since your last message.")  
-    console.print("  /exit or /quit   - Exit the application.\n")  
+    if event_log is None:
+        print_available_commands()
   
+    # Continue the saved session, or start saving the new one
+    if resume:
+        if os.path.exists(resume):
+            load_session(resume, into=active_conversation)
+        else:
+            save_session(resume)
+
     # Display the current thread_id  
     print_with_timestamp("System", f"Current thread ID: {thread_id}")  
+    if comparison is not None:
+        for endpoint, lane in comparison.lanes:
+            print_with_timestamp("System", f"Comparing {endpoint} in thread {lane.thread_id}.")
   
     # Load the system prompt if provided  
     if prompt_name:  
@@ -285,19 +2530,22 @@ async def main(show_internal_messages_arg: bool, prompt_name: str):
         if not system_prompt:  
             print_with_timestamp("System", f"Prompt '{prompt_name}' not found.")  
         else:  
-            conversation_history.append({  
-                "role": "system",  
-                "content": system_prompt,  
-                "reactions": [],  
-            })  
+            active_conversation.add_message("system", system_prompt)
             print_with_timestamp("System", f"System Prompt: {system_prompt}")  
+
+    # Files sent with every message of the session
+    session_attachments.clear()
+    for attachment_path in attachments or []:
+        if os.path.isfile(attachment_path):
+            session_attachments.append(attachment_path)
+            print_with_timestamp("System", f"Attaching {attachment_path} as {attachment_field(attachment_path)} to every message.")
+        else:
+            print_with_timestamp("Error", f"No such file: {attachment_path}")
   
     # Interaction loop with the user  
     try:  
         while True:  
-            with patch_stdout():  
-                user_input = await session.prompt_async("You: ")  
-                user_input = user_input.strip()
+            user_input = (await read_input()).strip()
   
             # Check for slash commands  
             if user_input.startswith("/"):  
@@ -312,6 +2560,56 @@ async def main(show_internal_messages_arg: bool, prompt_name: str):
                 elif user_input == "/show_last_mind":  
                     show_last_internal_messages()  
                     continue  
+                elif user_input == "/stats":
+                    show_turn_stats()
+                    continue
+                elif user_input == "/profile" or user_input.startswith("/profile "):
+                    toggle_profiler(user_input[len("/profile"):].strip())
+                    continue
+                elif user_input == "/attach" or user_input.startswith("/attach "):
+                    attachment_path = user_input[len("/attach"):].strip()
+                    if attachment_path:
+                        attach_file(attachment_path)
+                    else:
+                        print_with_timestamp("Error", "Usage: /attach <path>")
+                    continue
+                elif user_input == "/prompt" or user_input.startswith("/prompt "):
+                    use_prompt(user_input[len("/prompt"):].strip())
+                    continue
+                elif user_input == "/new":
+                    new_conversation()
+                    continue
+                elif user_input == "/threads":
+                    show_threads()
+                    continue
+                elif user_input == "/switch" or user_input.startswith("/switch "):
+                    reference = user_input[len("/switch"):].strip()
+                    if reference:
+                        switch_to(reference)
+                    else:
+                        print_with_timestamp("Error", "Usage: /switch <id>")
+                    continue
+                elif user_input == "/save" or user_input.startswith("/save "):
+                    session_path = user_input[len("/save"):].strip()
+                    if session_path:
+                        save_session(session_path)
+                    else:
+                        print_with_timestamp("Error", "Usage: /save <path>")
+                    continue
+                elif user_input == "/load" or user_input.startswith("/load "):
+                    session_path = user_input[len("/load"):].strip()
+                    if session_path:
+                        load_session(session_path)
+                    else:
+                        print_with_timestamp("Error", "Usage: /load <path>")
+                    continue
+                elif user_input == "/export" or user_input.startswith("/export "):
+                    export_path = user_input[len("/export"):].strip()
+                    if export_path:
+                        export_conversation(export_path)
+                    else:
+                        print_with_timestamp("Error", "Usage: /export <path>")
+                    continue
                 elif user_input in ('/exit', '/quit'):  
                     print_with_timestamp("System", "Exiting.")  
                     break  
@@ -319,67 +2617,324 @@ async def main(show_internal_messages_arg: bool, prompt_name: str):
                     print_with_timestamp("Error", "Unknown command.")  
                     continue  
   
-            # Add the user's message to the history  
-            conversation_history.append({  
-                "role": "user",  
-                "content": user_input,  
-                "reactions": [],  
-            })  
+            # Add the user's message to the history and expect its 'done' reaction
+            completion_engine.remember(user_input)
+            if comparison is not None:
+                attachments = session_attachments + active_conversation.attachments
+                active_conversation.attachments = []
+                if event_log is None:
+                    turn_task = main_loop.create_task(finish_comparison(comparison, user_input, attachments))
+                    turn_tasks.add(turn_task)
+                    turn_task.add_done_callback(turn_tasks.discard)
+                else:
+                    await finish_comparison(comparison, user_input, attachments)
+                continue
+            conversation = active_conversation
+            timestamp = generate_message_timestamp()
+            conversation.add_message("user", user_input, timestamp)
+            turn = conversation.expect_done(timestamp)
   
-            # Update the index of the last user message  
-            last_user_message_index = len(conversation_history) - 1  
-  
-            # Send the user's message to LLM1  
-            await call_tested_llm(user_input)  
+            # Send the user's message to LLM1, with the session's attachments and those queued by /attach
+            attachments = session_attachments + conversation.attachments
+            conversation.attachments = []
+            if not await call_tested_llm(user_input, target_thread_id=conversation.thread_id, timestamp=timestamp,
+                                         attachments=attachments):
+                conversation.abandon(turn, "send_error")
+                print_with_timestamp("Error", "The message could not be sent; see the logs for details.")
+                continue
   
             # Display the waiting message  
             waiting_for_response = True  
             print_with_timestamp("System", "Waiting for assistant to respond...")  
   
-            # Reset the event before waiting  
-            done_reaction_received.clear()  
-  
-            # Wait for the 'done' reaction to be received  
-            await done_reaction_received.wait()  
-  
-            # After receiving 'done', resume control  
-            waiting_for_response = False  
-  
-            # Print an empty line to separate interactions  
-            console.print()  
+            # Wait for the 'done' reaction, for at most TIMEOUT seconds. The prompt stays available
+            # meanwhile so other threads can be used; headless input is played one turn at a time.
+            if event_log is None:
+                turn_task = main_loop.create_task(finish_turn(conversation, turn))
+                turn_tasks.add(turn_task)
+                turn_task.add_done_callback(turn_tasks.discard)
+            else:
+                await finish_turn(conversation, turn)
+                event_log.flush()
   
     except Exception as e:  
         logger.error(f"Error in user input: {str(e)}")
         if 'pytest' in sys.modules:  
             raise  # Re-raise the exception during testing  
     finally:  
-        # No need to stop the server; it stops with the daemon thread  
-        pass  
+        # Stop waiting for turns and receiving callbacks, then release the connections
+        for turn_task in list(turn_tasks):
+            turn_task.cancel()
+        if callback_server is not None:
+            await callback_server.stop()
+        await transport.close()
+        await close_http_session()
+        for conversation in conversations.values():
+            conversation.close()
+        attachment_cache.close()
+        await prompt_registry.stop()
+        prompt_registry.close()
+        if profiler.running:
+            show_profile_summary(profiler.stop())
+        await console_renderer.stop()
+        close_event_log()
+
+# Function to read the next user line from stdin without blocking the loop
+async def read_stdin_line() -> str:
+    line = await asyncio.get_running_loop().run_in_executor(None, sys.stdin.readline)
+    return line if line else "/exit"  # End of input
+
+# Function to write out and detach the headless output
+def close_event_log():
+    global event_log
+    if event_log is not None:
+        event_log.close()
+        for conversation in conversations.values():
+            conversation.observer = None
+        event_log = None
   
+# Index of the system prompt library
+class PromptRegistry:
+    """Names and cached contents of the prompts directory.
+
+    The directory is listed once, then again only when its modification time
+    changes, which is when a prompt is added, removed or renamed; watching
+    checks it every few seconds. A prompt is read once and kept until its
+    file's modification time or size changes. Prompts of PROMPT_MMAP_THRESHOLD
+    bytes or more are memory-mapped rather than copied into the cache.
+    """
+
+    def __init__(self, directory: str, mmap_threshold: int = PROMPT_MMAP_THRESHOLD):
+        self.directory = directory
+        self.mmap_threshold = mmap_threshold
+        self.paths = {}  # prompt name -> file path
+        self.sorted_names = []
+        self.directory_mtime = None
+        self.cache = {}  # prompt name -> ((mtime, size), text or mmap)
+        self.lock = threading.RLock()  # The completer thread lists names while the loop thread scans
+        self.task = None
+
+    def scan(self, force: bool = False) -> bool:
+        """Lists the directory again if it changed (or if forced); returns True if it was listed."""
+        with self.lock:
+            return self._scan(force)
+
+    def _scan(self, force: bool) -> bool:
+        try:
+            directory_mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            directory_mtime = 0  # No prompts directory
+        if directory_mtime == self.directory_mtime and not force:
+            return False
+        paths = {}
+        if directory_mtime:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".txt") and entry.is_file():
+                        paths[entry.name[:-len(".txt")]] = entry.path
+        self.paths = paths
+        self.sorted_names = sorted(paths)
+        self.directory_mtime = directory_mtime
+        for name in [name for name in list(self.cache) if name not in paths]:
+            self._evict(name)
+        return True
+
+    def names(self, prefix: str = ""):
+        """Returns the prompt names starting with prefix, in order."""
+        if self.directory_mtime is None:
+            self.scan()
+        names = self.sorted_names
+        if not prefix:
+            return names  # The same list until the next scan, so callers can tell when it changed
+        start = bisect_left(names, prefix)
+        end = start
+        while end < len(names) and names[end].startswith(prefix):
+            end += 1
+        return names[start:end]
+
+    def get(self, name: str):
+        """Returns the stripped text of a prompt, or None if there is no such prompt."""
+        path = self.paths.get(name)
+        if path is None and self.scan(force=True):  # Changes within the directory's mtime resolution are missed otherwise
+            path = self.paths.get(name)
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.scan()
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        with self.lock:
+            cached = self.cache.get(name)
+            if cached is None or cached[0] != version:
+                self._evict(name)
+                cached = self.cache[name] = (version, self._read(path, stat.st_size))
+            content = cached[1]
+            if isinstance(content, mmap.mmap):
+                return str(content, "utf-8").strip()
+            return content
+
+    def _read(self, path: str, size: int):
+        with open(path, "rb") as file:
+            if size >= self.mmap_threshold:
+                return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            return file.read().decode("utf-8").strip()
+
+    def _evict(self, name: str):
+        cached = self.cache.pop(name, None)
+        if cached is not None and isinstance(cached[1], mmap.mmap):
+            cached[1].close()
+
+    def start_watching(self, interval: float = PROMPT_WATCH_INTERVAL):
+        if self.task is None and interval > 0:
+            self.task = asyncio.get_running_loop().create_task(self._watch(interval))
+
+    async def _watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            if self.scan():
+                logger.info(f"Prompts directory changed: {len(self.paths)} prompts.")
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def close(self):
+        """Unmaps and drops every cached prompt."""
+        with self.lock:
+            for name in list(self.cache):
+                self._evict(name)
+
+prompt_registry = PromptRegistry(PROMPTS_DIR)
+
 # Function to load the system prompt  
 def load_system_prompt(prompt_name: str):  
     try:  
-        prompt_path = os.path.join("prompts", f"{prompt_name}.txt")  
-        if os.path.exists(prompt_path):  
-            with open(prompt_path, "r", encoding="utf-8") as file:  
-                return file.read().strip()  
-        else:  
-            return None  
+        return prompt_registry.get(prompt_name)
     except Exception as e:  
         logger.error(f"Error loading system prompt: {str(e)}")  
         return None  
+
+# Function to load a prompt from the library into the active thread, or list the library
+def use_prompt(prompt_name: str):
+    if not prompt_name:
+        names = prompt_registry.names()
+        print_with_timestamp("System", f"{len(names)} prompts in {prompt_registry.directory}: {', '.join(names)}")
+        return
+    system_prompt = load_system_prompt(prompt_name)
+    if not system_prompt:
+        print_with_timestamp("Error", f"Prompt '{prompt_name}' not found.")
+        return
+    active_conversation.add_message("system", system_prompt)
+    print_with_timestamp("System", f"System prompt '{prompt_name}' loaded ({len(system_prompt):,} characters).")
   
 # Define the CLI entry point with Typer  
 @app.command()  
 def run(  
     prompt_name: str = typer.Option(None, help="Name of the prompt to use."),  
     show_internal_messages: bool = typer.Option(False, help="Display internal messages."),  
+    transport: str = typer.Option(TRANSPORT, help="Transport to the bot: 'http' (callbacks) or 'websocket'."),
+    host: str = typer.Option(CALLBACK_HOST, help="Host the callback server listens on."),
+    port: int = typer.Option(CALLBACK_PORT, help="Port the callback server listens on."),
+    output: str = typer.Option("rich", help="Output: 'rich' (console), 'plain' (text lines) or 'jsonl' (one record per event). Headless modes read input from stdin."),
+    attach: list[str] = typer.Option(None, help="File to send with every message; repeat the option for several files."),
+    profile: bool = typer.Option(False, help="Profile the whole session into PROFILE_DIR, as /profile start does."),
+    resume: str = typer.Option(None, help="Session file to continue, with its thread ID; created if missing. The session is saved to it as it goes."),
+    compare: list[str] = typer.Option(None, help="Endpoint to send every turn to, side by side with the others; repeat the option for each deployment (http transport only)."),
 ):  
     """Run the interactive LLM script."""  
+    if output not in OUTPUT_MODES:
+        raise typer.BadParameter(f"output must be one of: {', '.join(OUTPUT_MODES)}.")
+    if transport not in TRANSPORTS:
+        raise typer.BadParameter(f"transport must be one of: {', '.join(TRANSPORTS)}.")
+    if compare and transport != "http":
+        raise typer.BadParameter("--compare needs the http transport, whose callbacks are routed by thread_id.")
     try:  
-        asyncio.run(main(show_internal_messages, prompt_name))  
+        asyncio.run(main(show_internal_messages, prompt_name, transport, host, port, output, attach, profile, resume, compare))
     except (SystemExit, KeyboardInterrupt):  
         print_with_timestamp("System", "Application interrupted by user.")  
   
+# Headless load test entry point
+@app.command()
+def loadtest(
+    script: str = typer.Argument(..., help="File with the scripted user turns (.txt, one turn per line, or .jsonl)."),
+    conversations: int = typer.Option(100, help="Total number of virtual conversations to run."),
+    mode: str = typer.Option("closed", help="Arrival model: 'closed' (fixed concurrency) or 'open' (fixed arrival rate)."),
+    concurrency: int = typer.Option(10, help="Conversations in flight at once in closed-loop mode."),
+    rate: float = typer.Option(5.0, help="New conversations per second in open-loop mode."),
+    think_time: float = typer.Option(0.0, help="Seconds a virtual user waits between two turns."),
+    turn_timeout: float = typer.Option(60.0, help="Seconds to wait for the 'done' reaction of a turn."),
+    callback_port: int = typer.Option(CALLBACK_PORT, help="Port of the /api/receive_message callback server."),
+    workers: int = typer.Option(1, help="Worker processes; worker i listens for callbacks on callback-port + i."),
+    callback_host: str = typer.Option("127.0.0.1", help="Host the bot reaches the workers' callback servers on."),
+):
+    """Run concurrent virtual conversations against the genaibot endpoint."""
+    from loadtest import run_loadtest, run_sharded_loadtest
+
+    if mode not in ("closed", "open"):
+        raise typer.BadParameter("mode must be 'closed' or 'open'.")
+    if mode == "open" and rate <= 0:
+        raise typer.BadParameter("rate must be greater than 0 in open mode.")
+    if concurrency < 1:
+        raise typer.BadParameter("concurrency must be at least 1.")
+    if conversations < 1:
+        raise typer.BadParameter("conversations must be at least 1.")
+    if workers < 1:
+        raise typer.BadParameter("workers must be at least 1.")
+    if workers > 1:
+        run_sharded_loadtest(
+            script,
+            workers,
+            conversations=conversations,
+            mode=mode,
+            concurrency=concurrency,
+            rate=rate,
+            think_time=think_time,
+            turn_timeout=turn_timeout,
+            callback_port=callback_port,
+            callback_host=callback_host,
+        )
+        return
+    asyncio.run(run_loadtest(
+        script,
+        conversations=conversations,
+        mode=mode,
+        concurrency=concurrency,
+        rate=rate,
+        think_time=think_time,
+        turn_timeout=turn_timeout,
+        callback_port=callback_port,
+    ))
+
+# Batch replay entry point
+@app.command()
+def replay(
+    transcripts: list[str] = typer.Argument(..., help="Transcript files of user turns (.jsonl or .yaml), one thread each."),
+    output: str = typer.Option("replay.jsonl", help="JSONL file receiving every message, reaction and turn timing."),
+    parallel: int = typer.Option(4, help="Transcripts replayed at once."),
+    prompt_name: str = typer.Option(None, help="Name of the prompt to load at the start of every transcript."),
+    transport: str = typer.Option(TRANSPORT, help="Transport to the bot: 'http' (callbacks) or 'websocket'."),
+    turn_timeout: float = typer.Option(TIMEOUT, help="Seconds to wait for the 'done' reaction of a turn."),
+    callback_port: int = typer.Option(CALLBACK_PORT, help="Port of the /api/receive_message callback server."),
+):
+    """Replay scripted transcripts through the bot and record the results."""
+    from replay import run_replay
+
+    asyncio.run(run_replay(
+        transcripts,
+        output=output,
+        parallel=parallel,
+        prompt_name=prompt_name,
+        transport_name=transport,
+        turn_timeout=turn_timeout,
+        callback_port=callback_port,
+    ))
+
 if __name__ == "__main__":  
     app()  
@@ -0,0 +1,75 @@
+# bench_completion.py
+
+"""Measures the cost of one completion request as the completion sources grow.
+
+For each size N, the script registers N prompt names and N recent user
+inputs and times CommandCompleter.get_completions for a command prefix, a
+/prompt argument and a free-text prefix. It compares the trie-backed
+CompletionEngine with a linear startswith scan over the same candidates.
+The trie timings include building the prompt_toolkit Completion objects,
+so the linear scan wins on the dozen static commands.
+
+Usage:
+    python benchmarks/bench_completion.py --sizes 100 1000 10000
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import basic_app  # noqa: E402
+from prompt_toolkit.document import Document  # noqa: E402
+
+
+def random_words(count: int, rng: random.Random):
+    return ["".join(rng.choices(string.ascii_lowercase + "_", k=rng.randint(6, 24))) for _ in range(count)]
+
+
+def time_per_call(function, text: str, repeat: int) -> float:
+    list(function(text))  # Index the source first: only the per-keystroke cost is timed
+    start = time.perf_counter()
+    for _ in range(repeat):
+        list(function(text))
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run(sizes, repeat: int):
+    rng = random.Random(0)
+    completer = basic_app.CommandCompleter()
+    for size in sizes:
+        prompt_names = sorted(random_words(size, rng))
+        inputs = random_words(size, rng)
+        engine = basic_app.CompletionEngine(history_size=size)
+        engine.argument_sources["/prompt"] = lambda: prompt_names
+        for user_input in inputs:
+            engine.remember(user_input)
+        basic_app.completion_engine = engine
+
+        def linear(text: str):
+            if text.startswith("/prompt "):
+                prefix = text[len("/prompt "):]
+                return [name for name in prompt_names if name.startswith(prefix)]
+            if text.startswith("/"):
+                return [command for command in basic_app.COMMANDS if command.startswith(text)]
+            return [user_input for user_input in inputs if user_input.startswith(text)]
+
+        def trie(text: str):
+            return completer.get_completions(Document(text), None)
+
+        for label, text in (("command", "/s"), ("prompt", "/prompt ab"), ("input", "ab")):
+            print(f"N={size:<7} {label:<8} trie={time_per_call(trie, text, repeat):8.1f} us   "
+                  f"linear={time_per_call(linear, text, repeat):8.1f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    run(args.sizes, args.repeat)
@@ -0,0 +1,79 @@
+# bench_console.py
+
+"""Measures how fast dispatch_event handles a burst of reactions and messages.
+
+The same burst is dispatched twice, with the console writing to /dev/null:
+
+- direct: every line is printed by the callback handler (renderer not started),
+- queued: lines go to console_renderer and are written once per frame.
+
+For each mode the script reports events/sec seen by the handler and the
+number of console lines actually written.
+
+Usage:
+    python benchmarks/bench_console.py --events 20000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import basic_app  # noqa: E402
+
+
+def burst(conversation, events: int):
+    """Three reactions then an internal message per user message, as a busy bot does."""
+    reactions = ("processing", "writing", "acknowledge")
+    for index in range(events):
+        timestamp = f"bench-{index // 4}"
+        if index % 4 == 0:
+            conversation.add_message("user", f"message {index // 4}", timestamp)
+        if index % 4 == 3:
+            yield {"event_type": "MESSAGE", "text": f"step {index}", "is_internal": True}
+        else:
+            yield {"event_type": "REACTION_ADD", "reaction_name": reactions[index % 4], "timestamp": timestamp}
+
+
+async def run_mode(name: str, events: int, queued: bool):
+    conversation = basic_app.active_conversation
+    messages = list(burst(conversation, events))
+    written = 0
+    original_print = basic_app.console.print
+
+    def counting_print(*args, **kwargs):
+        nonlocal written
+        written += 1
+        original_print(*args, **kwargs)
+
+    basic_app.console.print = counting_print
+    if queued:
+        basic_app.console_renderer.start()
+    start = time.perf_counter()
+    try:
+        for message in messages:
+            basic_app.dispatch_event(message)
+        elapsed = time.perf_counter() - start
+    finally:
+        await basic_app.console_renderer.stop()
+        basic_app.console.print = original_print
+        conversation.reset(conversation.thread_id)
+    print(f"{name:<7} {events / elapsed:10.0f} events/s   {written} lines written")
+
+
+async def run(events: int):
+    basic_app.console.file = open(os.devnull, "w")
+    basic_app.show_internal_messages = True
+    await run_mode("direct", events, queued=False)
+    await run_mode("queued", events, queued=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(run(args.events))
@@ -0,0 +1,57 @@
+# bench_history_memory.py
+
+"""Shows that a windowed MessageStore keeps memory flat as the session grows.
+
+Messages are appended in turns of one user message, eight internal messages
+and one answer. Python heap usage (tracemalloc) and peak RSS are printed at
+regular checkpoints for a windowed store and for an unbounded one.
+
+Usage:
+    python benchmarks/bench_history_memory.py --messages 1000000 --window 10000
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from basic_app import MessageStore  # noqa: E402
+
+
+def fill(store: MessageStore, messages: int, checkpoints: int):
+    step = max(1, messages // checkpoints)
+    start = time.perf_counter()
+    for index in range(messages):
+        position = index % 10
+        role = "user" if position == 0 else "assistant" if position == 9 else "assistant_internal"
+        store.append(role, f"message {index} " + "x" * 100, f"{index}.0000" if role == "user" else None)
+        if (index + 1) % step == 0:
+            current, _ = tracemalloc.get_traced_memory()
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"  {index + 1:>10,} messages  heap={current / 2**20:8.1f} MiB  "
+                  f"peak rss={peak_rss:8.1f} MiB  in memory={len(store) - store.spilled:,}")
+    print(f"  {messages / (time.perf_counter() - start):,.0f} appends/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--window", type=int, default=10_000)
+    parser.add_argument("--checkpoints", type=int, default=5)
+    parser.add_argument("--unbounded", action="store_true", help="Also run without a window (RSS then grows).")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory() as spill_dir:
+        print(f"window={args.window:,}")
+        store = MessageStore(window=args.window, spill_dir=spill_dir)
+        fill(store, args.messages, args.checkpoints)
+        store.close()
+    if args.unbounded:
+        print("unbounded")
+        fill(MessageStore(), args.messages, args.checkpoints)
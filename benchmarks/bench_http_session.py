@@ -0,0 +1,95 @@
+# bench_http_session.py
+
+"""Compares send latency of the pooled HTTP session against a session per call.
+
+A local aiohttp stub stands in for LLM_NOTIFICATION_ENDPOINT and accepts every
+message with a 202, so the numbers measure the client side only.
+
+Usage:
+    python benchmarks/bench_http_session.py --messages 500
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import basic_app  # noqa: E402
+
+
+# Start a stub endpoint that accepts every message
+async def start_stub_endpoint():
+    async def accept(request):
+        await request.read()
+        return web.json_response({"status": "accepted"}, status=202)
+
+    stub_app = web.Application()
+    stub_app.router.add_post("/api/get_generic_rest_notification", accept)
+    runner = web.AppRunner(stub_app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/api/get_generic_rest_notification"
+
+
+# Time every call_tested_llm invocation, in milliseconds
+async def measure(messages: int, session=None):
+    latencies = []
+    for idx in range(messages):
+        start = time.perf_counter()
+        await basic_app.call_tested_llm(f"benchmark message {idx}", session=session)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(label: str, latencies):
+    print(
+        f"{label:<10} n={len(latencies):<6} "
+        f"p50={percentile(latencies, 50):7.3f} ms  "
+        f"p99={percentile(latencies, 99):7.3f} ms  "
+        f"mean={statistics.fmean(latencies):7.3f} ms"
+    )
+
+
+async def run(messages: int, warmup: int):
+    runner, endpoint = await start_stub_endpoint()
+    basic_app.LLM_NOTIFICATION_ENDPOINT = endpoint
+    try:
+        # Per-call path: no shared session, a new one is built for every message
+        await measure(warmup)
+        per_call = await measure(messages)
+
+        # Pooled path: one long-lived session, as owned by main()
+        session = basic_app.create_http_session()
+        try:
+            await measure(warmup, session=session)
+            pooled = await measure(messages, session=session)
+        finally:
+            await session.close()
+    finally:
+        await runner.cleanup()
+
+    report("per-call", per_call)
+    report("pooled", pooled)
+    print(f"p50 speedup: {percentile(per_call, 50) / percentile(pooled, 50):.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500, help="Messages to send per path.")
+    parser.add_argument("--warmup", type=int, default=20, help="Warm-up messages per path.")
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, args.warmup))
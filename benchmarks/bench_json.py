@@ -0,0 +1,84 @@
+# bench_json.py
+
+"""Measures messages/sec for encoding outgoing payloads and decoding incoming events.
+
+Encoding compares the former approach (build the full payload dict, then
+json.dumps it) with build_payload, which splices the variable fields into a
+prefix serialized once per thread. Decoding compares json.loads with the
+optional orjson/msgspec decoders on a typical MESSAGE event. Every
+installed backend is measured.
+
+Usage:
+    python benchmarks/bench_json.py --messages 200000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import basic_app  # noqa: E402
+
+EVENT = (
+    b'{"channel_id":1,"event_type":"MESSAGE","response_id":1,"thread_id":"1700000000.000100",'
+    b'"timestamp":"1700000000.000200","is_internal":false,"text":"Here is the answer to your question, '
+    b'with a few sentences of text so the event has a realistic size for a chat message.","sent_at":1700000000.5}'
+)
+
+
+def full_payload(user_input: str, target_thread_id: str, timestamp: str) -> dict:
+    client_id = basic_app.CLIENT_ID
+    return {
+        "channel_id": 1, "event_type": "MESSAGE", "response_id": 1, "text": user_input,
+        "thread_id": target_thread_id, "timestamp": timestamp, "user_email": f"{client_id}@example.com",
+        "user_id": 1, "user_name": client_id, "reaction_name": None, "files_content": [], "images": [],
+        "is_mention": True, "origin_plugin_name": client_id, "message_type": "TEXT", "is_internal": False,
+        "raw_data": {"text": user_input}, "username": client_id, "event_label": "message",
+        "api_app_id": "genaibot", "app_id": "genaibot",
+        "idempotency_key": f"{client_id}:{target_thread_id}:{timestamp}",
+    }
+
+
+def rate(func, messages: int) -> float:
+    start = time.perf_counter()
+    for index in range(messages):
+        func(index)
+    return messages / (time.perf_counter() - start)
+
+
+def available_backends():
+    for backend in ("json", "orjson", "msgspec"):
+        try:
+            yield basic_app.load_json_codec(backend)
+        except ImportError:
+            print(f"{backend:<8} not installed")
+
+
+def run(messages: int, threads: int):
+    text = "What is the status of my order? " * 3
+    print(f"{messages:,} messages over {threads} threads")
+    for name, dumps, loads in available_backends():
+        basic_app.json_dumps = dumps
+        basic_app.payload_prefix.cache_clear()
+
+        def dict_then_dumps(index):
+            return dumps(full_payload(text, f"thread-{index % threads}", f"{index}.0001"))
+
+        def spliced(index):
+            thread = f"thread-{index % threads}"
+            timestamp = f"{index}.0001"
+            return basic_app.build_payload(text, thread, timestamp, f"{basic_app.CLIENT_ID}:{thread}:{timestamp}")
+
+        print(f"{name:<8} encode  dict+dumps={rate(dict_then_dumps, messages):10,.0f}/s   "
+              f"template={rate(spliced, messages):10,.0f}/s   "
+              f"decode={rate(lambda index: loads(EVENT), messages):10,.0f}/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--threads", type=int, default=100, help="Distinct thread_ids (cached prefixes).")
+    args = parser.parse_args()
+    run(args.messages, args.threads)
@@ -0,0 +1,82 @@
+# bench_loadtest_workers.py
+
+"""Measures how the sharded load driver scales with the number of worker processes.
+
+For every worker count the script starts as many stub bot processes sharing
+one port (SO_REUSEPORT), so the stub is not the bottleneck, then runs the same
+closed-loop load test and prints turns/s and the speedup over one worker.
+Scaling can only be close to linear when there are at least twice as many
+cores as workers (one for each worker, one for each stub process).
+
+Usage:
+    python benchmarks/bench_loadtest_workers.py --workers 1 2 4 --conversations 2000
+"""
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import basic_app  # noqa: E402
+from loadtest import run_sharded_loadtest  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stubs(count: int, port: int, internal_messages: int):
+    processes = []
+    for _ in range(count):
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "stub_bot.py"), "--port", str(port), "--reuse-port",
+             "--internal-messages", str(internal_messages)],
+            stdout=subprocess.PIPE, text=True,
+        )
+        process.stdout.readline()  # Wait for the "listening" line
+        processes.append(process)
+    return processes
+
+
+def run(worker_counts, conversations: int, concurrency: int, turns: int, internal_messages: int):
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as script:
+        script.write("\n".join(f"turn {index}" for index in range(turns)))
+    print(f"{os.cpu_count()} cores, {conversations} conversations of {turns} turns, concurrency {concurrency}")
+    baseline = None
+    try:
+        for workers in worker_counts:
+            stub_port = free_port()
+            stubs = start_stubs(workers, stub_port, internal_messages)
+            basic_app.LLM_NOTIFICATION_ENDPOINT = f"http://127.0.0.1:{stub_port}/api/get_generic_rest_notification"
+            try:
+                results = run_sharded_loadtest(script.name, workers, conversations=conversations,
+                                               concurrency=concurrency, turn_timeout=30,
+                                               callback_port=free_port())
+            finally:
+                for stub in stubs:
+                    stub.terminate()
+                    stub.wait()
+            throughput = results.turns_completed / results.duration
+            baseline = baseline or throughput
+            print(f"workers={workers:<3} {throughput:9.0f} turns/s   speedup x{throughput / baseline:.2f}   "
+                  f"errors={sum(results.errors.values())}")
+    finally:
+        os.unlink(script.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--conversations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--internal-messages", type=int, default=2)
+    args = parser.parse_args()
+    run(args.workers, args.conversations, args.concurrency, args.turns, args.internal_messages)
@@ -0,0 +1,104 @@
+# bench_session.py
+
+"""Measures saving and resuming sessions of growing size.
+
+For every size the script builds a history of user turns (three reactions,
+eight internal messages and an answer each) journaled to a session file, then
+reports:
+
+- time to journal the history, and the file size,
+- time to resume it (SessionFile.open and MessageStore.restore), after a clean
+  close (the index is read) and after a crash (the records are scanned),
+- for comparison, time to load the same history from a JSONL /export.
+
+Usage:
+    python benchmarks/bench_session.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from basic_app import MessageStore, SessionFile  # noqa: E402
+
+
+def build(history: MessageStore, size: int):
+    for index in range(size):
+        position = index % 10
+        if position == 0:
+            message = history.append("user", f"question {index}", f"ts-{index}")
+            for emoji in ("👀", "⚙️", "✅"):
+                history.add_reaction(message, emoji)
+        else:
+            history.append("assistant_internal" if position < 9 else "assistant", f"message {index} " + "x" * 80)
+
+
+def median_ms(function, runs: int) -> float:
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def resume(path: str):
+    history = MessageStore(10000)
+    history.restore(SessionFile.open(path))
+    assert len(history)
+    history.close()
+
+
+def load_jsonl(path: str):
+    history = MessageStore(10000)
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            message = history.append(record["role"], record["content"], record["timestamp"])
+            for emoji in record["reactions"]:
+                history.add_reaction(message, emoji)
+    history.close()
+
+
+def run(sizes, runs: int):
+    directory = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            path = os.path.join(directory, f"session-{size}.gbs")
+            history = MessageStore(10000)
+            history.save(SessionFile.create(path, "bench-thread", ()))
+            start = time.perf_counter()
+            build(history, size)
+            history.flush()
+            journal_ms = (time.perf_counter() - start) * 1000
+
+            export_path = os.path.join(directory, f"session-{size}.jsonl")
+            with open(export_path, "w", encoding="utf-8") as file:
+                for message in history:
+                    file.write(json.dumps(message.to_dict(), ensure_ascii=False) + "\n")
+
+            crashed_path = path + ".crashed"
+            shutil.copyfile(path, crashed_path)  # Records only, no index yet
+            history.close()
+            resume_ms = median_ms(lambda: resume(path), runs)
+            crashed_ms = median_ms(lambda: resume(crashed_path), runs)
+            jsonl_ms = median_ms(lambda: load_jsonl(export_path), 1)
+            print(f"{size:>9} messages  journal {journal_ms:8.1f} ms  file {os.path.getsize(path) / 1e6:7.1f} MB  "
+                  f"resume {resume_ms:7.2f} ms  after crash {crashed_ms:8.1f} ms  jsonl load {jsonl_ms:8.1f} ms")
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+    run(args.sizes, args.runs)
@@ -0,0 +1,87 @@
+# bench_startup.py
+
+"""Measures CLI cold start and fails when it exceeds a time budget.
+
+Two measurements are taken in fresh interpreters:
+
+- `python -X importtime -c "import basic_app"`: the slowest top-level imports,
+  plus a check that the server and prompt stacks (aiohttp, uvicorn, FastAPI,
+  prompt_toolkit) are not imported by the module itself,
+- wall-clock time of `python basic_app.py --help`, the median of several runs.
+
+The script exits with status 1 when the median is over --budget-ms or when a
+deferred dependency is imported eagerly, so it can guard CI.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 10 --budget-ms 500
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+DEFERRED_MODULES = ("aiohttp", "uvicorn", "fastapi", "prompt_toolkit")
+
+
+def import_times():
+    """Returns (module, cumulative microseconds, depth) for basic_app and every module it imports."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import basic_app"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            # importtime indents each nesting level by two spaces after a leading space
+            times.append((name.strip(), int(cumulative), (len(name) - len(name.lstrip()) - 1) // 2))
+    # A module is listed after its own imports: keep the block ending with basic_app
+    start = max((index for index, (_, _, depth) in enumerate(times[:-1]) if depth == 0), default=-1) + 1
+    return times[start:]
+
+
+def help_wall_clock(runs: int):
+    """Returns the wall-clock seconds of each `basic_app.py --help` run."""
+    durations = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "basic_app.py", "--help"], cwd=ROOT, capture_output=True, check=True)
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def run(runs: int, top: int, budget_ms: float) -> int:
+    times = import_times()
+    print("slowest imports of basic_app (cumulative, -X importtime):")
+    top_level = [(name, cumulative) for name, cumulative, depth in times if depth <= 1]
+    for name, cumulative in sorted(top_level, key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+    eager = sorted({name.split(".")[0] for name, _, _ in times} & set(DEFERRED_MODULES))
+
+    durations = help_wall_clock(runs)
+    median_ms = statistics.median(durations) * 1000
+    print(f"basic_app.py --help  median={median_ms:.0f} ms  min={min(durations) * 1000:.0f} ms  "
+          f"max={max(durations) * 1000:.0f} ms  ({runs} runs, budget {budget_ms:.0f} ms)")
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported at startup: {', '.join(eager)}")
+        failed = True
+    if median_ms > budget_ms:
+        print(f"FAIL: startup is over budget by {median_ms - budget_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10, help="Number of slow imports to list.")
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="Maximum median wall-clock startup.")
+    args = parser.parse_args()
+    sys.exit(run(args.runs, args.top, args.budget_ms))
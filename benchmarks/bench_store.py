@@ -0,0 +1,112 @@
+# bench_store.py
+
+"""Compares the indexed MessageStore with the former list-of-dicts history.
+
+Each history ends with a long last turn (10% of the messages, 1% of them
+internal), the shape of a soak-test session where the bot loops for a while.
+For every size the script reports:
+
+- memory used by the history (tracemalloc),
+- attaching a reaction to the last user message,
+- collecting the internal messages since the last user message (/show_last_mind).
+
+Usage:
+    python benchmarks/bench_store.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from basic_app import MessageStore  # noqa: E402
+
+
+def message_roles(size: int):
+    """Yields the roles of a history of the given size."""
+    tail = size // 10
+    head = size - tail
+    for index in range(head):
+        position = index % 10
+        if position == 0:
+            yield "user"
+        elif position < 9:
+            yield "assistant_internal"
+        else:
+            yield "assistant"
+    yield "user"
+    for index in range(tail - 1):
+        yield "assistant_internal" if index % 100 == 0 else "assistant"
+
+
+def build_list(size: int):
+    history = []
+    last_user_message_index = -1
+    for index, role in enumerate(message_roles(size)):
+        history.append({"role": role, "content": f"message {index}", "reactions": []})
+        if role == "user":
+            last_user_message_index = index
+    return history, last_user_message_index
+
+
+def build_store(size: int):
+    store = MessageStore()
+    for index, role in enumerate(message_roles(size)):
+        store.append(role, f"message {index}", f"{index}.0000" if role == "user" else None)
+    return store
+
+
+def traced_size(builder, size: int) -> int:
+    tracemalloc.start()
+    result = builder(size)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def time_call(func, number: int) -> float:
+    """Best time of one call, in microseconds."""
+    return min(timeit.repeat(func, number=number, repeat=5)) / number * 1e6
+
+
+def run(size: int, number: int):
+    history, last_user_message_index = build_list(size)
+    store = build_store(size)
+
+    def list_reaction():
+        last_user_message = next(msg for msg in reversed(history) if msg["role"] == "user")
+        if "✅" not in last_user_message["reactions"]:
+            last_user_message["reactions"].append("✅")
+
+    def store_reaction():
+        store.last_user_message().add_reaction("✅")
+
+    def list_show_last_mind():
+        return [msg["content"] for msg in history[last_user_message_index + 1:] if msg["role"] == "assistant_internal"]
+
+    def store_show_last_mind():
+        return [msg.content for msg in store.internal_since_last_user()]
+
+    assert list_show_last_mind() == store_show_last_mind()
+
+    list_memory = traced_size(lambda n: build_list(n)[0], size)
+    store_memory = traced_size(build_store, size)
+    print(f"\n{size:,} messages")
+    print(f"  memory          list={list_memory / size:7.1f} B/msg   store={store_memory / size:7.1f} B/msg")
+    print(f"  reaction        list={time_call(list_reaction, number):10.2f} us    "
+          f"store={time_call(store_reaction, number):10.2f} us")
+    print(f"  show_last_mind  list={time_call(list_show_last_mind, number):10.2f} us    "
+          f"store={time_call(store_show_last_mind, number):10.2f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--number", type=int, default=20, help="Calls per timing repeat.")
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.number)
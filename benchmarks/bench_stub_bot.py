@@ -0,0 +1,106 @@
+# bench_stub_bot.py
+
+"""Measures how many events per second the stub bot can deliver.
+
+The stub (stub_bot.py) runs in a separate process. This script posts user
+messages to it from a plain aiohttp client and receives its callbacks on a
+minimal aiohttp server that only counts them, so the figure is the stub's
+capacity, not the client's. Run it before trusting a client benchmark: the
+client should be well below this rate.
+
+Usage:
+    python benchmarks/bench_stub_bot.py --messages 2000 --concurrency 50 --internal-messages 4
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def cpu_seconds(pid: int) -> float:
+    """Returns the user and system CPU time of a process (Linux)."""
+    with open(f"/proc/{pid}/stat") as file:
+        fields = file.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run(messages: int, concurrency: int, internal_messages: int, stream_chunks: int):
+    stub_port, sink_port = free_port(), free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "stub_bot.py"), "--port", str(stub_port),
+         "--callback-url", f"http://127.0.0.1:{sink_port}/api/receive_message",
+         "--internal-messages", str(internal_messages)] + (["--stream-chunks", str(stream_chunks)] if stream_chunks else []),
+        stdout=subprocess.PIPE, text=True,
+    )
+    stub.stdout.readline()  # Wait for the "listening" line
+
+    events = 0
+    done = 0
+    all_done = asyncio.Event()
+
+    async def receive(request):
+        nonlocal events, done
+        body = await request.read()
+        events += 1
+        if b'"done"' in body:
+            done += 1
+            if done == messages:
+                all_done.set()
+        return web.Response(text="OK")
+
+    sink = web.Application()
+    sink.router.add_post("/api/receive_message", receive)
+    runner = web.AppRunner(sink, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", sink_port).start()
+
+    url = f"http://127.0.0.1:{stub_port}/api/get_generic_rest_notification"
+    remaining = iter(range(messages))
+    try:
+        async with aiohttp.ClientSession() as session:
+            async def sender():
+                for index in remaining:
+                    payload = {"thread_id": f"bench-{index}", "timestamp": str(index), "text": f"message {index}"}
+                    async with session.post(url, json=payload) as response:
+                        await response.read()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(sender() for _ in range(concurrency)))
+            await asyncio.wait_for(all_done.wait(), 120)
+            elapsed = time.perf_counter() - start
+            stub_cpu = cpu_seconds(stub.pid)
+    finally:
+        await runner.cleanup()
+        stub.terminate()
+        stub.wait()
+
+    # On a shared machine the wall-clock rate includes this script's own work; the rate per CPU-second
+    # of the stub process is its capacity
+    print(f"messages={messages} events={events} in {elapsed:.2f}s: "
+          f"{messages / elapsed:8.0f} messages/s {events / elapsed:8.0f} events/s   "
+          f"stub CPU {stub_cpu:.2f}s = {events / stub_cpu:8.0f} events per CPU-second")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--internal-messages", type=int, default=2)
+    parser.add_argument("--stream-chunks", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, args.concurrency, args.internal_messages, args.stream_chunks))
@@ -0,0 +1,110 @@
+# bench_transport.py
+
+"""Compares the HTTP callback transport with the WebSocket transport.
+
+The stub bot (stub_bot.py) runs in a separate process and answers every
+message with a fixed sequence of events. For each transport the script sends
+the same number of messages over concurrent conversations and reports:
+
+- events/sec received by the client,
+- per-event latency from the stub sending an event to dispatch_event handling it.
+
+Usage:
+    python benchmarks/bench_transport.py --messages 500 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import basic_app  # noqa: E402
+from loadtest import LatencyHistogram  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_stub(port: int, callback_port: int, internal_messages: int):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "stub_bot.py"), "--port", str(port),
+         "--callback-url", f"http://127.0.0.1:{callback_port}/api/receive_message",
+         "--internal-messages", str(internal_messages)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    process.stdout.readline()  # Wait for the "listening" line
+    return process
+
+
+async def run_transport(name: str, stub_port: int, callback_port: int, messages: int, concurrency: int):
+    histogram = LatencyHistogram()
+    original_dispatch = basic_app.dispatch_event
+
+    def timed_dispatch(message: dict):
+        histogram.record((time.time() - message["sent_at"]) * 1000)
+        original_dispatch(message)
+
+    basic_app.LLM_NOTIFICATION_ENDPOINT = f"http://127.0.0.1:{stub_port}/api/get_generic_rest_notification"
+    basic_app.LLM_WEBSOCKET_ENDPOINT = f"ws://127.0.0.1:{stub_port}/ws"
+    basic_app.dispatch_event = timed_dispatch
+    basic_app.http_session = basic_app.create_http_session()
+    basic_app.transport = basic_app.create_transport(name)
+    server = None
+    if basic_app.transport.needs_callback_server:
+        server = await basic_app.start_callback_server("127.0.0.1", callback_port)
+    await basic_app.transport.start()
+
+    remaining = iter(range(messages))
+
+    async def user(user_index: int):
+        conversation = basic_app.register_conversation(basic_app.Conversation(f"bench-{name}-{user_index}", render=False))
+        for index in remaining:
+            timestamp = basic_app.generate_message_timestamp() + f"-{index}"
+            turn = conversation.expect_done(timestamp)
+            await basic_app.call_tested_llm(f"message {index}", target_thread_id=conversation.thread_id,
+                                            timestamp=timestamp)
+            await asyncio.wait_for(turn.future, 30)
+        basic_app.conversations.pop(conversation.thread_id, None)
+
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await basic_app.transport.close()
+        await basic_app.close_http_session()
+        basic_app.dispatch_event = original_dispatch
+        if server is not None:
+            await server.stop()
+
+    print(f"{name:<10} events={histogram.count:<7} {histogram.count / elapsed:9.0f} events/s   "
+          f"latency p50={histogram.percentile(50):6.2f} ms  p99={histogram.percentile(99):6.2f} ms")
+
+
+async def run(messages: int, concurrency: int, internal_messages: int):
+    stub_port, callback_port = free_port(), free_port()
+    stub = start_stub(stub_port, callback_port, internal_messages)
+    try:
+        for name in ("http", "websocket"):
+            await run_transport(name, stub_port, callback_port, messages, concurrency)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--internal-messages", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args.messages, args.concurrency, args.internal_messages))
@@ -0,0 +1,396 @@
+# suite.py
+
+"""Benchmark suite of the client's hot paths, with JSON results and baselines.
+
+Benchmarks (every one repeated --repeats times, or one sample per turn):
+
+- callback_throughput: events/s posted to /api/receive_message of the FastAPI
+  app, called in-process as an ASGI application (no network),
+- send_rate: call_tested_llm messages/s against a local endpoint accepting
+  every message with a 202,
+- print_cost: microseconds per print_with_timestamp line, console to /dev/null,
+- reaction_attach[N]: microseconds to attach a reaction to the last user message
+  of a history of N messages, through dispatch_event,
+- turn_latency: milliseconds from sending a message to its 'done' reaction,
+  against stub_bot.py running in a separate process.
+
+`run` writes the samples and their summary as JSON; `--save-baseline NAME`
+also stores them in benchmarks/baselines/NAME.json. `compare` checks a result
+against a baseline with a one-sided Mann-Whitney U test on the samples of
+every benchmark and exits with status 1 when one of them is significantly
+slower (p < --alpha) by more than --threshold of the baseline median.
+
+benchmarks/baselines/main.json was recorded on a single-CPU Linux machine;
+record your own with --save-baseline main before comparing on another one.
+
+Usage:
+    python benchmarks/suite.py run --output results.json --save-baseline main
+    python benchmarks/suite.py compare main results.json
+    python benchmarks/suite.py run --only send_rate print_cost --baseline main
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BASELINES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+sys.path.insert(0, ROOT)
+
+import basic_app  # noqa: E402
+
+BENCHMARKS = {}
+
+
+# Register a benchmark: its function returns the list of samples
+def benchmark(name: str, unit: str, higher_is_better: bool = False):
+    def register(function):
+        BENCHMARKS[name] = {"function": function, "unit": unit, "higher_is_better": higher_is_better}
+        return function
+    return register
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Call an ASGI application with one POST request, as uvicorn would
+async def asgi_post(asgi_app, path: str, body: bytes) -> int:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000),
+    }
+    status = 0
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if sent:
+            return {"type": "http.disconnect"}
+        sent = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await asgi_app(scope, receive, send)
+    return status
+
+
+@benchmark("callback_throughput", "events/s", higher_is_better=True)
+async def callback_throughput(args):
+    fastapi_app = basic_app.create_fastapi_app()
+    conversation = basic_app.register_conversation(basic_app.Conversation("bench-callbacks", render=False))
+    reactions = ("acknowledge", "processing", "writing")
+    samples = []
+    try:
+        for _ in range(args.repeats):
+            bodies = []
+            for index in range(args.events // 4):
+                timestamp = f"bench-{index}"
+                conversation.add_message("user", f"message {index}", timestamp)
+                bodies += [basic_app.json_dumps({"event_type": "REACTION_ADD", "reaction_name": reaction,
+                                                 "thread_id": conversation.thread_id, "timestamp": timestamp})
+                           for reaction in reactions]
+                bodies.append(basic_app.json_dumps({"event_type": "MESSAGE", "text": f"answer {index}",
+                                                    "thread_id": conversation.thread_id, "timestamp": timestamp}))
+            start = time.perf_counter()
+            for body in bodies:
+                await asgi_post(fastapi_app, "/api/receive_message", body)
+            samples.append(len(bodies) / (time.perf_counter() - start))
+            conversation.reset(conversation.thread_id)
+    finally:
+        basic_app.conversations.pop(conversation.thread_id, None)
+        conversation.close()
+    return samples
+
+
+@benchmark("send_rate", "messages/s", higher_is_better=True)
+async def send_rate(args):
+    from aiohttp import web
+
+    async def accept(request):
+        await request.read()
+        return web.json_response({"status": "accepted"}, status=202)
+
+    stub_app = web.Application()
+    stub_app.router.add_post("/api/get_generic_rest_notification", accept)
+    runner = web.AppRunner(stub_app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    basic_app.LLM_NOTIFICATION_ENDPOINT = f"http://127.0.0.1:{port}/api/get_generic_rest_notification"
+    basic_app.http_session = basic_app.create_http_session()
+    samples = []
+    try:
+        await basic_app.call_tested_llm("warm-up", target_thread_id="bench-send")
+        for _ in range(args.repeats):
+            start = time.perf_counter()
+            for index in range(args.messages):
+                await basic_app.call_tested_llm(f"benchmark message {index}", target_thread_id="bench-send")
+            samples.append(args.messages / (time.perf_counter() - start))
+    finally:
+        await basic_app.close_http_session()
+        await runner.cleanup()
+    return samples
+
+
+@benchmark("print_cost", "us/line")
+async def print_cost(args):
+    samples = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        for index in range(args.lines):
+            basic_app.print_with_timestamp("Assistant", f"benchmark line {index}")
+        samples.append((time.perf_counter() - start) / args.lines * 1e6)
+    return samples
+
+
+# Time reactions attached to the last user message of a history of the given size
+def reaction_attach(size: int):
+    async def measure(args):
+        conversation = basic_app.register_conversation(basic_app.Conversation(f"bench-history-{size}", render=False))
+        reactions = ("acknowledge", "processing", "writing")
+        samples = []
+        try:
+            for index in range(size - 1):
+                conversation.add_message("assistant_internal" if index % 10 else "user", f"message {index}",
+                                         f"history-{index}")
+            conversation.add_message("user", "last message", "bench-last")
+            events = [{"event_type": "REACTION_ADD", "reaction_name": reactions[index % 3],
+                       "thread_id": conversation.thread_id, "timestamp": "bench-last"}
+                      for index in range(args.reactions)]
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                for event in events:
+                    basic_app.dispatch_event(event)
+                samples.append((time.perf_counter() - start) / len(events) * 1e6)
+        finally:
+            basic_app.conversations.pop(conversation.thread_id, None)
+            conversation.close()
+        return samples
+    return measure
+
+
+@benchmark("turn_latency", "ms")
+async def turn_latency(args):
+    stub_port, callback_port = free_port(), free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "stub_bot.py"), "--port", str(stub_port),
+         "--callback-url", f"http://127.0.0.1:{callback_port}/api/receive_message"],
+        stdout=subprocess.PIPE, text=True,
+    )
+    stub.stdout.readline()  # Wait for the "listening" line
+    basic_app.LLM_NOTIFICATION_ENDPOINT = f"http://127.0.0.1:{stub_port}/api/get_generic_rest_notification"
+    basic_app.http_session = basic_app.create_http_session()
+    basic_app.transport = basic_app.create_transport("http")
+    server = await basic_app.start_callback_server("127.0.0.1", callback_port)
+    conversation = basic_app.register_conversation(basic_app.Conversation("bench-turns", render=False))
+    samples = []
+    try:
+        for index in range(args.turns + 1):
+            timestamp = basic_app.generate_message_timestamp() + f"-{index}"
+            turn = conversation.expect_done(timestamp)
+            conversation.add_message("user", f"message {index}", timestamp)
+            await basic_app.call_tested_llm(f"message {index}", target_thread_id=conversation.thread_id,
+                                            timestamp=timestamp)
+            if not await conversation.wait_done(turn, 30):
+                raise RuntimeError(f"turn {index} got no 'done' reaction")
+            if index:  # The first turn opens the connections
+                samples.append(turn.time_to_done * 1000)
+    finally:
+        basic_app.conversations.pop(conversation.thread_id, None)
+        conversation.close()
+        await basic_app.close_http_session()
+        await server.stop()
+        stub.terminate()
+        stub.wait()
+    return samples
+
+
+def summarize(samples) -> dict:
+    return {
+        "n": len(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "min": min(samples),
+        "max": max(samples),
+    }
+
+
+def git_commit():
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+async def run_benchmarks(args) -> dict:
+    basic_app.console.file = open(os.devnull, "w")
+    basic_app.show_internal_messages = True
+    for size in args.history_sizes:
+        BENCHMARKS[f"reaction_attach[{size}]"] = {"function": reaction_attach(size), "unit": "us/reaction",
+                                                  "higher_is_better": False}
+    selected = [name for name in BENCHMARKS
+                if not args.only or name in args.only or name.split("[")[0] in args.only]
+    results = {}
+    for name in selected:
+        spec = BENCHMARKS[name]
+        samples = await spec["function"](args)
+        results[name] = {"unit": spec["unit"], "higher_is_better": spec["higher_is_better"],
+                         "samples": samples, **summarize(samples)}
+        print(f"{name:<28} median={results[name]['median']:12.2f} {spec['unit']:<12} "
+              f"stdev={results[name]['stdev']:10.2f}  n={len(samples)}")
+    return {
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "json_backend": basic_app.json_backend,
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("command", "func")},
+        "benchmarks": results,
+    }
+
+
+def mann_whitney_greater(first, second) -> float:
+    """One-sided p-value that values of `first` tend to be greater than those of `second`.
+
+    Normal approximation with tie correction, good enough from about 8 samples per side.
+    """
+    ranked = sorted([(value, 0) for value in first] + [(value, 1) for value in second])
+    ranks = [0.0] * len(ranked)
+    ties = 0.0
+    start = 0
+    while start < len(ranked):
+        end = start
+        while end + 1 < len(ranked) and ranked[end + 1][0] == ranked[start][0]:
+            end += 1
+        for index in range(start, end + 1):
+            ranks[index] = (start + end) / 2 + 1
+        count = end - start + 1
+        ties += count ** 3 - count
+        start = end + 1
+    n1, n2 = len(first), len(second)
+    total = n1 + n2
+    u = sum(rank for rank, (_, group) in zip(ranks, ranked) if group == 0) - n1 * (n1 + 1) / 2
+    variance = n1 * n2 / 12 * ((total + 1) - ties / (total * (total - 1)))
+    if variance <= 0:
+        return 0.5
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)  # Continuity correction
+    return 1 - statistics.NormalDist().cdf(z)
+
+
+def compare(baseline: dict, current: dict, alpha: float, threshold: float) -> int:
+    """Prints every benchmark against the baseline; returns the number of regressions."""
+    regressions = 0
+    print(f"baseline {baseline.get('commit')} ({baseline.get('created')})  vs  "
+          f"current {current.get('commit')} ({current.get('created')})")
+    for name, result in current["benchmarks"].items():
+        reference = baseline["benchmarks"].get(name)
+        if reference is None:
+            print(f"{name:<28} no baseline")
+            continue
+        change = (result["median"] - reference["median"]) / reference["median"]
+        if result["higher_is_better"]:
+            slower, faster = reference["samples"], result["samples"]
+            worse = -change
+        else:
+            slower, faster = result["samples"], reference["samples"]
+            worse = change
+        p_slower = mann_whitney_greater(slower, faster)
+        p_faster = mann_whitney_greater(faster, slower)
+        if p_slower < alpha and worse > threshold:
+            verdict = "REGRESSION"
+            regressions += 1
+        elif p_faster < alpha and -worse > threshold:
+            verdict = "improved"
+        else:
+            verdict = "unchanged"
+        print(f"{name:<28} {reference['median']:12.2f} -> {result['median']:12.2f} {result['unit']:<12} "
+              f"{change:+7.1%}  p={min(p_slower, p_faster):.4f}  {verdict}")
+    return regressions
+
+
+# A baseline is given by name (benchmarks/baselines/NAME.json) or by path
+def load_results(reference: str) -> dict:
+    path = reference if os.path.exists(reference) else os.path.join(BASELINES_DIR, f"{reference}.json")
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def write_results(path: str, results: dict):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(results, file, indent=2)
+        file.write("\n")
+
+
+def run_command(args) -> int:
+    results = asyncio.run(run_benchmarks(args))
+    if args.output:
+        write_results(args.output, results)
+    if args.save_baseline:
+        write_results(os.path.join(BASELINES_DIR, f"{args.save_baseline}.json"), results)
+    if args.baseline:
+        return 1 if compare(load_results(args.baseline), results, args.alpha, args.threshold) else 0
+    return 0
+
+
+def compare_command(args) -> int:
+    return 1 if compare(load_results(args.baseline), load_results(args.current), args.alpha, args.threshold) else 0
+
+
+def add_compare_options(parser):
+    parser.add_argument("--alpha", type=float, default=0.01, help="Significance level of the test.")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Smallest slowdown reported, as a fraction of the baseline median.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks.")
+    run_parser.add_argument("--only", nargs="+", help="Benchmarks to run (reaction_attach runs every size).")
+    run_parser.add_argument("--repeats", type=int, default=15)
+    run_parser.add_argument("--events", type=int, default=4000, help="Callbacks per callback_throughput repeat.")
+    run_parser.add_argument("--messages", type=int, default=200, help="Messages per send_rate repeat.")
+    run_parser.add_argument("--lines", type=int, default=2000, help="Lines per print_cost repeat.")
+    run_parser.add_argument("--history-sizes", type=int, nargs="+", default=[1000, 100000])
+    run_parser.add_argument("--reactions", type=int, default=3000, help="Reactions per reaction_attach repeat.")
+    run_parser.add_argument("--turns", type=int, default=30, help="Turns of turn_latency, one sample each.")
+    run_parser.add_argument("--output", help="JSON file of the results.")
+    run_parser.add_argument("--save-baseline", metavar="NAME", help="Also store the results as a named baseline.")
+    run_parser.add_argument("--baseline", help="Compare with this baseline (name or path) after the run.")
+    add_compare_options(run_parser)
+    run_parser.set_defaults(func=run_command)
+
+    compare_parser = commands.add_parser("compare", help="Compare results with a baseline.")
+    compare_parser.add_argument("baseline", help="Baseline name or path.")
+    compare_parser.add_argument("current", help="Results name or path.")
+    add_compare_options(compare_parser)
+    compare_parser.set_defaults(func=compare_command)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
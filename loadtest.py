@@ -0,0 +1,379 @@
+# loadtest.py
+
+"""Headless load generation against a genaibot deployment.
+
+Every virtual conversation owns its own thread_id. It sends the scripted turns
+with the same payload as the interactive client and waits for the bot's 'done'
+reaction on /api/receive_message before sending the next turn.
+
+With several workers the conversations are sharded across processes. Each
+worker runs its own event loop and callback server on its own port, with a
+disjoint range of thread_ids, and sends its results back to the coordinator,
+which merges the histograms and error counts.
+"""
+
+import asyncio
+import json
+import math
+import multiprocessing
+import queue
+import random
+import time
+
+import basic_app
+
+# Coarse bucket upper bounds (ms) used when printing histograms
+DISPLAY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000, math.inf]
+
+
+# Fixed-bucket latency histogram, mergeable across runs
+class LatencyHistogram:
+    """Latency histogram with exponential buckets of about 5% resolution."""
+
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.counts = {}  # bucket index -> number of samples
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    @classmethod
+    def bucket_index(cls, value_ms: float) -> int:
+        if value_ms <= 1.0:
+            return 0
+        return int(math.ceil(math.log(value_ms) / math.log(cls.GROWTH)))
+
+    @classmethod
+    def bucket_upper_bound(cls, index: int) -> float:
+        return cls.GROWTH ** index
+
+    def record(self, value_ms: float):
+        index = self.bucket_index(value_ms)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += value_ms
+        self.min = min(self.min, value_ms)
+        self.max = max(self.max, value_ms)
+
+    def merge(self, other: "LatencyHistogram"):
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, pct: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(pct * self.count / 100))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.bucket_upper_bound(index), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def display_counts(self):
+        """Returns (upper bound, count) pairs over DISPLAY_BUCKETS_MS."""
+        display = [0] * len(DISPLAY_BUCKETS_MS)
+        for index, count in self.counts.items():
+            upper = self.bucket_upper_bound(index)
+            slot = next(i for i, bound in enumerate(DISPLAY_BUCKETS_MS) if upper <= bound)
+            display[slot] += count
+        return list(zip(DISPLAY_BUCKETS_MS, display))
+
+
+# Aggregated outcome of a load test run
+class LoadTestResults:
+    def __init__(self):
+        self.turn_histograms = []  # time to 'done', one histogram per turn index
+        self.first_token_histograms = []  # time to the first answer token, one histogram per turn index
+        self.errors = {}  # error kind -> count
+        self.turns_completed = 0
+        self.conversations_completed = 0
+        self.started_at = time.perf_counter()
+        self.finished_at = None
+        self.worker_duration = 0.0  # longest duration of the merged workers
+
+    def record_turn(self, turn_index: int, latency_ms: float, first_token_ms: float = None):
+        while len(self.turn_histograms) <= turn_index:
+            self.turn_histograms.append(LatencyHistogram())
+            self.first_token_histograms.append(LatencyHistogram())
+        self.turn_histograms[turn_index].record(latency_ms)
+        if first_token_ms is not None:
+            self.first_token_histograms[turn_index].record(first_token_ms)
+        self.turns_completed += 1
+
+    def record_error(self, kind: str):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def merge(self, other: "LoadTestResults"):
+        """Adds the results of another worker; the run lasts as long as the slowest worker."""
+        for histograms, other_histograms in ((self.turn_histograms, other.turn_histograms),
+                                             (self.first_token_histograms, other.first_token_histograms)):
+            while len(histograms) < len(other_histograms):
+                histograms.append(LatencyHistogram())
+            for histogram, other_histogram in zip(histograms, other_histograms):
+                histogram.merge(other_histogram)
+        for kind, count in other.errors.items():
+            self.errors[kind] = self.errors.get(kind, 0) + count
+        self.turns_completed += other.turns_completed
+        self.conversations_completed += other.conversations_completed
+        self.worker_duration = max(self.worker_duration, other.duration)
+        self.finished_at = self.started_at + self.worker_duration
+
+    @property
+    def duration(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.perf_counter()
+        return end - self.started_at
+
+
+# Function to read the scripted user turns
+def load_script(path: str):
+    """Reads user turns from a .jsonl file ({"text": ...} per line) or a plain text file."""
+    turns = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                turns.append(json.loads(line)["text"])
+            else:
+                turns.append(line)
+    return turns
+
+
+# Function to play every scripted turn of one virtual conversation
+async def run_conversation(conversation, turns, session, results: LoadTestResults,
+                           turn_timeout: float, think_time: float = 0.0):
+    basic_app.register_conversation(conversation)
+    try:
+        for turn_index, text in enumerate(turns):
+            timestamp = basic_app.generate_message_timestamp()
+            conversation.add_message("user", text, timestamp)
+            turn = conversation.expect_done(timestamp)
+            sent = await basic_app.call_tested_llm(
+                text, session=session, target_thread_id=conversation.thread_id, timestamp=timestamp
+            )
+            if not sent:
+                conversation.abandon(turn, "send_error")
+                results.record_error("send_failed")
+                return
+            if not await conversation.wait_done(turn, turn_timeout):
+                results.record_error("timeout")
+                return
+            results.record_turn(turn_index, turn.time_to_done * 1000, turn.time_to_first_token * 1000)
+            if think_time:
+                await asyncio.sleep(think_time)
+        results.conversations_completed += 1
+    finally:
+        basic_app.conversations.pop(conversation.thread_id, None)
+        conversation.close()
+
+
+# Function to run all virtual conversations with the requested arrival model
+async def drive_conversations(turns, session, results: LoadTestResults, conversations: int, mode: str,
+                              concurrency: int, rate: float, think_time: float, turn_timeout: float,
+                              thread_prefix: str):
+    def new_conversation(index: int):
+        return basic_app.Conversation(f"{thread_prefix}-{index}", render=False)
+
+    if mode == "closed":
+        # Closed loop: a fixed number of users, each starting a new conversation when the previous ends
+        next_index = iter(range(conversations))
+
+        async def user():
+            for index in next_index:
+                await run_conversation(new_conversation(index), turns, session, results, turn_timeout, think_time)
+
+        await asyncio.gather(*(user() for _ in range(min(concurrency, conversations))))
+    else:
+        # Open loop: conversations arrive as a Poisson process regardless of completions
+        tasks = []
+        for index in range(conversations):
+            tasks.append(asyncio.create_task(
+                run_conversation(new_conversation(index), turns, session, results, turn_timeout, think_time)
+            ))
+            await asyncio.sleep(random.expovariate(rate))
+        await asyncio.gather(*tasks)
+
+
+# Function to print the load test report
+def print_report(results: LoadTestResults):
+    console = basic_app.console
+    duration = results.duration
+    basic_app.print_with_timestamp("System", "Load test finished.")
+    console.print(f"  Duration:                {duration:.2f} s")
+    console.print(f"  Conversations completed: {results.conversations_completed}")
+    console.print(f"  Turns completed:         {results.turns_completed}")
+    console.print(f"  Throughput:              {results.turns_completed / duration if duration else 0:.2f} turns/s")
+    for kind, count in sorted(results.errors.items()):
+        console.print(f"  Errors ({kind}): {count}", style="error")
+
+    for turn_index, histogram in enumerate(results.turn_histograms, 1):
+        first_token = results.first_token_histograms[turn_index - 1]
+        console.print(
+            f"\nTurn {turn_index}: n={histogram.count} "
+            f"p50={histogram.percentile(50):.0f}ms p95={histogram.percentile(95):.0f}ms "
+            f"p99={histogram.percentile(99):.0f}ms max={histogram.max:.0f}ms",
+            style="system",
+        )
+        console.print(
+            f"  first token: p50={first_token.percentile(50):.0f}ms p95={first_token.percentile(95):.0f}ms "
+            f"p99={first_token.percentile(99):.0f}ms"
+        )
+        peak = max((count for _, count in histogram.display_counts()), default=0)
+        for bound, count in histogram.display_counts():
+            if not count:
+                continue
+            label = "> 60000" if bound == math.inf else f"<= {bound}"
+            bar = "█" * max(1, round(40 * count / peak))
+            console.print(f"  {label:>9} ms | {bar} {count}")
+
+
+# Function to run conversations behind one callback server and return their results
+async def run_shard(turns, conversations: int, mode: str, concurrency: int, rate: float, think_time: float,
+                    turn_timeout: float, callback_port: int, thread_prefix: str, callback_url: str = None):
+    if callback_url:
+        basic_app.CALLBACK_URL = callback_url
+    server = await basic_app.start_callback_server(port=callback_port)
+    session = basic_app.create_http_session()
+    results = LoadTestResults()
+    try:
+        await drive_conversations(
+            turns, session, results,
+            conversations=conversations,
+            mode=mode,
+            concurrency=concurrency,
+            rate=rate,
+            think_time=think_time,
+            turn_timeout=turn_timeout,
+            thread_prefix=thread_prefix,
+        )
+        results.finished_at = time.perf_counter()
+    finally:
+        await session.close()
+        await server.stop()
+    return results
+
+
+# Function to split the conversations, concurrency and arrival rate between workers
+def shard_plan(workers: int, conversations: int, concurrency: int, rate: float):
+    """Returns one (conversations, concurrency, rate) tuple per worker that has conversations to run."""
+    workers = max(1, min(workers, conversations))
+    plan = []
+    for index in range(workers):
+        share = conversations // workers + (index < conversations % workers)
+        users = concurrency // workers + (index < concurrency % workers)
+        plan.append((share, max(1, users), rate / workers))
+    return plan
+
+
+# Entry point of a worker process
+def run_worker(index: int, results_queue, shard: dict):
+    try:
+        results = asyncio.run(run_shard(**shard))
+        results_queue.put((index, results, None))
+    except BaseException as e:
+        results_queue.put((index, None, f"{type(e).__name__}: {e}"))
+
+
+# Function to run the load test in several worker processes and merge their results
+def run_sharded_loadtest(script: str, workers: int, conversations: int = 100, mode: str = "closed",
+                         concurrency: int = 10, rate: float = 5.0, think_time: float = 0.0,
+                         turn_timeout: float = 60.0, callback_port: int = None, callback_host: str = "127.0.0.1"):
+    turns = load_script(script)
+    if not turns:
+        basic_app.print_with_timestamp("Error", f"No turns found in {script}.")
+        return None
+
+    base_port = callback_port or basic_app.CALLBACK_PORT
+    run_prefix = f"loadtest-{basic_app.generate_thread_id()}"
+    plan = shard_plan(workers, conversations, concurrency, rate)
+    basic_app.print_with_timestamp(
+        "System",
+        f"Running {conversations} conversations of {len(turns)} turns ({mode} loop) in {len(plan)} worker "
+        f"processes (callback ports {base_port}-{base_port + len(plan) - 1}) against "
+        f"{basic_app.LLM_NOTIFICATION_ENDPOINT}.",
+    )
+
+    # Workers are forked when the platform allows it, so they start without re-importing anything
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    results_queue = context.Queue()
+    processes = []
+    for index, (share, users, worker_rate) in enumerate(plan):
+        port = base_port + index
+        shard = {
+            "turns": turns,
+            "conversations": share,
+            "mode": mode,
+            "concurrency": users,
+            "rate": worker_rate,
+            "think_time": think_time,
+            "turn_timeout": turn_timeout,
+            "callback_port": port,
+            "thread_prefix": f"{run_prefix}-w{index}",
+            "callback_url": f"http://{callback_host}:{port}/api/receive_message",
+        }
+        process = context.Process(target=run_worker, args=(index, results_queue, shard), daemon=True)
+        process.start()
+        processes.append(process)
+
+    results = LoadTestResults()
+    received = 0
+    while received < len(processes):
+        try:
+            index, worker_results, error = results_queue.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                results.record_error("worker_lost")
+                break
+            continue
+        received += 1
+        if error is not None:
+            basic_app.print_with_timestamp("Error", f"Worker {index} failed: {error}")
+            results.record_error("worker_failed")
+        else:
+            results.merge(worker_results)
+    for process in processes:
+        process.join()
+
+    print_report(results)
+    return results
+
+
+# Entry point used by the `loadtest` Typer command
+async def run_loadtest(script: str, conversations: int = 100, mode: str = "closed", concurrency: int = 10,
+                       rate: float = 5.0, think_time: float = 0.0, turn_timeout: float = 60.0,
+                       callback_port: int = None):
+    turns = load_script(script)
+    if not turns:
+        basic_app.print_with_timestamp("Error", f"No turns found in {script}.")
+        return None
+
+    basic_app.print_with_timestamp(
+        "System",
+        f"Running {conversations} conversations of {len(turns)} turns ({mode} loop) against "
+        f"{basic_app.LLM_NOTIFICATION_ENDPOINT}.",
+    )
+    results = await run_shard(
+        turns,
+        conversations=conversations,
+        mode=mode,
+        concurrency=concurrency,
+        rate=rate,
+        think_time=think_time,
+        turn_timeout=turn_timeout,
+        callback_port=callback_port,
+        thread_prefix=f"loadtest-{basic_app.generate_thread_id()}",
+    )
+    print_report(results)
+    return results
@@ -0,0 +1,173 @@
+# replay.py
+
+"""Non-interactive replay of scripted transcripts through the bot.
+
+Each transcript file is played in its own thread_id, turn by turn, through
+basic_app.call_tested_llm; several transcripts run in parallel. Every user
+message, assistant message, internal message and reaction is written to an
+output JSONL file together with its time since the turn was sent, followed by
+one "turn" record with the outcome and the phase timings of the turn.
+
+Transcripts are read as a stream, so their size does not matter:
+
+- .jsonl: one object per line, {"text": "..."} for a user turn or
+  {"prompt": "name"} to load a system prompt with load_system_prompt,
+- .yaml/.yml: a stream of documents separated by ---, each one a turn (a
+  string or a mapping as above) or a list of turns. Needs PyYAML.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import basic_app
+
+
+# Function to yield the entries of a transcript one at a time
+def iter_transcript(path: str):
+    """Yields {"text": ...} or {"prompt": ...} entries without reading the whole file."""
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("YAML transcripts need PyYAML (pip install pyyaml).")
+        with open(path, "r", encoding="utf-8") as file:
+            for document in yaml.safe_load_all(file):
+                for entry in document if isinstance(document, list) else [document]:
+                    if entry is not None:
+                        yield {"text": entry} if isinstance(entry, str) else entry
+        return
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+# Output file shared by every transcript
+class ReplayRecorder:
+    """Appends one JSON record per line; all writers run on the same event loop."""
+
+    def __init__(self, path: str):
+        self.file = open(path, "w", encoding="utf-8")
+        self.records = 0
+
+    def write(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False))
+        self.file.write("\n")
+        self.records += 1
+
+    def close(self):
+        self.file.close()
+
+
+# Function to play one transcript in its own conversation
+async def replay_transcript(path: str, thread_id: str, recorder: ReplayRecorder, turn_timeout: float,
+                            prompt_name: str = None):
+    """Returns the number of turns played and how many of them failed."""
+    transcript = os.path.basename(path)
+    conversation = basic_app.register_conversation(basic_app.Conversation(thread_id, render=False))
+    state = {"turn": None, "index": -1}
+
+    def observe(kind: str, value: str):
+        turn = state["turn"]
+        record = {"transcript": transcript, "thread_id": thread_id, "turn": state["index"], "type": kind}
+        record["reaction" if kind == "reaction" else "text"] = value
+        record["elapsed"] = round(time.monotonic() - turn.sent_at, 6) if turn is not None else None
+        recorder.write(record)
+
+    def load_prompt(name: str):
+        system_prompt = basic_app.load_system_prompt(name)
+        if system_prompt:
+            conversation.add_message("system", system_prompt)
+        else:
+            recorder.write({"transcript": transcript, "thread_id": thread_id, "type": "error",
+                            "text": f"Prompt '{name}' not found."})
+
+    conversation.observer = observe
+    played = failed = 0
+    try:
+        if prompt_name:
+            load_prompt(prompt_name)
+        for entry in iter_transcript(path):
+            if "prompt" in entry:
+                load_prompt(entry["prompt"])
+                continue
+            text = entry["text"]
+            timestamp = basic_app.generate_message_timestamp()
+            state["turn"] = turn = conversation.expect_done(timestamp)
+            state["index"] += 1
+            conversation.add_message("user", text, timestamp)
+
+            if not await basic_app.call_tested_llm(text, target_thread_id=thread_id, timestamp=timestamp):
+                conversation.abandon(turn, "send_error")
+                status = "send_error"
+            elif await conversation.wait_done(turn, turn_timeout):
+                status = "done"
+            else:
+                status = "timeout"
+            played += 1
+            failed += status != "done"
+            recorder.write({
+                "transcript": transcript,
+                "thread_id": thread_id,
+                "turn": state["index"],
+                "type": "turn",
+                "status": status,
+                "time_to_first_token": turn.time_to_first_token,
+                "time_to_done": turn.time_to_done,
+                "phases": dict(turn.phases()),
+            })
+    finally:
+        basic_app.conversations.pop(thread_id, None)
+        conversation.close()
+    return played, failed
+
+
+# Entry point used by the `replay` Typer command
+async def run_replay(transcripts, output: str = "replay.jsonl", parallel: int = 4, prompt_name: str = None,
+                     transport_name: str = "http", turn_timeout: float = 60.0, callback_port: int = None):
+    missing = [path for path in transcripts if not os.path.exists(path)]
+    if missing:
+        basic_app.print_with_timestamp("Error", f"Transcript not found: {', '.join(missing)}")
+        return None
+
+    basic_app.transport = basic_app.create_transport(transport_name)
+    server = None
+    if basic_app.transport.needs_callback_server:
+        server = await basic_app.start_callback_server(port=callback_port)
+    basic_app.http_session = basic_app.create_http_session()
+    recorder = ReplayRecorder(output)
+    semaphore = asyncio.Semaphore(max(1, parallel))
+    run_id = basic_app.generate_thread_id()
+
+    async def limited(index: int, path: str):
+        async with semaphore:
+            return await replay_transcript(path, f"replay-{run_id}-{index}", recorder, turn_timeout, prompt_name)
+
+    basic_app.print_with_timestamp(
+        "System", f"Replaying {len(transcripts)} transcripts ({parallel} at a time) into {output}."
+    )
+    try:
+        await basic_app.transport.start()
+        results = await asyncio.gather(*(limited(index, path) for index, path in enumerate(transcripts)),
+                                       return_exceptions=True)
+    finally:
+        recorder.close()
+        await basic_app.transport.close()
+        await basic_app.close_http_session()
+        if server is not None:
+            await server.stop()
+
+    played = failed = 0
+    for path, result in zip(transcripts, results):
+        if isinstance(result, Exception):
+            basic_app.print_with_timestamp("Error", f"{path}: {result}")
+            continue
+        played += result[0]
+        failed += result[1]
+    basic_app.print_with_timestamp(
+        "System", f"Replayed {played} turns, {failed} failed; {recorder.records} records written to {output}."
+    )
+    return played, failed
@@ -0,0 +1,404 @@
+# stub_bot.py
+
+"""Local stand-in for a Genaibot deployment, for offline tests and benchmarks.
+
+The stub accepts the payload sent by basic_app.call_tested_llm on both
+transports and answers every user message with an event sequence. By default
+it sends the 'acknowledge' and 'processing' reactions, some internal messages,
+an answer echoing the user text, then the 'done' reaction.
+
+- HTTP: POST /api/get_generic_rest_notification, events are POSTed back to
+  the client's /api/receive_message callback URL (the payload's callback_url
+  when present, so load test workers on different ports get their own events).
+- WebSocket: GET /ws, payloads and events are JSON text frames.
+
+Everything about the answer can be programmed, see StubProfile:
+- the reactions sent before the answer,
+- the number and size of the internal messages,
+- the size of the answer, and whether it is streamed in MESSAGE_DELTA chunks,
+- the delay before answering and its jitter, and the pause between events,
+- the rate of messages rejected with a 500 (HTTP) or never answered,
+- or a whole custom sequence read from a JSON file (--sequence).
+
+Events are encoded with orjson when it is installed and posted by a minimal
+HTTP/1.1 client over keep-alive connections (CallbackClient), so one stub
+process sustains thousands of events per second and benchmarks measure the
+client rather than the stub.
+
+Usage:
+    python stub_bot.py --port 8001 --callback-url http://localhost:8000/api/receive_message
+    python stub_bot.py --reactions acknowledge,processing,writing --stream-chunks 20 --answer-size 2000 \
+        --delay 0.2 --jitter 0.1 --failure-rate 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import urllib.parse
+
+import aiohttp
+from aiohttp import web
+
+try:
+    import orjson
+
+    def dumps(value) -> bytes:
+        return orjson.dumps(value)
+except ImportError:
+    def dumps(value) -> bytes:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+# Largest payload accepted, attachments included
+MAX_PAYLOAD_SIZE = 1024 ** 3
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+# Keep-alive HTTP/1.1 connections posting events to one callback URL
+class CallbackClient:
+    """Posts JSON bodies to a plain-HTTP URL and returns the response status.
+
+    Each pooled connection carries one request at a time. This is all the
+    stub needs, and costs several times less per request than aiohttp's
+    client, which would otherwise dominate the stub's CPU time.
+    """
+
+    def __init__(self, url: str, connections: int):
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        self.head = (f"POST {target} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: ").encode("latin-1")
+        self.idle = []  # (reader, writer) of the connections waiting for a request
+        self.slots = asyncio.Semaphore(connections)
+
+    async def post(self, body: bytes) -> int:
+        async with self.slots:
+            reused = bool(self.idle)
+            connection = self.idle.pop() if reused else await asyncio.open_connection(self.host, self.port)
+            try:
+                status, keep_alive = await self._exchange(connection, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection[1].close()
+                if not reused:
+                    raise
+                # The server closed the idle connection: retry once on a new one
+                connection = await asyncio.open_connection(self.host, self.port)
+                status, keep_alive = await self._exchange(connection, body)
+            if keep_alive:
+                self.idle.append(connection)
+            else:
+                connection[1].close()
+            return status
+
+    async def _exchange(self, connection, body: bytes):
+        reader, writer = connection
+        writer.write(b"%s%d\r\n\r\n%s" % (self.head, len(body), body))
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed before the response")
+        length, chunked, keep_alive = 0, False, True
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.partition(b":")
+            name, value = name.strip().lower(), value.strip().lower()
+            if name == b"content-length":
+                length = int(value)
+            elif name == b"transfer-encoding":
+                chunked = b"chunked" in value
+            elif name == b"connection":
+                keep_alive = value != b"close"
+        if chunked:
+            while size := int((await reader.readline()).split(b";")[0], 16):
+                await reader.readexactly(size + 2)
+            await reader.readline()
+        elif length:
+            await reader.readexactly(length)
+        return int(status_line.split()[1]), keep_alive
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+
+# How the stub answers each message
+class StubProfile:
+    """Programmable answer: event sequence, sizes, timing and failures.
+
+    A custom sequence is a list of steps, each one of {"reaction": name},
+    {"internal": text}, {"message": text} or {"delay": seconds}. "{text}" in
+    a message or internal text is replaced by the user text.
+    """
+
+    def __init__(self, internal_messages: int = 2, reactions=("acknowledge", "processing"), internal_size: int = 0,
+                 answer_size: int = 0, stream_chunks: int = 0, delay: float = 0.0, jitter: float = 0.0,
+                 event_delay: float = 0.0, failure_rate: float = 0.0, drop_rate: float = 0.0, sequence: list = None,
+                 seed: int = None):
+        self.internal_messages = internal_messages
+        self.reactions = tuple(reactions)
+        self.internal_size = internal_size  # Minimum characters of each internal message
+        self.answer_size = answer_size  # Minimum characters of the answer
+        self.stream_chunks = stream_chunks  # MESSAGE_DELTA events carrying the answer (0 = one MESSAGE)
+        self.delay = delay  # Seconds before answering each message
+        self.jitter = jitter  # Up to this many seconds added to or removed from the delay
+        self.event_delay = event_delay  # Seconds between two events of an answer
+        self.failure_rate = failure_rate  # Fraction of messages rejected with a 500 (HTTP only)
+        self.drop_rate = drop_rate  # Fraction of accepted messages never answered
+        self.sequence = sequence
+        self.random = random.Random(seed)
+
+    def answer_delay(self) -> float:
+        if not self.jitter:
+            return self.delay
+        return max(0.0, self.delay + self.random.uniform(-self.jitter, self.jitter))
+
+    def fails(self) -> bool:
+        return self.failure_rate > 0 and self.random.random() < self.failure_rate
+
+    def drops(self) -> bool:
+        return self.drop_rate > 0 and self.random.random() < self.drop_rate
+
+    def steps(self, text: str):
+        """Returns the steps answering a user text."""
+        if self.sequence is not None:
+            return self.sequence
+        steps = [{"reaction": name} for name in self.reactions]
+        steps += [{"internal": pad(f"Internal step {index + 1}", self.internal_size)}
+                  for index in range(self.internal_messages)]
+        steps.append({"message": pad(f"Echo: {text}", self.answer_size)})
+        steps.append({"reaction": "done"})
+        return steps
+
+
+# Function to lengthen a text to at least size characters
+def pad(text: str, size: int) -> str:
+    return text if len(text) >= size else text + " " + "x" * (size - len(text) - 1)
+
+
+# Function to split a text into count chunks
+def split_chunks(text: str, count: int):
+    size = max(1, -(-len(text) // count))
+    return [text[start:start + size] for start in range(0, len(text), size)] or [""]
+
+
+# Function to build the events answering one user message
+def build_events(payload: dict, internal_messages: int = 2, profile: StubProfile = None):
+    profile = profile or StubProfile(internal_messages)
+    base = {
+        "channel_id": payload.get("channel_id", 1),
+        "thread_id": payload.get("thread_id"),
+        "timestamp": payload.get("timestamp"),
+        "response_id": payload.get("response_id", 1),
+        "is_internal": False,
+    }
+    text = payload.get("text", "")
+    events = []
+    for step in profile.steps(text):
+        if "reaction" in step:
+            events.append({**base, "event_type": "REACTION_ADD", "reaction_name": step["reaction"]})
+        elif "internal" in step:
+            events.append({**base, "event_type": "MESSAGE", "text": step["internal"].replace("{text}", text),
+                           "is_internal": True})
+        elif "message" in step:
+            answer = step["message"].replace("{text}", text) + attachments_summary(payload)
+            if profile.stream_chunks:
+                message_id = f"{base['thread_id']}:{base['timestamp']}:{len(events)}"
+                events.extend({**base, "event_type": "MESSAGE_DELTA", "message_id": message_id, "text": chunk}
+                              for chunk in split_chunks(answer, profile.stream_chunks))
+                events.append({**base, "event_type": "MESSAGE_END", "message_id": message_id})
+            else:
+                events.append({**base, "event_type": "MESSAGE", "text": answer})
+        elif "delay" in step:
+            events.append({"delay": step["delay"]})
+    return events
+
+
+# Function to describe the attachments of a payload in the answer
+def attachments_summary(payload: dict) -> str:
+    files, images = payload.get("files_content") or [], payload.get("images") or []
+    if not files and not images:
+        return ""
+    encoded_size = sum(len(item) for item in files + images)
+    return f" [{len(files)} files, {len(images)} images, {encoded_size} base64 characters]"
+
+
+# The stub bot and its two transports
+class StubBot:
+    def __init__(self, callback_url: str = None, internal_messages: int = 2, delay: float = 0.0,
+                 profile: StubProfile = None, connections: int = 100):
+        self.callback_url = callback_url
+        self.profile = profile or StubProfile(internal_messages, delay=delay)
+        self.connections = connections  # Keep-alive connections to the callback URLs
+        self.session = None  # For https callback URLs
+        self.clients = {}  # plain-HTTP callback URL -> CallbackClient
+        self.received = 0  # User messages accepted
+        self.duplicates = 0  # Retried messages dropped thanks to their idempotency key
+        self.failed = 0  # Messages rejected on purpose (failure_rate)
+        self.dropped = 0  # Messages accepted but never answered (drop_rate)
+        self.events_sent = 0
+        self.seen_keys = set()
+        self.tasks = set()
+
+    async def _events_for(self, payload: dict):
+        delay = self.profile.answer_delay()
+        if delay:
+            await asyncio.sleep(delay)
+        for index, event in enumerate(build_events(payload, profile=self.profile)):
+            if "delay" in event:
+                await asyncio.sleep(event["delay"])
+                continue
+            if index and self.profile.event_delay:
+                await asyncio.sleep(self.profile.event_delay)
+            event["sent_at"] = time.time()
+            self.events_sent += 1
+            yield dumps(event)
+
+    def _is_duplicate(self, payload: dict) -> bool:
+        key = payload.get("idempotency_key")
+        if key is None:
+            return False
+        if key in self.seen_keys:
+            self.duplicates += 1
+            return True
+        self.seen_keys.add(key)
+        return False
+
+    def _answer(self, reply):
+        """Runs a reply in the background unless the profile drops this message."""
+        if self.profile.drops():
+            self.dropped += 1
+            reply.close()
+            return
+        task = asyncio.get_running_loop().create_task(reply)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def handle_message(self, request):
+        payload = json.loads(await request.read())
+        if self.profile.fails():
+            self.failed += 1
+            return web.json_response({"status": "error"}, status=500)
+        if self._is_duplicate(payload):
+            return web.json_response({"status": "duplicate"}, status=409)
+        self.received += 1
+        self._answer(self._reply_http(payload))
+        return web.json_response({"status": "accepted"}, status=202)
+
+    async def _reply_http(self, payload: dict):
+        callback_url = payload.get("callback_url") or self.callback_url
+        if not callback_url.startswith("http://"):
+            async for body in self._events_for(payload):
+                async with self.session.post(callback_url, data=body, headers=JSON_HEADERS) as response:
+                    await response.read()
+            return
+        client = self.clients.get(callback_url)
+        if client is None:
+            client = self.clients[callback_url] = CallbackClient(callback_url, self.connections)
+        async for body in self._events_for(payload):
+            await client.post(body)
+
+    async def handle_websocket(self, request):
+        websocket = web.WebSocketResponse(max_msg_size=MAX_PAYLOAD_SIZE)
+        await websocket.prepare(request)
+        async for frame in websocket:
+            if frame.type == aiohttp.WSMsgType.TEXT:
+                payload = json.loads(frame.data)
+                if self._is_duplicate(payload):
+                    continue
+                self.received += 1
+                self._answer(self._reply_websocket(websocket, payload))
+        return websocket
+
+    async def _reply_websocket(self, websocket, payload: dict):
+        async for body in self._events_for(payload):
+            await websocket.send_str(body.decode("utf-8"))
+
+    async def _open_session(self, app):
+        self.session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connections))
+
+    async def _close_session(self, app):
+        for task in list(self.tasks):
+            task.cancel()
+        for client in self.clients.values():
+            client.close()
+        await self.session.close()
+
+    def make_app(self) -> web.Application:
+        app = web.Application(client_max_size=MAX_PAYLOAD_SIZE)
+        app.router.add_post("/api/get_generic_rest_notification", self.handle_message)
+        app.router.add_get("/ws", self.handle_websocket)
+        app.on_startup.append(self._open_session)
+        app.on_cleanup.append(self._close_session)
+        return app
+
+
+# Function to serve the stub on the running event loop; returns the runner and the bound port
+async def start_stub_bot(bot: StubBot, host: str = "127.0.0.1", port: int = 0, reuse_port: bool = False):
+    runner = web.AppRunner(bot.make_app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port, reuse_port=reuse_port or None)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+async def serve(host: str, port: int, callback_url: str, profile: StubProfile, reuse_port: bool = False,
+                connections: int = 100):
+    bot = StubBot(callback_url, profile=profile, connections=connections)
+    runner, bound_port = await start_stub_bot(bot, host, port, reuse_port)
+    print(f"Stub bot listening on http://{host}:{bound_port} (ws://{host}:{bound_port}/ws)", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--callback-url", default="http://localhost:8000/api/receive_message")
+    parser.add_argument("--reactions", default="acknowledge,processing",
+                        help="Comma-separated reactions sent before the answer ('done' always ends it).")
+    parser.add_argument("--internal-messages", type=int, default=2, help="Internal messages per answer.")
+    parser.add_argument("--internal-size", type=int, default=0, help="Minimum characters of each internal message.")
+    parser.add_argument("--answer-size", type=int, default=0, help="Minimum characters of the answer.")
+    parser.add_argument("--stream-chunks", type=int, default=0,
+                        help="Send the answer as this many MESSAGE_DELTA events and a MESSAGE_END.")
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds before answering each message.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many seconds added to or removed from --delay.")
+    parser.add_argument("--event-delay", type=float, default=0.0, help="Seconds between two events of an answer.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of messages rejected with a 500.")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of messages never answered.")
+    parser.add_argument("--sequence", help="JSON file with the list of steps of every answer, see StubProfile.")
+    parser.add_argument("--seed", type=int, help="Seed of the jitter, failure and drop draws.")
+    parser.add_argument("--connections", type=int, default=100, help="Keep-alive connections to the callback URLs.")
+    parser.add_argument("--reuse-port", action="store_true",
+                        help="Share the port with other stub processes (SO_REUSEPORT) to spread the load.")
+    args = parser.parse_args()
+    sequence = None
+    if args.sequence:
+        with open(args.sequence, "r", encoding="utf-8") as file:
+            sequence = json.load(file)
+    profile = StubProfile(
+        internal_messages=args.internal_messages,
+        reactions=[name for name in args.reactions.split(",") if name],
+        internal_size=args.internal_size,
+        answer_size=args.answer_size,
+        stream_chunks=args.stream_chunks,
+        delay=args.delay,
+        jitter=args.jitter,
+        event_delay=args.event_delay,
+        failure_rate=args.failure_rate,
+        drop_rate=args.drop_rate,
+        sequence=sequence,
+        seed=args.seed,
+    )
+    try:
+        asyncio.run(serve(args.host, args.port, args.callback_url, profile, args.reuse_port, args.connections))
+    except KeyboardInterrupt:
+        pass
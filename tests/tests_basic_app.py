@@ -9,6 +9,7 @@ from fastapi.testclient import TestClient
 from prompt_toolkit.completion import Completion  
 from basic_app import call_tested_llm, thread_id, LLM_NOTIFICATION_ENDPOINT  
 import contextlib  
+import json
 
 # Import the necessary components from your main script  
 from basic_app import (  
@@ -17,17 +18,34 @@ from basic_app import (
     fastapi_app,  
     conversation_history,  
     call_tested_llm,  
-    done_reaction_received,  
     REACTION_EMOJI_MAP,  
     print_with_timestamp,  
     reset_conversation,  
     show_last_internal_messages,  
     main,  
-    start_uvicorn,  
+    start_callback_server,
+    CallbackServer,
     CommandCompleter,  
     COMMANDS,  
+    PromptRegistry,
+    create_http_session,
+    HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST,
     thread_id,  
-    last_user_message_index,  
+    Conversation,
+    MessageStore,
+    RingBufferHandler,
+    export_conversation,
+    StreamRenderer,
+    create_transport,
+    HttpCallbackTransport,
+    WebSocketTransport,
+    conversations,
+    active_conversation,
+    register_conversation,
+    Turn,
+    TurnStats,
+    create_fastapi_app,
 )  
   
 @pytest.fixture  
@@ -54,18 +72,126 @@ def test_load_system_prompt_existing(tmp_path):
     prompt_file = prompts_dir / f"{prompt_name}.txt"  
     prompt_file.write_text(prompt_content, encoding="utf-8")  
       
-    with patch('os.path.exists', return_value=True), \
-         patch('os.path.join', return_value=str(prompt_file)):  
+    with patch('basic_app.prompt_registry', PromptRegistry(str(prompts_dir))):  
         loaded_prompt = load_system_prompt(prompt_name)  
         assert loaded_prompt == prompt_content  
   
 # Test the load_system_prompt function with a non-existing prompt  
-def test_load_system_prompt_non_existing():  
+def test_load_system_prompt_non_existing(tmp_path):  
     prompt_name = "non_existing_prompt"  
-    with patch('os.path.exists', return_value=False):  
+    with patch('basic_app.prompt_registry', PromptRegistry(str(tmp_path / "prompts"))):  
         loaded_prompt = load_system_prompt(prompt_name)  
         assert loaded_prompt is None  
+
+# Test that prompts are cached until their file changes and that new prompts are picked up
+def test_prompt_registry_cache_and_reload(tmp_path):
+    import os
+    registry = PromptRegistry(str(tmp_path), mmap_threshold=100)
+    (tmp_path / "alpha.txt").write_text(" First version ", encoding="utf-8")
+    (tmp_path / "big.txt").write_text("x" * 200 + "\n", encoding="utf-8")
+    (tmp_path / "notes.md").write_text("Not a prompt", encoding="utf-8")
+    assert registry.names() == ["alpha", "big"]
+    assert registry.get("alpha") == "First version"
+    with patch('builtins.open', side_effect=AssertionError("read again")):
+        assert registry.get("alpha") == "First version"  # Served from the cache
+    assert registry.get("big") == "x" * 200
+    assert type(registry.cache["big"][1]).__name__ == "mmap"
+
+    (tmp_path / "alpha.txt").write_text("Second version, longer", encoding="utf-8")
+    assert registry.get("alpha") == "Second version, longer"
+    (tmp_path / "beta.txt").write_text("New prompt", encoding="utf-8")
+    assert registry.get("beta") == "New prompt"
+    assert registry.names("b") == ["beta", "big"]
+    os.remove(tmp_path / "big.txt")
+    assert registry.scan(force=True) and "big" not in registry.cache
+    assert registry.get("big") is None
+    registry.close()
+
+# Test that names are listed from another thread while the cache changes, and that main unmaps the cache on exit
+@pytest.mark.asyncio
+async def test_prompt_registry_threads_and_close(tmp_path):
+    import io
+    import threading
+    registry = PromptRegistry(str(tmp_path), mmap_threshold=10)
+    for index in range(20):
+        (tmp_path / f"p{index}.txt").write_text("x" * 20, encoding="utf-8")
+    stop, errors = threading.Event(), []
+
+    def list_names():
+        while not stop.is_set():
+            try:
+                registry.directory_mtime = None  # Makes names() scan on this thread
+                registry.names("p")
+            except Exception as e:
+                errors.append(e)
+
+    lister = threading.Thread(target=list_names)
+    lister.start()
+    try:
+        for _ in range(50):
+            for index in range(20):
+                registry.get(f"p{index}")
+            registry.scan(force=True)
+    finally:
+        stop.set()
+        lister.join()
+    assert not errors and registry.cache
+
+    stream = io.BytesIO()
+    with patch('basic_app.prompt_registry', registry), \
+         patch('basic_app.start_callback_server', AsyncMock(return_value=AsyncMock())), \
+         patch('basic_app.sys.stdout', MagicMock(buffer=stream)), \
+         patch('basic_app.sys.stdin', io.StringIO("/exit\n")):
+        await main(show_internal_messages_arg=False, prompt_name=None, output="plain")
+    assert not registry.cache
+
+# Test the completion of prompt names after /prompt
+def test_command_completer_prompt_names(tmp_path):
+    from prompt_toolkit.document import Document
+    (tmp_path / "support_agent.txt").write_text("a", encoding="utf-8")
+    (tmp_path / "summarizer.txt").write_text("b", encoding="utf-8")
+    (tmp_path / "translator.txt").write_text("c", encoding="utf-8")
+    with patch('basic_app.prompt_registry', PromptRegistry(str(tmp_path))):
+        completions = list(CommandCompleter().get_completions(Document("/prompt su"), None))
+    assert [completion.text for completion in completions] == ["summarizer", "support_agent"]
+    assert all(completion.start_position == -2 for completion in completions)
   
+# Test prefix lookups, duplicates and removal in the completion trie
+def test_prefix_trie():
+    from basic_app import PrefixTrie
+    trie = PrefixTrie(["/stats", "/switch", "/show_last_mind", "/reset"])
+    assert trie.complete("/s") == ["/show_last_mind", "/stats", "/switch"]
+    assert trie.complete("/s", limit=2) == ["/show_last_mind", "/stats"]
+    assert trie.complete("/x") == []
+    trie.add("/stats")
+    trie.discard("/stats")
+    assert "/stats" in trie.complete("/st")  # Added twice, discarded once
+    trie.discard("/stats")
+    trie.discard("/missing")
+    assert trie.complete("/st") == [] and trie.size == 3
+    assert list(trie.root.children) == ["/"]
+    assert sorted(label for label, _ in trie.root.children["/"][1].children.values()) == ["reset", "s"]
+    trie.discard("/show_last_mind")
+    assert trie.root.children["/"][1].children["s"][0] == "switch"  # Merged back into one edge
+
+# Test completion of thread IDs and of recent inputs, which are forgotten beyond the history size
+def test_completion_engine_sources():
+    import basic_app
+    from basic_app import CompletionEngine
+    engine = CompletionEngine(history_size=2)
+    extra = basic_app.register_conversation(Conversation("7777.0001", render=False))
+    try:
+        assert engine.complete("/switch 7777") == (["7777.0001"], 4)
+    finally:
+        basic_app.conversations.pop(extra.thread_id)
+        extra.close()
+    assert engine.complete("/switch 7777") == ([], 4)  # Re-indexed after the thread went away
+    engine.remember("hello there")
+    engine.remember("help me")
+    engine.remember("how are you")
+    assert engine.complete("he") == (["help me"], 2)
+    assert engine.complete("/unknown arg") == ([], 0)
+
 # Test the call_tested_llm function  
 @pytest.mark.asyncio  
 async def test_call_tested_llm():  
@@ -82,13 +208,119 @@ async def test_call_tested_llm():
         args, kwargs = mock_post.call_args  
         # URL is the first positional argument  
         assert args[0] == LLM_NOTIFICATION_ENDPOINT  # Use the actual endpoint from basic_app  
-        assert kwargs['headers'] == {"Content-Type": "application/json"}  
-        payload = kwargs['json']  
+        payload = json.loads(kwargs['data'])
+        assert kwargs['headers'] == {"Content-Type": "application/json", "Idempotency-Key": payload['idempotency_key']}
         assert payload['text'] == user_input  
         assert 'timestamp' in payload  
         assert 'thread_id' in payload  
         assert payload['thread_id'] == thread_id  # Ensure thread_id is correctly used  
 
+# Test that call_tested_llm reuses the shared HTTP session when one is open
+@pytest.mark.asyncio
+async def test_call_tested_llm_uses_shared_session():
+    shared_session = MagicMock()
+    mock_response = AsyncMock()
+    mock_response.status = 202
+    shared_session.post.return_value.__aenter__.return_value = mock_response
+
+    with patch('basic_app.http_session', shared_session), \
+         patch('aiohttp.ClientSession') as mock_session_class:
+        await call_tested_llm("Hello again")
+
+    shared_session.post.assert_called_once()
+    # No per-call session should be created
+    mock_session_class.assert_not_called()
+
+# Test that 5xx responses and connection errors are retried with the same idempotency key
+@pytest.mark.asyncio
+async def test_call_tested_llm_retries():
+    import aiohttp
+    session = MagicMock()
+    responses = [AsyncMock(status=503), aiohttp.ClientConnectionError("reset"), AsyncMock(status=202)]
+    session.post.return_value.__aenter__.side_effect = responses
+    with patch('basic_app.RETRY_BACKOFF', 0):
+        assert await call_tested_llm("Retry me", session=session, target_thread_id="t-r", timestamp="1.0001") is True
+    assert session.post.call_count == 3
+    keys = {call.kwargs['headers']['Idempotency-Key'] for call in session.post.call_args_list}
+    assert len(keys) == 1
+    assert json.loads(session.post.call_args.kwargs['data'])['idempotency_key'] == keys.pop()
+
+# Test that client errors are not retried and that retries are bounded
+@pytest.mark.asyncio
+async def test_call_tested_llm_gives_up():
+    session = MagicMock()
+    session.post.return_value.__aenter__.return_value = AsyncMock(status=400)
+    assert await call_tested_llm("Bad request", session=session) is False
+    assert session.post.call_count == 1
+
+    session.post.reset_mock()
+    session.post.return_value.__aenter__.return_value = AsyncMock(status=500)
+    with patch('basic_app.RETRY_BACKOFF', 0), patch('basic_app.SEND_RETRIES', 2):
+        assert await call_tested_llm("Server error", session=session) is False
+    assert session.post.call_count == 3
+
+# Test that the spliced payload matches the full message, whatever the JSON backend
+@pytest.mark.parametrize("backend", ["orjson", "json"])
+def test_build_payload(backend):
+    from basic_app import build_payload, load_json_codec, payload_prefix
+    _, dumps, loads = load_json_codec(backend)
+    payload_prefix.cache_clear()
+    try:
+        with patch('basic_app.json_dumps', dumps), patch('basic_app.CALLBACK_URL', "http://client/cb"):
+            body = build_payload('Say "hi" \u00e9\n', "t-9", "1.0001", "key-1")
+        payload = loads(body)
+    finally:
+        payload_prefix.cache_clear()
+    assert len(payload) == 23
+    assert payload["text"] == payload["raw_data"]["text"] == 'Say "hi" \u00e9\n'
+    assert (payload["thread_id"], payload["timestamp"], payload["idempotency_key"]) == ("t-9", "1.0001", "key-1")
+    assert payload["callback_url"] == "http://client/cb"
+    assert payload["reaction_name"] is None and payload["is_mention"] is True
+
+# Test the JSON backend selection
+def test_load_json_codec():
+    from basic_app import load_json_codec
+    name, dumps, loads = load_json_codec("json")
+    assert name == "json"
+    assert dumps({"a": "é"}) == '{"a":"é"}'.encode("utf-8")
+    assert loads(b'{"a": 1}') == {"a": 1}
+    with pytest.raises(ValueError):
+        load_json_codec("pickle")
+
+# Test the pooled HTTP session configuration
+@pytest.mark.asyncio
+async def test_create_http_session():
+    session = create_http_session()
+    try:
+        assert session.connector.limit == HTTP_POOL_LIMIT
+        assert session.connector.limit_per_host == HTTP_POOL_LIMIT_PER_HOST
+    finally:
+        await session.close()
+
+# Test that call_tested_llm hands the payload to the active transport
+@pytest.mark.asyncio
+async def test_call_tested_llm_uses_transport():
+    mock_transport = MagicMock()
+    mock_transport.send = AsyncMock(return_value=True)
+    with patch('basic_app.transport', mock_transport):
+        assert await call_tested_llm("Over the socket", target_thread_id="t-1", timestamp="1.0001") is True
+    body, idempotency_key = mock_transport.send.call_args.args
+    payload = json.loads(body)
+    assert payload["idempotency_key"] == idempotency_key
+    assert payload["text"] == "Over the socket"
+    assert payload["thread_id"] == "t-1"
+    assert payload["timestamp"] == "1.0001"
+
+# Test the transport factory
+def test_create_transport():
+    assert isinstance(create_transport("http"), HttpCallbackTransport)
+    assert create_transport("http").needs_callback_server is True
+    websocket_transport = create_transport("websocket")
+    assert isinstance(websocket_transport, WebSocketTransport)
+    assert websocket_transport.needs_callback_server is False
+    with pytest.raises(ValueError):
+        create_transport("carrier_pigeon")
+
 # Test the FastAPI endpoint /api/receive_message for a normal message  
 def test_receive_message_normal(client):  
     test_message = {  
@@ -104,8 +336,8 @@ def test_receive_message_normal(client):
         assert response.json() == {"status": "OK"}  
   
         # Check that the message was added to the conversation history  
-        assert conversation_history[-1]["content"] == "Hello from assistant"  
-        assert conversation_history[-1]["role"] == "assistant"  
+        assert conversation_history[-1].content == "Hello from assistant"  
+        assert conversation_history[-1].role == "assistant"  
   
         # Verify that print_with_timestamp was called  
         mock_print.assert_called_with("Assistant", "Hello from assistant")  
@@ -125,62 +357,296 @@ def test_receive_message_internal(client):
         assert response.json() == {"status": "OK"}  
   
         # The message should be added to the conversation history  
-        assert conversation_history[-1]["content"] == "Internal assistant message"  
-        assert conversation_history[-1]["role"] == "assistant_internal"  
+        assert conversation_history[-1].content == "Internal assistant message"  
+        assert conversation_history[-1].role == "assistant_internal"  
   
         # Since show_internal_messages is False by default, print_with_timestamp should not be called  
         mock_print.assert_not_called()  
   
 # Test the receive_message endpoint for a reaction 'done'  
-def test_receive_message_reaction_done(client):  
-    # Add a user message to the conversation history  
-    conversation_history.append({  
-        "role": "user",  
-        "content": "User message",  
-        "reactions": [],  
-    })  
+@pytest.mark.asyncio
+async def test_receive_message_reaction_done(client):  
+    # Add a user message to the conversation history and wait for its 'done'
+    active_conversation.add_message("user", "User message", "1700000000.0001")
+    turn_done = active_conversation.expect_done("1700000000.0001")
   
     test_message = {  
         "event_type": "REACTION_ADD",  
         "text": "",  
         "reaction_name": "done",  
         "is_internal": False,  
+        "thread_id": active_conversation.thread_id,
+        "timestamp": "1700000000.0001",
     }  
   
-    # Mock the event loop and the method call_soon_threadsafe  
-    loop = asyncio.get_event_loop()  
-    with patch('basic_app.main_loop', loop), \
-         patch.object(loop, 'call_soon_threadsafe') as mock_call_soon_threadsafe, \
-         patch('basic_app.print_with_timestamp') as mock_print:  
+    with patch('basic_app.print_with_timestamp') as mock_print:  
         response = client.post("/api/receive_message", json=test_message)  
         assert response.status_code == 200  
         assert response.json() == {"status": "OK"}  
   
         # Verify that the reaction was added to the last user message  
-        assert "✅" in conversation_history[-1]["reactions"]  
-  
-        # Verify that done_reaction_received.set was scheduled  
-        mock_call_soon_threadsafe.assert_called_with(done_reaction_received.set)  
+        assert "✅" in conversation_history[-1].reactions  
   
         # Verify that the reaction message was printed  
         mock_print.assert_called_with("Reaction", "'✅' added to your last message.")  
+
+    # The future of this message is resolved from the server thread
+    assert await asyncio.wait_for(turn_done, 1) is True
+    assert not active_conversation.pending
   
     # Clean up the conversation history  
-    conversation_history.pop()  
+    conversation_history.clear()
+
+# Test that callbacks are routed to the conversation owning the thread_id
+@pytest.mark.asyncio
+async def test_receive_message_routes_by_thread_id(client):
+    first = register_conversation(Conversation("thread-a", render=False))
+    second = register_conversation(Conversation("thread-b", render=False))
+    try:
+        first.add_message("user", "Question A", "1.0001")
+        second.add_message("user", "Question B", "2.0001")
+        first_done = first.expect_done("1.0001")
+        second_done = second.expect_done("2.0001")
+
+        with patch('basic_app.print_with_timestamp') as mock_print:
+            client.post("/api/receive_message", json={
+                "event_type": "MESSAGE", "text": "Answer B", "thread_id": "thread-b",
+            })
+            client.post("/api/receive_message", json={
+                "event_type": "REACTION_ADD", "reaction_name": "done", "thread_id": "thread-b", "timestamp": "2.0001",
+            })
+            # Events for unknown threads are dropped
+            client.post("/api/receive_message", json={
+                "event_type": "MESSAGE", "text": "Lost", "thread_id": "unknown-thread",
+            })
+        mock_print.assert_not_called()
+
+        assert [msg.content for msg in second.history] == ["Question B", "Answer B"]
+        assert second.history[0].reactions == ("✅",)
+        assert [msg.content for msg in first.history] == ["Question A"]
+        assert await asyncio.wait_for(second_done, 1) is True
+        assert not first_done.done()
+    finally:
+        conversations.pop("thread-a", None)
+        conversations.pop("thread-b", None)
+
+# Test that a 'done' without a known timestamp resolves the oldest pending message
+@pytest.mark.asyncio
+async def test_conversation_resolve_done_fallback():
+    conversation = Conversation("thread-c")
+    first_done = conversation.expect_done("1.0001")
+    second_done = conversation.expect_done("1.0002")
+    assert conversation.resolve_done(None) is True
+    assert first_done.done() and not second_done.done()
+    assert conversation.resolve_done("1.0002") is True
+    assert conversation.resolve_done("1.0003") is False
   
+# Test that abandoned turns are forgotten once their late 'done' arrives, and that at most ABANDONED_LIMIT are kept
+@pytest.mark.asyncio
+async def test_conversation_abandoned_bounded():
+    conversation = Conversation("thread-abandoned", render=False)
+    with patch.object(Conversation, 'ABANDONED_LIMIT', 3), patch('basic_app.turn_stats', TurnStats(window=10)):
+        for index in range(5):
+            conversation.abandon(conversation.expect_done(f"9.{index}"), "timeout")
+        assert list(conversation.abandoned) == ["9.2", "9.3", "9.4"]
+        current = conversation.expect_done("9.5")
+        assert conversation.resolve_done("9.3") is False  # Late 'done' of an abandoned turn
+        assert list(conversation.abandoned) == ["9.2", "9.4"] and not current.done()
+        assert conversation.resolve_done("9.5") is True
+
+# Test that a turn without 'done' times out, is counted, and its late events resolve nothing else
+@pytest.mark.asyncio
+async def test_wait_done_timeout():
+    conversation = Conversation("thread-timeout", render=False)
+    stats = TurnStats(window=10)
+    with patch('basic_app.turn_stats', stats):
+        lost = conversation.expect_done("5.0001")
+        assert await conversation.wait_done(lost, timeout=0.01) is False
+        assert stats.failures == {"timeout": 1}
+        assert lost.future.cancelled() and not conversation.pending
+
+        # A late 'done' for the lost turn must not resolve the next one
+        current = conversation.expect_done("5.0002")
+        assert conversation.resolve_done("5.0001") is False
+        assert not current.done()
+        assert conversation.resolve_done("5.0002") is True
+        assert await conversation.wait_done(current, timeout=1) is True
+
+# Test that streamed chunks are assembled into one message and timed
+@pytest.mark.asyncio
+async def test_receive_message_streamed_chunks(client):
+    conversation = register_conversation(Conversation("thread-stream"))
+    try:
+        conversation.add_message("user", "Question", "3.0001")
+        turn = conversation.expect_done("3.0001")
+        base = {"thread_id": "thread-stream", "timestamp": "3.0001", "message_id": "m1"}
+
+        with patch('basic_app.print_with_timestamp') as mock_print, \
+             patch('basic_app.stream_renderer') as mock_renderer:
+            client.post("/api/receive_message", json={**base, "event_type": "MESSAGE_DELTA", "text": "Hel"})
+            client.post("/api/receive_message", json={**base, "event_type": "MESSAGE_DELTA", "text": "lo"})
+            assert turn.first_token_at is not None
+            assert conversation.streams["m1"] == ["Hel", "lo"]
+            # Partial messages are only shown in the live region
+            mock_print.assert_not_called()
+            mock_renderer.track.assert_called_once()
+            mock_renderer.touch.assert_called_once()
+
+            client.post("/api/receive_message", json={**base, "event_type": "MESSAGE_END"})
+            mock_renderer.untrack.assert_called_once_with(("thread-stream", "m1"))
+            mock_print.assert_called_with("Assistant", "Hello")
+
+            client.post("/api/receive_message", json={**base, "event_type": "REACTION_ADD", "reaction_name": "done"})
+
+        assert conversation.history[-1].content == "Hello"
+        assert not conversation.streams
+        await asyncio.wait_for(turn, 1)
+        assert 0 <= turn.time_to_first_token <= turn.time_to_done
+    finally:
+        conversations.pop("thread-stream", None)
+
+# Test that a reset or a timed-out turn removes its partial messages from the live region
+@pytest.mark.asyncio
+async def test_streams_untracked_on_reset_and_abandon(client):
+    from basic_app import stream_renderer
+    conversation = register_conversation(Conversation("thread-stuck"))
+    # Without a main loop, streams are tracked without starting the live region
+    with patch('basic_app.main_loop', None):
+        try:
+            conversation.add_message("user", "Question", "4.0001")
+            turn = conversation.expect_done("4.0001")
+            base = {"thread_id": "thread-stuck", "timestamp": "4.0001", "event_type": "MESSAGE_DELTA", "text": "Par"}
+            client.post("/api/receive_message", json={**base, "message_id": "m1"})
+            assert ("thread-stuck", "m1") in stream_renderer.streams
+            assert await conversation.wait_done(turn, timeout=0.01) is False
+            assert not stream_renderer.streams
+            # Late chunks of the abandoned turn are not shown again
+            client.post("/api/receive_message", json={**base, "message_id": "m2"})
+            assert not stream_renderer.streams
+
+            conversation.add_message("user", "Again", "4.0002")
+            conversation.expect_done("4.0002")
+            client.post("/api/receive_message", json={**base, "timestamp": "4.0002", "message_id": "m3"})
+            assert ("thread-stuck", "m3") in stream_renderer.streams
+            conversations.pop("thread-stuck", None)
+            conversation.reset("thread-stuck-2")
+            assert not stream_renderer.streams and not conversation.streams
+        finally:
+            conversations.pop("thread-stuck", None)
+            stream_renderer.streams.clear()
+
+# Test that every event of a turn is timed and aggregated per phase
+@pytest.mark.asyncio
+async def test_turn_phases_recorded(client):
+    conversation = register_conversation(Conversation("thread-phases", render=False))
+    stats = TurnStats(window=10)
+    try:
+        conversation.add_message("user", "Question", "4.0001")
+        turn = conversation.expect_done("4.0001")
+        base = {"thread_id": "thread-phases", "timestamp": "4.0001"}
+        with patch('basic_app.turn_stats', stats):
+            for reaction in ("acknowledge", "processing", 'th"ink\ning'):
+                client.post("/api/receive_message", json={**base, "event_type": "REACTION_ADD", "reaction_name": reaction})
+            client.post("/api/receive_message", json={**base, "event_type": "MESSAGE", "text": "Step", "is_internal": True})
+            client.post("/api/receive_message", json={**base, "event_type": "MESSAGE", "text": "Answer"})
+            client.post("/api/receive_message", json={**base, "event_type": "REACTION_ADD", "reaction_name": "done"})
+        await asyncio.wait_for(turn, 1)
+    finally:
+        conversations.pop("thread-phases", None)
+
+    # An unknown reaction is timed as "other", outside the reaction-to-reaction phases
+    assert list(turn.marks) == ["acknowledge", "processing", "other", "first_message", "first_token", "done"]
+    assert [phase for phase, _ in turn.phases()] == [
+        "sent->acknowledge", "sent->processing", "sent->other", "sent->first_message", "sent->first_token",
+        "sent->done", "acknowledge->processing", "processing->done",
+    ]
+    summary = stats.summary()
+    assert summary["sent->done"]["count"] == 1
+    assert summary["sent->done"]["p99"] == pytest.approx(turn.time_to_done)
+
+# Test rolling percentiles and the Prometheus rendering
+def test_turn_stats_percentiles():
+    stats = TurnStats(window=100)
+    for index in range(1, 201):
+        turn = Turn(str(index), None)
+        turn.marks["done"] = turn.sent_at + index / 1000
+        stats.record_turn(turn)
+    # Only the last 100 turns (101..200 ms) count for percentiles, all 200 for count
+    assert stats.percentile("sent->done", 50) == pytest.approx(0.150)
+    assert stats.percentile("sent->done", 99) == pytest.approx(0.199)
+    assert stats.percentile("sent->done", 7) == pytest.approx(0.107)
+    assert stats.counts["sent->done"] == 200
+    text = stats.to_prometheus()
+    assert '# TYPE genaibot_client_turn_phase_seconds summary' in text
+    assert 'genaibot_client_turn_phase_seconds{phase="sent->done",quantile="0.95"} 0.195000' in text
+    assert 'genaibot_client_turn_phase_seconds_count{phase="sent->done"} 200' in text
+
+# Test nearest-rank percentiles over an odd-sized window
+def test_turn_stats_percentiles_odd_window():
+    stats = TurnStats(window=5)
+    for index in range(1, 6):
+        turn = Turn(str(index), None)
+        turn.marks["done"] = turn.sent_at + index
+        stats.record_turn(turn)
+    assert stats.percentile("sent->done", 50) == pytest.approx(3)
+    assert stats.percentile("sent->done", 90) == pytest.approx(5)
+    assert stats.percentile("sent->done", 10) == pytest.approx(1)
+
+# Test that label values are escaped in the Prometheus rendering
+def test_turn_stats_prometheus_escapes_labels():
+    stats = TurnStats(window=10)
+    stats.record_failure('send "error"\\\nretry')
+    assert 'genaibot_client_turn_failures_total{reason="send \\"error\\"\\\\\\nretry"} 1' in stats.to_prometheus()
+
+# Test the optional metrics endpoint in both formats
+def test_metrics_endpoint():
+    stats = TurnStats(window=10)
+    turn = Turn("1", None)
+    turn.marks["done"] = turn.sent_at + 0.5
+    stats.record_turn(turn)
+    with patch('basic_app.METRICS_ENABLED', True), patch('basic_app.turn_stats', stats):
+        metrics_client = TestClient(create_fastapi_app())
+        response = metrics_client.get("/metrics")
+        assert response.headers["content-type"].startswith("text/plain")
+        assert 'phase="sent->done"' in response.text
+        assert metrics_client.get("/metrics?format=json").json()["phases"]["sent->done"]["count"] == 1
+    assert TestClient(create_fastapi_app()).get("/metrics").status_code == 404
+
+# Test that the live region is drawn while streams are open and removed afterwards
+@pytest.mark.asyncio
+async def test_stream_renderer_frames():
+    renderer = StreamRenderer(frame_rate=100)
+    chunks = ["Partial"]
+    from io import StringIO
+    from rich.console import Console
+    output = StringIO()
+    with patch('basic_app.main_loop', asyncio.get_running_loop()), \
+         patch('basic_app.console', Console(file=output, force_terminal=True)):
+        renderer.track(("thread", "m1"), "Assistant", chunks)
+        await asyncio.sleep(0.05)
+        assert renderer.task is not None
+        rendered = renderer.render().renderables[0]
+        assert rendered.plain.endswith("[Assistant] Partial▌")
+        renderer.untrack(("thread", "m1"))
+        await asyncio.sleep(0.05)
+        assert renderer.task is None
+    assert "Partial" in output.getvalue()
+
 # Test the reset_conversation function  
 def test_reset_conversation():  
     # Add some messages to the conversation history  
-    conversation_history.extend([  
-        {"role": "user", "content": "Message 1", "reactions": []},  
-        {"role": "assistant", "content": "Response 1", "reactions": []}  
-    ])  
+    conversation_history.append("user", "Message 1")
+    conversation_history.append("assistant", "Response 1")
     # Mock the console methods  
     with patch('basic_app.console.clear') as mock_clear, \
          patch('basic_app.print_with_timestamp') as mock_print, \
          patch('basic_app.console.print') as mock_console_print:  
+        old_thread_id = active_conversation.thread_id
         reset_conversation()  
         assert len(conversation_history) == 0  
+        # The conversation is now reachable under its new thread_id only
+        assert old_thread_id not in conversations
+        assert conversations[active_conversation.thread_id] is active_conversation
         # Verify that console.clear was called  
         mock_clear.assert_called()  
         # Verify that print_with_timestamp was called with reset message  
@@ -199,19 +665,115 @@ def test_reset_conversation():
         new_thread_id = new_thread_id_message.split(": ")[1]  
         assert new_thread_id != "" and new_thread_id is not None  
   
+# Test the role and turn indexes of the message store
+def test_message_store_indexes():
+    store = MessageStore()
+    store.append("system", "System prompt")
+    store.append("user", "Question 1", "1.0001")
+    store.append("assistant_internal", "Thinking 1")
+    store.append("assistant", "Answer 1")
+    store.append("user", "Question 2", "1.0002")
+    store.append("assistant_internal", "Thinking 2a")
+    store.append("assistant_internal", "Thinking 2b")
+
+    assert len(store) == 7
+    assert store.last_user_index == 4
+    assert store.last_user_message().content == "Question 2"
+    assert store.find_user_message("1.0001").content == "Question 1"
+    assert store.find_user_message("9.9999") is None
+    assert [msg.content for msg in store.internal_since_last_user()] == ["Thinking 2a", "Thinking 2b"]
+    assert [msg.content for msg in store.messages_by_role("assistant_internal")] == [
+        "Thinking 1", "Thinking 2a", "Thinking 2b"
+    ]
+    assert store.turn_count() == 2
+    assert [msg.content for msg in store.turn(0)] == ["Question 1", "Thinking 1", "Answer 1"]
+
+    # Reactions are kept once per emoji
+    message = store.last_user_message()
+    assert message.add_reaction("👀") is True
+    assert message.add_reaction("👀") is False
+    assert message.reactions == ("👀",)
+
+    store.clear()
+    assert len(store) == 0
+    assert store.last_user_message() is None
+    assert store.internal_since_last_user() == []
+
+# Test that messages beyond the window are spilled to disk and read back lazily
+def test_message_store_spill(tmp_path):
+    store = MessageStore(window=4, spill_dir=str(tmp_path))
+    store.append("user", "Question 1", "1.0001")
+    for idx in range(6):
+        store.append("assistant_internal", f"Thinking {idx}")
+    store.append("assistant", "Answer 1")
+    store.append("user", "Question 2", "1.0002")
+    store.append("assistant_internal", "Thinking 6")
+
+    assert len(store) == 10
+    assert store.spilled > 0
+    assert len(list(tmp_path.iterdir())) >= 1
+    # Spilled messages are reloaded on access
+    assert store[0].content == "Question 1"
+    assert store[-1].content == "Thinking 6"
+    assert [msg.content for msg in store] == [store[idx].content for idx in range(10)]
+    assert len(store.messages_by_role("assistant_internal")) == 7
+    assert [msg.content for msg in store.internal_since_last_user()] == ["Thinking 6"]
+    assert [msg.content for msg in store.turn(0)][-1] == "Answer 1"
+    assert store.turn_count() == 2
+
+    # Reactions on a spilled user message are written through
+    spilled_question = store.find_user_message("1.0001")
+    assert store.add_reaction(spilled_question, "✅") is True
+    assert store[0].reactions == ("✅",)
+
+    store.clear()
+    assert len(store) == 0
+    assert list(tmp_path.iterdir()) == []
+
+# Test that the current turn stays reachable when its user message is spilled
+def test_message_store_spill_long_turn(tmp_path):
+    store = MessageStore(window=2, spill_dir=str(tmp_path))
+    store.append("user", "Question", "1.0001")
+    for idx in range(10):
+        store.append("assistant_internal", f"Thinking {idx}")
+    assert store.last_user_message().content == "Question"
+    assert len(store.internal_since_last_user()) == 10
+    store.close()
+
+# Test that the log capture buffer only keeps the latest records
+def test_ring_buffer_handler():
+    import logging
+    handler = RingBufferHandler(2)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    test_logger = logging.getLogger("ring_buffer_test")
+    test_logger.addHandler(handler)
+    test_logger.propagate = False
+    for idx in range(5):
+        test_logger.warning(f"record {idx}")
+    assert handler.getvalue() == "record 3\nrecord 4"
+    test_logger.removeHandler(handler)
+
+# Test exporting the conversation history to JSONL
+def test_export_conversation(tmp_path):
+    conversation_history.clear()
+    conversation_history.append("user", "Hello", "1.0001")
+    conversation_history.append("assistant", "Hi there")
+    export_path = tmp_path / "history.jsonl"
+    with patch('basic_app.print_with_timestamp') as mock_print:
+        export_conversation(str(export_path))
+    mock_print.assert_called_with("System", f"Exported 2 messages to {export_path}.")
+    lines = export_path.read_text(encoding="utf-8").splitlines()
+    assert json.loads(lines[0]) == {"role": "user", "content": "Hello", "reactions": [], "timestamp": "1.0001"}
+    assert json.loads(lines[1])["content"] == "Hi there"
+    conversation_history.clear()
+
 # Test the show_last_internal_messages function  
 def test_show_last_internal_messages():  
     # Set up the conversation history  
     conversation_history.clear()  
-    conversation_history.extend([  
-        {"role": "user", "content": "User message", "reactions": []},  
-        {"role": "assistant_internal", "content": "Internal message 1", "reactions": []},  
-        {"role": "assistant_internal", "content": "Internal message 2", "reactions": []},  
-    ])  
-  
-    # Set the last_user_message_index  
-    global last_user_message_index  
-    last_user_message_index = 0  # Index of the user message  
+    conversation_history.append("user", "User message")
+    conversation_history.append("assistant_internal", "Internal message 1")
+    conversation_history.append("assistant_internal", "Internal message 2")
   
     with patch('basic_app.print_with_timestamp') as mock_print, \
          patch('basic_app.console.print') as mock_console_print:  
@@ -227,8 +789,7 @@ def test_show_last_internal_messages():
   
     # Test when there are no internal messages  
     conversation_history.clear()  
-    conversation_history.append({"role": "user", "content": "User message", "reactions": []})  
-    last_user_message_index = 0  
+    conversation_history.append("user", "User message")
   
     with patch('basic_app.print_with_timestamp') as mock_print:  
         show_last_internal_messages()  
@@ -259,7 +820,7 @@ def test_command_completer():
 # Test the main function for handling the /toggle_internal command  
 @pytest.mark.asyncio  
 async def test_main_toggle_internal():  
-    with patch('basic_app.start_uvicorn'), \
+    with patch('basic_app.start_callback_server', AsyncMock(return_value=AsyncMock())), \
          patch('basic_app.print_with_timestamp') as mock_print, \
          patch('basic_app.console.print'), \
          patch('basic_app.patch_stdout', return_value=contextlib.nullcontext()):
@@ -276,20 +837,14 @@ async def test_main_toggle_internal():
 async def test_main_show_last_mind():  
     # Set up the conversation history  
     conversation_history.clear()  
-    conversation_history.extend([  
-        {"role": "user", "content": "User message 1", "reactions": []},  
-        {"role": "assistant_internal", "content": "Internal message 1", "reactions": []},  
-        {"role": "assistant_internal", "content": "Internal message 2", "reactions": []},  
-    ])  
+    conversation_history.append("user", "User message 1")
+    conversation_history.append("assistant_internal", "Internal message 1")
+    conversation_history.append("assistant_internal", "Internal message 2")
   
-    with patch('basic_app.start_uvicorn'), \
+    with patch('basic_app.start_callback_server', AsyncMock(return_value=AsyncMock())), \
          patch('basic_app.print_with_timestamp') as mock_print, \
          patch('basic_app.console.print') as mock_console_print, \
          patch('basic_app.patch_stdout', return_value=contextlib.nullcontext()):
-        # Set last_user_message_index to 0  
-        global last_user_message_index  
-        last_user_message_index = 0  
-  
         # Mock the PromptSession  
         mock_prompt_session = AsyncMock()  
         mock_prompt_session.prompt_async = AsyncMock(side_effect=["/show_last_mind", "/exit"])  
@@ -306,7 +861,7 @@ async def test_main_show_last_mind():
 # Test the main function for handling an unknown command  
 @pytest.mark.asyncio  
 async def test_main_unknown_command():  
-    with patch('basic_app.start_uvicorn'), \
+    with patch('basic_app.start_callback_server', AsyncMock(return_value=AsyncMock())), \
          patch('basic_app.print_with_timestamp') as mock_print, \
          patch('basic_app.console.print'), \
          patch('basic_app.patch_stdout', return_value=contextlib.nullcontext()):  
@@ -318,14 +873,60 @@ async def test_main_unknown_command():
     # Verify that print_with_timestamp was called with the error message  
     mock_print.assert_any_call("Error", "Unknown command.")  
   
-# Test start_uvicorn function  
-def test_start_uvicorn():  
-    with patch('uvicorn.Server') as mock_server:  
-        start_uvicorn()  
-      
-        # Verify that the server was started  
-        mock_server.return_value.run.assert_called()  
-  
+# Test that the callback server serves on the running loop and stops cleanly
+@pytest.mark.asyncio
+async def test_start_callback_server():
+    import socket
+    import aiohttp
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = await start_callback_server("127.0.0.1", port)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"http://127.0.0.1:{port}/api/receive_message",
+                                    json={"event_type": "REACTION_ADD", "reaction_name": "done"}) as response:
+                assert response.status == 200
+    finally:
+        await server.stop()
+    assert server.task is None
+
+# Test that port 0 is passed through to pick a free port instead of falling back to CALLBACK_PORT
+@pytest.mark.asyncio
+async def test_start_callback_server_port_zero():
+    import aiohttp
+    with patch('basic_app.CALLBACK_PORT', 9):
+        server = await start_callback_server("127.0.0.1", 0)
+    try:
+        assert server.port not in (0, 9)
+        async with aiohttp.ClientSession() as session:
+            async with session.post(f"http://127.0.0.1:{server.port}/api/receive_message",
+                                    json={"event_type": "REACTION_ADD", "reaction_name": "done"}) as response:
+                assert response.status == 200
+    finally:
+        await server.stop()
+
+# Test that a port already in use is reported instead of exiting the process
+@pytest.mark.asyncio
+async def test_start_callback_server_port_in_use():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        port = sock.getsockname()[1]
+        with pytest.raises(RuntimeError):
+            await start_callback_server("127.0.0.1", port)
+
+# Test that a startup error is written out and the console renderer stopped
+@pytest.mark.asyncio
+async def test_main_startup_error_stops_renderer():
+    from basic_app import console_renderer
+    with patch('basic_app.start_callback_server', AsyncMock(side_effect=RuntimeError("Port 8000 is in use."))), \
+         patch('basic_app.console.print') as mock_console_print:
+        await main(show_internal_messages_arg=False, prompt_name=None)
+    assert console_renderer.task is None and not console_renderer.pending
+    assert "Port 8000 is in use." in mock_console_print.call_args_list[-1].args[0]
+
 # Test the color change for assistant_internal messages  
 def test_console_theme():  
     from basic_app import custom_theme  
@@ -333,3 +934,402 @@ def test_console_theme():
     style = custom_theme.styles['assistant_internal']  
     # The style object can be compared by its color name  
     assert style.color.name == 'bright_black'  
+
+# Test that importing the module leaves the server and prompt stacks unimported
+def test_import_defers_heavy_dependencies():
+    import subprocess
+    import sys
+    code = "import sys, basic_app; print(sorted(m for m in ('aiohttp', 'uvicorn', 'fastapi', 'prompt_toolkit') if m in sys.modules))"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
+
+# Test that console lines are printed directly until the renderer is started
+def test_console_renderer_prints_directly_when_not_started():
+    from basic_app import ConsoleRenderer
+    renderer = ConsoleRenderer(frame_rate=20, capacity=10)
+    with patch('basic_app.console.print') as mock_print:
+        renderer.submit("hello", "system")
+    mock_print.assert_called_once_with("hello", style="system")
+    assert not renderer.pending
+
+# Test that repeated lines are collapsed and reactions are dropped first when the queue is full
+def test_console_renderer_collapses_and_drops():
+    from basic_app import ConsoleRenderer
+    renderer = ConsoleRenderer(frame_rate=20, capacity=2)
+    renderer.task = MagicMock()  # Queue lines as if the frame task were running
+    renderer.submit("[10:00:00] [Reaction] Processing", "reaction", True)
+    renderer.submit("[10:00:00] [Reaction] Processing", "reaction", True)
+    renderer.submit("[10:00:00] [Assistant] Hi", "assistant")
+    renderer.submit("[10:00:00] [Reaction] Done", "reaction", True)  # Full: dropped
+    renderer.submit("[10:00:00] [Error] Boom", "error")  # Full: evicts the queued reaction
+    with patch('basic_app.console.print') as mock_print:
+        renderer.flush()
+    assert mock_print.call_args_list[:2] == [
+        call("[10:00:00] [Assistant] Hi", style="assistant"),
+        call("[10:00:00] [Error] Boom", style="error"),
+    ]
+    assert "2 lines dropped" in mock_print.call_args_list[2].args[0]
+    assert not renderer.pending and renderer.dropped == 0
+
+    renderer.capacity = 10
+    renderer.submit("same", None)
+    renderer.submit("same", None)
+    renderer.submit("same", None)
+    with patch('basic_app.console.print') as mock_print:
+        renderer.flush()
+    mock_print.assert_called_once_with("same (x3)", style=None)
+
+# Test that a queued answer survives a full queue of normal lines
+def test_console_renderer_keeps_answers():
+    from basic_app import ConsoleRenderer
+    renderer = ConsoleRenderer(frame_rate=20, capacity=2)
+    renderer.task = MagicMock()
+    renderer.submit("[10:00:00] [Assistant] Answer", "assistant")
+    for index in range(3):
+        renderer.submit(f"[10:00:00] [System] Line {index}", "system")  # Evicts the older system line
+    renderer.submit("[10:00:00] [Error] Boom", "error")  # Evicts the last system line
+    renderer.submit("[10:00:00] [System] Late", "system")  # Only answers and errors queued: dropped
+    with patch('basic_app.console.print') as mock_print:
+        renderer.flush()
+    assert mock_print.call_args_list[:2] == [
+        call("[10:00:00] [Assistant] Answer", style="assistant"),
+        call("[10:00:00] [Error] Boom", style="error"),
+    ]
+    assert "4 lines dropped" in mock_print.call_args_list[2].args[0]
+
+# Test that queued lines are written by the frame task and on stop
+@pytest.mark.asyncio
+async def test_console_renderer_writes_per_frame():
+    from basic_app import ConsoleRenderer
+    renderer = ConsoleRenderer(frame_rate=100, capacity=10)
+    with patch('basic_app.console.print') as mock_print:
+        renderer.start()
+        renderer.submit("first")
+        renderer.submit("second")
+        assert mock_print.call_count == 0
+        await asyncio.sleep(0.05)
+        assert mock_print.call_args_list == [call("first", style=None), call("second", style=None)]
+        renderer.submit("last")
+        await renderer.stop()
+        assert mock_print.call_args_list[-1] == call("last", style=None)
+    assert renderer.task is None
+
+# Test the jsonl records of the headless output
+def test_event_log_jsonl():
+    import io
+    from basic_app import EventLog
+    stream = io.BytesIO()
+    log = EventLog("jsonl", stream)
+    conversation = Conversation("thread-jsonl", render=False)
+    conversation.observer = log.observe(conversation)
+    conversation.add_message("user", "Hello")
+    conversation.notify("reaction", "done")
+    log.line("System", "Waiting for assistant to respond...")
+    log.line("Reaction", "'✅' added to your last message.")  # Already recorded by the observer
+    log.text("")
+    assert stream.getvalue() == b""  # Buffered until flushed
+    log.close()
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [(r["thread_id"], r["type"]) for r in records[:2]] == [("thread-jsonl", "message"), ("thread-jsonl", "reaction")]
+    assert records[0]["role"] == "user" and records[0]["text"] == "Hello"
+    assert records[1]["reaction"] == "done"
+    assert records[2]["type"] == "system" and records[2]["text"] == "Waiting for assistant to respond..."
+    assert len(records) == 3
+    assert records[0]["t"] <= records[1]["t"] <= records[2]["t"]
+    conversation.close()
+
+# Test that a headless run reads stdin and writes plain lines without the prompt
+@pytest.mark.asyncio
+async def test_main_plain_output_reads_stdin():
+    import io
+    stream = io.BytesIO()
+    with patch('basic_app.start_callback_server', AsyncMock(return_value=AsyncMock())), \
+         patch('basic_app.sys.stdout', MagicMock(buffer=stream)), \
+         patch('basic_app.sys.stdin', io.StringIO("/unknown\n")), \
+         patch('basic_app.PromptSession') as mock_prompt_session, \
+         patch('basic_app.console.print') as mock_console_print:
+        await main(show_internal_messages_arg=False, prompt_name=None, output="plain")
+    mock_prompt_session.assert_not_called()
+    mock_console_print.assert_not_called()
+    lines = stream.getvalue().decode().splitlines()
+    assert lines[0].endswith("[System] Welcome to the Assistant CLI!")
+    assert lines[-2].endswith("[Error] Unknown command.")
+    assert lines[-1].endswith("[System] Exiting.")  # End of input
+    import basic_app
+    assert basic_app.event_log is None
+
+# Test that a turn finishing in a background thread is reported as a notification
+@pytest.mark.asyncio
+async def test_new_thread_and_background_completion():
+    import basic_app
+    from basic_app import new_conversation, switch_to, finish_turn, dispatch_event
+    first = basic_app.active_conversation
+    timestamp = "background-turn"
+    first.add_message("user", "Question", timestamp)
+    turn = first.expect_done(timestamp)
+    with patch('basic_app.print_with_timestamp') as mock_print:
+        second = new_conversation()
+        try:
+            assert basic_app.active_conversation is second and basic_app.thread_id == second.thread_id
+            assert not first.render and second.render
+            finishing = asyncio.create_task(finish_turn(first, turn))
+            dispatch_event({"event_type": "MESSAGE", "text": "Answer", "thread_id": first.thread_id, "timestamp": timestamp})
+            dispatch_event({"event_type": "REACTION_ADD", "reaction_name": "done", "thread_id": first.thread_id,
+                            "timestamp": timestamp})
+            await finishing
+            notification = mock_print.call_args_list[-1].args
+            assert notification[0] == "System" and notification[1].startswith(f"Thread {first.thread_id}: reply received")
+            assert not any(args.args[0] == "Assistant" for args in mock_print.call_args_list)  # Not shown while in the background
+
+            switch_to("1")
+            assert basic_app.active_conversation is first
+            mock_print.assert_any_call("Assistant", "Answer")
+        finally:
+            basic_app.switch_conversation(first)
+            basic_app.conversations.pop(second.thread_id, None)
+            second.close()
+            first.history.clear()
+
+# Test finding a thread by number, ID or prefix
+def test_find_conversation():
+    import basic_app
+    from basic_app import find_conversation
+    extra = basic_app.register_conversation(Conversation("9999.0001", render=False))
+    try:
+        assert find_conversation(basic_app.active_conversation.thread_id) is basic_app.active_conversation
+        assert find_conversation(str(len(basic_app.conversations))) is extra
+        assert find_conversation("9999") is extra
+        assert find_conversation("no-such-thread") is None
+    finally:
+        basic_app.conversations.pop(extra.thread_id)
+        extra.close()
+
+# Test that attachments are encoded once per content and streamed into a valid payload
+@pytest.mark.asyncio
+async def test_attachments_streamed_payload(tmp_path):
+    import base64
+    from basic_app import AttachmentCache, build_payload, streamed_payload, attachment_field
+    document = tmp_path / "report.pdf"
+    document.write_bytes(bytes(range(256)) * 40)
+    copy = tmp_path / "copy.pdf"
+    copy.write_bytes(document.read_bytes())
+    image = tmp_path / "photo.PNG"
+    image.write_bytes(b"\x89PNG fake")
+
+    cache = AttachmentCache(chunk_size=3 * 100)  # Several blocks per file
+    try:
+        encoded = [(attachment_field(str(path)), cache.encode(str(path))) for path in (document, copy, image)]
+        assert cache.encode(str(document)) == encoded[0][1]
+        assert encoded[1][1] == encoded[0][1]  # Same content under another name
+        assert cache.encodes == 2
+
+        head = build_payload("See attached", "t-1", "1.0", "key-1", tail=b"")
+        body = streamed_payload(head, encoded, chunk_size=3 * 100)
+        for _ in range(2):  # A retry streams the same body again
+            payload = json.loads(b"".join([chunk async for chunk in body()]))
+            assert [base64.b64decode(item) for item in payload["files_content"]] == [document.read_bytes()] * 2
+            assert [base64.b64decode(item) for item in payload["images"]] == [image.read_bytes()]
+            assert payload["text"] == "See attached" and payload["idempotency_key"] == "key-1"
+    finally:
+        cache.close()
+    assert cache.directory is None
+
+# Test that a message with attachments is posted as a streamed body
+@pytest.mark.asyncio
+async def test_call_tested_llm_with_attachment(tmp_path):
+    attachment = tmp_path / "notes.txt"
+    attachment.write_text("hello")
+    posted = []
+    session = MagicMock()
+
+    def post(url, headers=None, data=None, timeout=None):
+        posted.append(data)
+        response = MagicMock(status=202)
+        context = AsyncMock()
+        context.__aenter__.return_value = response
+        return context
+
+    session.post = post
+    assert await call_tested_llm("With file", session=session, attachments=[str(attachment)]) is True
+    payload = json.loads(b"".join([chunk async for chunk in posted[0]]))
+    assert payload["files_content"] == ["aGVsbG8="] and payload["images"] == []
+    assert await call_tested_llm("Missing", session=session, attachments=[str(tmp_path / "nope.txt")]) is False
+    import basic_app
+    basic_app.attachment_cache.close()
+
+# Test that the profiler writes pstats, collapsed stacks and slow callbacks, and uninstalls itself
+@pytest.mark.asyncio
+async def test_profiler_writes_profiles(tmp_path):
+    import pstats
+    from basic_app import Profiler
+    original_run = asyncio.Handle._run
+    profiler = Profiler(str(tmp_path), sample_interval=0.001, slow_callback_ms=20)
+    profiler.start()
+    assert profiler.running
+    asyncio.get_running_loop().call_soon(time.sleep, 0.05)
+    await asyncio.sleep(0.1)
+    summary = profiler.stop()
+    assert not profiler.running and asyncio.Handle._run is original_run
+    pstats_path, collapsed_path, slow_path = summary["files"]
+    assert pstats.Stats(pstats_path).total_calls > 0
+    with open(collapsed_path) as file:
+        assert any(line.startswith("MainThread;") for line in file)
+    with open(slow_path) as file:
+        slow = file.read().splitlines()
+    assert summary["slow_callbacks"] == len(slow) >= 1
+    assert "sleep" in slow[0] and "took 0.0" in slow[0]
+
+# Test the /profile command in a headless run
+@pytest.mark.asyncio
+async def test_main_profile_command(tmp_path):
+    import io
+    from basic_app import Profiler
+    stream = io.BytesIO()
+    with patch('basic_app.start_callback_server', AsyncMock(return_value=AsyncMock())), \
+         patch('basic_app.profiler', Profiler(str(tmp_path))), \
+         patch('basic_app.sys.stdout', MagicMock(buffer=stream)), \
+         patch('basic_app.sys.stdin', io.StringIO("/profile start\n/profile start\n/profile stop\n/profile\n")):
+        await main(show_internal_messages_arg=False, prompt_name=None, output="plain")
+    lines = stream.getvalue().decode().splitlines()
+    assert any(line.endswith("[Error] The profiler is already running.") for line in lines)
+    assert any("[System] Profiled " in line for line in lines)
+    assert any(line.endswith("The profiler is stopped. Usage: /profile start|stop") for line in lines)
+    assert len(list(tmp_path.glob("*.pstats"))) == 1
+
+# Test that a journaled history reopens from its session file, index and records written after it
+def test_session_file_round_trip(tmp_path):
+    from basic_app import SessionFile
+    path = str(tmp_path / "session.gbs")
+    history = MessageStore(window=4)
+    history.append("system", "Be brief.")
+    history.save(SessionFile.create(path, "thread-1", history))
+    for turn in range(5):
+        user_message = history.append("user", f"Question {turn}", f"ts-{turn}")
+        history.add_reaction(user_message, "👀")
+        history.append("assistant_internal", f"Thinking {turn}")
+        history.append("assistant", f"Answer {turn}")
+    history.add_reaction(history.find_user_message("ts-0"), "✅")
+    expected = [message.to_dict() for message in history]
+    history.close()
+
+    restored = MessageStore(window=4)
+    restored.restore(SessionFile.open(path))
+    assert restored.session.thread_id == "thread-1"
+    assert [message.to_dict() for message in restored] == expected
+    assert restored.spilled == 13 and restored.turn_count() == 5
+    assert [message.content for message in restored.turn(1)] == ["Question 1", "Thinking 1", "Answer 1"]
+    assert restored.find_user_message("ts-0").reactions == ("👀", "✅")
+    assert [message.content for message in restored.messages_by_role("assistant", 6)] == ["Answer 2", "Answer 3", "Answer 4"]
+    assert restored.last_user_message().content == "Question 4"
+
+    # Records appended after the last index, then a torn one, as after a crash
+    restored.append("user", "Question 5", "ts-5")
+    restored.flush()
+    with open(path, "ab") as file:
+        file.write(b"\x40\x00\x00\x00\x02torn")
+    reopened = SessionFile.open(path)
+    assert len(reopened) == 17 and reopened.get(16).content == "Question 5"
+    reopened.close()
+    restored.close()
+
+# Test /save and --resume: the resumed session keeps its thread_id and history
+@pytest.mark.asyncio
+async def test_save_and_resume_session(tmp_path):
+    import io
+    import basic_app
+    from basic_app import save_session, load_session, SessionFile
+    path = str(tmp_path / "session.gbs")
+    conversation = basic_app.active_conversation
+    saved_thread_id = conversation.thread_id
+    try:
+        with patch('basic_app.print_with_timestamp') as mock_print:
+            conversation.add_message("user", "Hello", "ts-hello")
+            save_session(path)
+            conversation.add_message("assistant", "Hi there")
+            assert "Saved 1 messages" in mock_print.call_args.args[1]
+            assert load_session(path) is None  # Its thread is already open
+            basic_app.reset_conversation()
+            assert conversation.history.session is None
+
+        stream = io.BytesIO()
+        with patch('basic_app.start_callback_server', AsyncMock(return_value=AsyncMock())), \
+             patch('basic_app.sys.stdout', MagicMock(buffer=stream)), \
+             patch('basic_app.sys.stdin', io.StringIO("/exit\n")):
+            await main(show_internal_messages_arg=False, prompt_name=None, output="plain", resume=path)
+        lines = stream.getvalue().decode().splitlines()
+        assert any(f"Loaded 2 messages of thread {saved_thread_id} from {path}" in line for line in lines)
+        assert basic_app.thread_id == saved_thread_id and basic_app.active_conversation is conversation
+        reopened = SessionFile.open(path)
+        assert [reopened.get(index).content for index in range(len(reopened))] == ["Hello", "Hi there"]
+        reopened.close()
+    finally:
+        basic_app.conversations.pop(conversation.thread_id, None)
+        conversation.reset(basic_app.generate_thread_id())
+        basic_app.register_conversation(conversation)
+        basic_app.thread_id = conversation.thread_id
+
+# Test that /reset with a session attached says the file stops being appended to, and leaves it intact
+def test_reset_with_session_attached(tmp_path):
+    import basic_app
+    from basic_app import save_session, SessionFile
+    path = str(tmp_path / "session.gbs")
+    conversation = basic_app.active_conversation
+    saved_thread_id = conversation.thread_id
+    try:
+        with patch('basic_app.print_with_timestamp') as mock_print, patch('basic_app.console'):
+            conversation.add_message("user", "Hello", "ts-reset")
+            save_session(path)
+            basic_app.reset_conversation()
+            mock_print.assert_called_with("System", f"{path} keeps thread {saved_thread_id} and is no longer "
+                                                    "appended to; /save to journal the new thread.")
+            conversation.add_message("user", "After the reset", "ts-after")
+            assert conversation.history.session is None
+            basic_app.reset_conversation()  # Nothing attached any more: no notice
+            assert mock_print.call_args.args[1].startswith("New thread ID generated")
+        reopened = SessionFile.open(path)
+        assert reopened.thread_id == saved_thread_id
+        assert [reopened.get(index).content for index in range(len(reopened))] == ["Hello"]
+        reopened.close()
+    finally:
+        basic_app.conversations.pop(conversation.thread_id, None)
+        conversation.reset(basic_app.generate_thread_id())
+        basic_app.register_conversation(conversation)
+        basic_app.thread_id = conversation.thread_id
+
+# Test that overlapping comparisons are announced and shown one after the other
+@pytest.mark.asyncio
+async def test_finish_comparison_order():
+    import basic_app
+    from basic_app import Comparison, finish_comparison
+    comparison = Comparison(["http://a", "http://b"])
+    shown = []
+
+    async def fake_play(user_input, attachments):
+        await asyncio.sleep(0.02 if user_input == "One" else 0)
+        return [{"endpoint": f"http://{lane}", "thread_id": lane, "status": "done", "answer": f"Echo: {user_input}",
+                 "time_to_first_token": 0.01, "time_to_done": 0.02, "timeline": {}} for lane in "ab"]
+
+    def submit(text, style=None, low_priority=False):
+        shown.append(text if isinstance(text, str) else type(text).__name__)
+
+    try:
+        with patch.object(comparison, '_play', fake_play), \
+             patch('basic_app.console_renderer.submit', side_effect=submit), \
+             patch('basic_app.print_line'):
+            await asyncio.gather(finish_comparison(comparison, "One"), finish_comparison(comparison, "Two"))
+    finally:
+        for _, lane in comparison.lanes:
+            basic_app.conversations.pop(lane.thread_id, None)
+            lane.close()
+    assert ["Table" if line == "Table" else "Sent" for line in shown] == ["Sent", "Table", "Sent", "Table"]
+    assert "Sent to 2 endpoints" in shown[0]
+
+# Test that an unknown transport is rejected as a bad option instead of failing at startup
+def test_run_rejects_unknown_transport():
+    from typer.testing import CliRunner
+    from basic_app import app
+    with patch('basic_app.main') as mock_main:
+        result = CliRunner().invoke(app, ["run", "--transport", "bogus"])
+    assert result.exit_code == 2
+    assert "transport must be one of: http, websocket" in result.output
+    mock_main.assert_not_called()
@@ -0,0 +1,174 @@
+# tests_loadtest.py
+
+import pytest
+from unittest.mock import patch, AsyncMock
+
+import basic_app
+from basic_app import Conversation
+from loadtest import (
+    LatencyHistogram,
+    LoadTestResults,
+    drive_conversations,
+    load_script,
+    run_conversation,
+    run_sharded_loadtest,
+    shard_plan,
+)
+
+# Test reading a plain text script
+def test_load_script_text(tmp_path):
+    script = tmp_path / "turns.txt"
+    script.write_text("Hello\n\nHow are you?\n", encoding="utf-8")
+    assert load_script(str(script)) == ["Hello", "How are you?"]
+
+# Test reading a JSONL script
+def test_load_script_jsonl(tmp_path):
+    script = tmp_path / "turns.jsonl"
+    script.write_text('{"text": "Hello"}\n{"text": "Bye"}\n', encoding="utf-8")
+    assert load_script(str(script)) == ["Hello", "Bye"]
+
+# Test histogram percentiles and merging
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    for value in range(1, 101):
+        histogram.record(float(value))
+    assert histogram.count == 100
+    # Bucket resolution is about 5%
+    assert 47 <= histogram.percentile(50) <= 53
+    assert 94 <= histogram.percentile(99) <= 100
+    assert histogram.percentile(100) == 100
+
+    other = LatencyHistogram()
+    other.record(1000.0)
+    histogram.merge(other)
+    assert histogram.count == 101
+    assert histogram.max == 1000.0
+    assert sum(count for _, count in histogram.display_counts()) == 101
+
+# Test a conversation that receives 'done' for every turn
+@pytest.mark.asyncio
+async def test_run_conversation_completes():
+    conversation = Conversation("loadtest-2", render=False)
+    results = LoadTestResults()
+
+    async def fake_send(text, session=None, target_thread_id=None, timestamp=None):
+        basic_app.conversations[target_thread_id].resolve_done(timestamp)
+        return True
+
+    with patch('basic_app.call_tested_llm', side_effect=fake_send):
+        await run_conversation(conversation, ["one", "two"], None, results, turn_timeout=1)
+
+    assert results.turns_completed == 2
+    assert results.conversations_completed == 1
+    assert len(results.turn_histograms) == 2
+    assert [msg.content for msg in conversation.history] == ["one", "two"]
+    assert "loadtest-2" not in basic_app.conversations
+
+# Test that a missing 'done' is reported as a timeout
+@pytest.mark.asyncio
+async def test_run_conversation_timeout():
+    results = LoadTestResults()
+    with patch('basic_app.call_tested_llm', AsyncMock(return_value=True)):
+        await run_conversation(Conversation("loadtest-3", render=False), ["one"], None, results, turn_timeout=0.01)
+    assert results.errors == {"timeout": 1}
+    assert results.turns_completed == 0
+
+# Test that every conversation gets its own thread_id
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["closed", "open"])
+async def test_drive_conversations_thread_ids(mode):
+    seen_thread_ids = set()
+
+    async def fake_send(text, session=None, target_thread_id=None, timestamp=None):
+        seen_thread_ids.add(target_thread_id)
+        basic_app.conversations[target_thread_id].resolve_done(timestamp)
+        return True
+
+    results = LoadTestResults()
+    with patch('basic_app.call_tested_llm', side_effect=fake_send):
+        await drive_conversations(["hi"], None, results, conversations=5, mode=mode, concurrency=2,
+                                  rate=1000.0, think_time=0.0, turn_timeout=1, thread_prefix="lt")
+    assert seen_thread_ids == {f"lt-{i}" for i in range(5)}
+    assert results.conversations_completed == 5
+
+# Test that conversations, users and arrival rate are split between workers
+def test_shard_plan():
+    assert shard_plan(3, conversations=10, concurrency=4, rate=6.0) == [(4, 2, 2.0), (3, 1, 2.0), (3, 1, 2.0)]
+    # No idle worker when there are fewer conversations than workers
+    assert shard_plan(4, conversations=2, concurrency=8, rate=1.0) == [(1, 4, 0.5), (1, 4, 0.5)]
+
+# Test merging the results of two workers
+def test_load_test_results_merge():
+    first, second = LoadTestResults(), LoadTestResults()
+    first.record_turn(0, 100.0, 50.0)
+    second.record_turn(0, 200.0, 60.0)
+    second.record_turn(1, 300.0)
+    second.record_error("timeout")
+    second.conversations_completed = 1
+    first.finished_at = first.started_at + 1.0
+    second.finished_at = second.started_at + 3.0
+    first.merge(second)
+    assert first.turns_completed == 3
+    assert [histogram.count for histogram in first.turn_histograms] == [2, 1]
+    assert first.first_token_histograms[0].count == 2
+    assert first.errors == {"timeout": 1}
+    assert first.conversations_completed == 1
+    assert first.duration == pytest.approx(3.0)
+
+    # The coordinator's own start-up time does not count, only the slowest worker's run
+    coordinator = LoadTestResults()
+    coordinator.started_at -= 10.0
+    coordinator.merge(second)
+    assert coordinator.duration == pytest.approx(3.0)
+
+# Test a sharded run: two worker processes, each with its own callback port, against the stub bot
+def test_run_sharded_loadtest(tmp_path):
+    import os
+    import socket
+    import subprocess
+    import sys
+
+    def free_port():
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    script = tmp_path / "turns.txt"
+    script.write_text("Hello\nBye\n", encoding="utf-8")
+    stub_port, callback_port = free_port(), free_port()
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(__file__), "..", "stub_bot.py"), "--port", str(stub_port),
+         "--internal-messages", "0"],
+        stdout=subprocess.PIPE, text=True,
+    )
+    try:
+        stub.stdout.readline()
+        with patch('basic_app.LLM_NOTIFICATION_ENDPOINT', f"http://127.0.0.1:{stub_port}/api/get_generic_rest_notification"), \
+             patch('loadtest.print_report'):
+            results = run_sharded_loadtest(str(script), workers=2, conversations=6, concurrency=2,
+                                           turn_timeout=10, callback_port=callback_port)
+    finally:
+        stub.terminate()
+        stub.wait()
+    assert results.errors == {}
+    assert results.conversations_completed == 6
+    assert results.turns_completed == 12
+    assert [histogram.count for histogram in results.turn_histograms] == [6, 6]
+
+# Test that invalid loadtest options are rejected before anything runs
+@pytest.mark.parametrize("options, message", [
+    (["--mode", "open", "--rate", "0"], "rate must be greater than 0"),
+    (["--concurrency", "0"], "concurrency must be at least 1"),
+    (["--conversations", "-1"], "conversations must be at least 1"),
+    (["--workers", "0"], "workers must be at least 1"),
+])
+def test_loadtest_rejects_invalid_options(tmp_path, options, message):
+    from typer.testing import CliRunner
+    script = tmp_path / "turns.txt"
+    script.write_text("Hello\n", encoding="utf-8")
+    with patch('loadtest.run_loadtest') as mock_run, patch('loadtest.run_sharded_loadtest') as mock_sharded:
+        result = CliRunner().invoke(basic_app.app, ["loadtest", str(script), *options])
+    assert result.exit_code == 2
+    assert message in result.output
+    mock_run.assert_not_called()
+    mock_sharded.assert_not_called()
@@ -0,0 +1,55 @@
+# tests_replay.py
+
+import json
+import pytest
+
+import basic_app
+from replay import iter_transcript, run_replay
+from stub_bot import StubBot, start_stub_bot
+
+# Test reading JSONL transcripts
+def test_iter_transcript(tmp_path):
+    jsonl = tmp_path / "a.jsonl"
+    jsonl.write_text('{"prompt": "helper"}\n\n{"text": "Hello"}\n{"text": "Bye"}\n', encoding="utf-8")
+    assert list(iter_transcript(str(jsonl))) == [{"prompt": "helper"}, {"text": "Hello"}, {"text": "Bye"}]
+
+# Test reading multi-document YAML transcripts, which need the optional PyYAML
+def test_iter_transcript_yaml(tmp_path):
+    pytest.importorskip("yaml")
+    yaml_file = tmp_path / "b.yaml"
+    yaml_file.write_text("Hello\n---\n- text: One\n- Two\n---\nprompt: helper\n", encoding="utf-8")
+    assert list(iter_transcript(str(yaml_file))) == [
+        {"text": "Hello"}, {"text": "One"}, {"text": "Two"}, {"prompt": "helper"}
+    ]
+
+# Test replaying two transcripts in parallel against the stub bot
+@pytest.mark.asyncio
+async def test_run_replay(tmp_path):
+    (tmp_path / "first.jsonl").write_text('{"text": "Hello"}\n{"text": "Again"}\n', encoding="utf-8")
+    (tmp_path / "second.jsonl").write_text('{"text": "Bonjour"}\n', encoding="utf-8")
+    output = tmp_path / "out.jsonl"
+
+    bot = StubBot(internal_messages=1)
+    runner, port = await start_stub_bot(bot)
+    original_transport = basic_app.transport
+    try:
+        basic_app.LLM_WEBSOCKET_ENDPOINT, endpoint = f"ws://127.0.0.1:{port}/ws", basic_app.LLM_WEBSOCKET_ENDPOINT
+        played, failed = await run_replay(
+            [str(tmp_path / "first.jsonl"), str(tmp_path / "second.jsonl")],
+            output=str(output), parallel=2, transport_name="websocket", turn_timeout=5,
+        )
+    finally:
+        basic_app.LLM_WEBSOCKET_ENDPOINT = endpoint
+        basic_app.transport = original_transport
+        await runner.cleanup()
+
+    assert (played, failed) == (3, 0)
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    first = [record for record in records if record["transcript"] == "first.jsonl"]
+    assert [record["type"] for record in first if record["turn"] == 0] == [
+        "user", "reaction", "reaction", "assistant_internal", "assistant", "reaction", "turn"
+    ]
+    assert first[4]["text"] == "Echo: Hello"
+    turns = [record for record in records if record["type"] == "turn"]
+    assert all(record["status"] == "done" and record["time_to_done"] >= 0 for record in turns)
+    assert len({record["thread_id"] for record in turns}) == 2
@@ -0,0 +1,197 @@
+# tests_stub_bot.py
+
+import asyncio
+import pytest
+from aiohttp import web
+from unittest.mock import patch
+
+import basic_app
+from basic_app import Conversation, WebSocketTransport
+from stub_bot import StubBot, StubProfile, build_events, start_stub_bot
+
+# Test the event sequence answering a user message
+def test_build_events():
+    payload = {"thread_id": "t1", "timestamp": "1.0001", "text": "Hi"}
+    events = build_events(payload, internal_messages=1)
+    assert [event["event_type"] for event in events] == [
+        "REACTION_ADD", "REACTION_ADD", "MESSAGE", "MESSAGE", "REACTION_ADD"
+    ]
+    assert events[2]["is_internal"] is True
+    assert events[3]["text"] == "Echo: Hi"
+    assert events[-1]["reaction_name"] == "done"
+    assert all(event["thread_id"] == "t1" and event["timestamp"] == "1.0001" for event in events)
+
+# Test that the HTTP endpoint accepts a message and posts the events to the callback URL
+@pytest.mark.asyncio
+async def test_stub_bot_http_callbacks():
+    received = []
+    all_received = asyncio.Event()
+
+    async def callback(request):
+        received.append(await request.json())
+        if received[-1].get("reaction_name") == "done":
+            all_received.set()
+        return web.json_response({"status": "OK"})
+
+    callback_app = web.Application()
+    callback_app.router.add_post("/api/receive_message", callback)
+    callback_runner = web.AppRunner(callback_app)
+    await callback_runner.setup()
+    callback_site = web.TCPSite(callback_runner, "127.0.0.1", 0)
+    await callback_site.start()
+    callback_port = callback_site._server.sockets[0].getsockname()[1]
+
+    bot = StubBot(f"http://127.0.0.1:{callback_port}/api/receive_message", internal_messages=0)
+    runner, port = await start_stub_bot(bot)
+    try:
+        with patch('basic_app.LLM_NOTIFICATION_ENDPOINT', f"http://127.0.0.1:{port}/api/get_generic_rest_notification"):
+            assert await basic_app.call_tested_llm("Hello", target_thread_id="t2") is True
+        await asyncio.wait_for(all_received.wait(), 5)
+    finally:
+        await runner.cleanup()
+        await callback_runner.cleanup()
+    assert bot.received == 1
+    assert [event.get("reaction_name") for event in received] == ["acknowledge", "processing", None, "done"]
+    assert received[2]["text"] == "Echo: Hello"
+
+# Test a full turn over the WebSocket transport
+@pytest.mark.asyncio
+async def test_websocket_transport_round_trip():
+    bot = StubBot(internal_messages=1)
+    runner, port = await start_stub_bot(bot)
+    basic_app.http_session = basic_app.create_http_session()
+    transport = WebSocketTransport(f"ws://127.0.0.1:{port}/ws")
+    conversation = basic_app.register_conversation(Conversation("ws-thread", render=False))
+    try:
+        await transport.start()
+        with patch('basic_app.transport', transport):
+            timestamp = basic_app.generate_message_timestamp()
+            conversation.add_message("user", "Hello", timestamp)
+            turn = conversation.expect_done(timestamp)
+            assert await basic_app.call_tested_llm("Hello", target_thread_id="ws-thread", timestamp=timestamp)
+            await asyncio.wait_for(turn, 5)
+    finally:
+        await transport.close()
+        await basic_app.close_http_session()
+        await runner.cleanup()
+        basic_app.conversations.pop("ws-thread", None)
+
+    assert [(msg.role, msg.content) for msg in conversation.history] == [
+        ("user", "Hello"), ("assistant_internal", "Internal step 1"), ("assistant", "Echo: Hello")
+    ]
+    assert conversation.history[0].reactions == ("👀", "⚙️", "✅")
+
+# Test that a retried message is answered only once
+@pytest.mark.asyncio
+async def test_stub_bot_drops_duplicates():
+    bot = StubBot("http://127.0.0.1:9/api/receive_message", internal_messages=0, delay=60)
+    runner, port = await start_stub_bot(bot)
+    try:
+        with patch('basic_app.LLM_NOTIFICATION_ENDPOINT', f"http://127.0.0.1:{port}/api/get_generic_rest_notification"):
+            for _ in range(2):
+                assert await basic_app.call_tested_llm("Hello", target_thread_id="t3", timestamp="1.0001") is True
+    finally:
+        await runner.cleanup()
+    assert (bot.received, bot.duplicates) == (1, 1)
+
+# Test the programmable answer: reactions, sizes and streamed chunks
+def test_build_events_profile():
+    payload = {"thread_id": "t1", "timestamp": "1.0001", "text": "Hi"}
+    profile = StubProfile(internal_messages=1, reactions=["acknowledge", "processing", "writing"], internal_size=50,
+                          answer_size=100, stream_chunks=4)
+    events = build_events(payload, profile=profile)
+    assert [event.get("reaction_name") for event in events[:3]] == ["acknowledge", "processing", "writing"]
+    assert len(events[3]["text"]) == 50 and events[3]["is_internal"] is True
+    deltas = [event for event in events if event["event_type"] == "MESSAGE_DELTA"]
+    assert len(deltas) == 4 and len({event["message_id"] for event in deltas}) == 1
+    answer = "".join(event["text"] for event in deltas)
+    assert answer.startswith("Echo: Hi") and len(answer) == 100
+    assert [event["event_type"] for event in events[-2:]] == ["MESSAGE_END", "REACTION_ADD"]
+
+# Test a custom sequence of steps
+def test_build_events_sequence():
+    profile = StubProfile(sequence=[{"reaction": "acknowledge"}, {"delay": 0.5}, {"message": "You said {text}"},
+                                    {"reaction": "done"}])
+    events = build_events({"thread_id": "t1", "timestamp": "1", "text": "Hi"}, profile=profile)
+    assert events[1] == {"delay": 0.5}
+    assert events[2]["text"] == "You said Hi"
+    assert events[-1]["reaction_name"] == "done"
+
+# Test that rejected messages are retried by the client and that dropped ones are never answered
+@pytest.mark.asyncio
+async def test_stub_bot_failures_and_drops():
+    bot = StubBot("http://127.0.0.1:9/api/receive_message", profile=StubProfile(failure_rate=1.0))
+    runner, port = await start_stub_bot(bot)
+    try:
+        with patch('basic_app.LLM_NOTIFICATION_ENDPOINT', f"http://127.0.0.1:{port}/api/get_generic_rest_notification"), \
+             patch('basic_app.SEND_RETRIES', 2), patch('basic_app.RETRY_BACKOFF', 0.001):
+            assert await basic_app.call_tested_llm("Hello", target_thread_id="t4") is False
+            bot.profile.failure_rate = 0.0
+            bot.profile.drop_rate = 1.0
+            assert await basic_app.call_tested_llm("Hello", target_thread_id="t4") is True
+    finally:
+        await runner.cleanup()
+    assert (bot.failed, bot.received, bot.dropped, bot.events_sent) == (3, 1, 1, 0)
+
+# Test that a compared turn goes to every endpoint in its own thread and waits for all of them
+@pytest.mark.asyncio
+async def test_comparison_of_two_endpoints():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        callback_port = sock.getsockname()[1]
+    callback_url = f"http://127.0.0.1:{callback_port}/api/receive_message"
+    fast = StubBot(callback_url, internal_messages=0)
+    slow = StubBot(callback_url, profile=StubProfile(internal_messages=0, delay=0.2, stream_chunks=2))
+    fast_runner, fast_port = await start_stub_bot(fast)
+    slow_runner, slow_port = await start_stub_bot(slow)
+    server = await basic_app.start_callback_server("127.0.0.1", callback_port)
+    basic_app.http_session = basic_app.create_http_session()
+    comparison = basic_app.Comparison([f"http://127.0.0.1:{fast_port}/api/get_generic_rest_notification",
+                                       f"http://127.0.0.1:{slow_port}/api/get_generic_rest_notification"])
+    try:
+        results = await comparison.play("Hello")
+    finally:
+        await basic_app.close_http_session()
+        await server.stop()
+        await fast_runner.cleanup()
+        await slow_runner.cleanup()
+        for _, lane in comparison.lanes:
+            basic_app.conversations.pop(lane.thread_id, None)
+            lane.close()
+    assert [result["status"] for result in results] == ["done", "done"]
+    assert [result["answer"] for result in results] == ["Echo: Hello", "Echo: Hello"]
+    assert results[0]["thread_id"] != results[1]["thread_id"]
+    assert results[0]["time_to_done"] < 0.2 <= results[1]["time_to_done"]
+    assert list(results[1]["timeline"]) == ["acknowledge", "processing", "first_message", "first_token", "done"]
+    assert (fast.received, slow.received) == (1, 1)
+
+# Test that overlapping compared turns each get their own answer
+@pytest.mark.asyncio
+async def test_comparison_of_overlapping_turns():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        callback_port = sock.getsockname()[1]
+    callback_url = f"http://127.0.0.1:{callback_port}/api/receive_message"
+    fast = StubBot(callback_url, internal_messages=0)
+    slow = StubBot(callback_url, profile=StubProfile(internal_messages=0, delay=0.1))
+    fast_runner, fast_port = await start_stub_bot(fast)
+    slow_runner, slow_port = await start_stub_bot(slow)
+    server = await basic_app.start_callback_server("127.0.0.1", callback_port)
+    basic_app.http_session = basic_app.create_http_session()
+    comparison = basic_app.Comparison([f"http://127.0.0.1:{fast_port}/api/get_generic_rest_notification",
+                                       f"http://127.0.0.1:{slow_port}/api/get_generic_rest_notification"])
+    try:
+        first, second = await asyncio.gather(comparison.play("One"), comparison.play("Two"))
+    finally:
+        await basic_app.close_http_session()
+        await server.stop()
+        await fast_runner.cleanup()
+        await slow_runner.cleanup()
+        for _, lane in comparison.lanes:
+            basic_app.conversations.pop(lane.thread_id, None)
+            lane.close()
+    assert [result["answer"] for result in first] == ["Echo: One", "Echo: One"]
+    assert [result["answer"] for result in second] == ["Echo: Two", "Echo: Two"]
+    assert [result["status"] for result in first + second] == ["done"] * 4